@@ -4,6 +4,15 @@ const N_FEATURES = 16; // 6 base features + 10 text embeddings
 const N_ESTIMATORS = 8; // Number of forward passes in TabPFN
 const MAX_CELLS_PER_REQUEST = 100000; // API size limitation
 const BATCH_SIZE = Math.min(100, Math.floor(MAX_CELLS_PER_REQUEST / (N_FEATURES * N_ESTIMATORS))); // Optimal batch size
+const MAX_PARALLEL_BATCHES = 8; // Upper bound on batches sent at once with UrlFetchApp.fetchAll
+const MAX_BATCH_RETRIES = 2; // Retries for batches that failed with a retryable error
+const RETRY_DELAY_MS = 2000; // Base delay before retrying failed batches (doubled on each retry)
+const FLUSH_EVERY_N_BATCHES = 0; // Write buffered results to the sheet every N batches (0 = once at the end)
+const GZIP_REQUESTS = true; // Send request bodies gzip-compressed (transaction strings compress ~6x)
+const DEBUG_JSON = false; // Save each request/response to the JSON sheet (slow, for debugging only)
+
+// Prediction columns, in the order they are kept in the output buffer
+const OUTPUT_COLUMNS = ['categoryCol', 'confidenceCol', 'errorCol', 'fingerprintCol'];
 
 // Add menu to the spreadsheet
 function onOpen() {
@@ -21,40 +30,63 @@ function predictCategories() {
   
   try {
     // 1. Get and validate sheet data
-    const { transactions, columns } = getSheetData(sheet);
+    const { transactions, columns, output } = getSheetData(sheet);
     if (transactions.length === 0) {
       ui.alert('No transactions found', 'Please make sure you have data in the sheet with required columns: dateOp, transaction_description, amount', ui.ButtonSet.OK);
       return;
     }
     
-    // 2. Process in batches
+    // Check the server-side quota before sending anything; rows that carry a
+    // fingerprint are most likely unchanged and will not be charged
+    const usage = checkAPIStatus();
+    const rowsToPredict = transactions.filter(t => !t.fingerprint).length;
+    const allowedRows = usage ? checkAPILimit(rowsToPredict, usage) : rowsToPredict;
+    if (allowedRows === 0 && rowsToPredict > 0) {
+      return;
+    }
+    // Only send as many new rows as the remaining quota allows
+    const toSend = allowedRows < rowsToPredict ? limitNewRows(transactions, allowedRows) : transactions;
+    
+    // 2. Split into batches sized from the server's advertised limits
+    const limits = fetchServerLimits();
+    const batches = [];
+    for (let i = 0; i < toSend.length; i += limits.batchSize) {
+      batches.push(toSend.slice(i, Math.min(i + limits.batchSize, toSend.length)));
+    }
+    
     let totalProcessed = 0;
     let totalErrors = 0;
+    let totalUnchanged = 0;
     
-    // Process each batch
-    for (let i = 0; i < transactions.length; i += BATCH_SIZE) {
-      const batch = transactions.slice(i, Math.min(i + BATCH_SIZE, transactions.length));
-      const results = processBatch(batch);
+    // Dispatch batches in parallel waves, collecting results in memory
+    let batchCount = 0;
+    processBatches(batches, limits.waveWidth, results => {
+      writeResults(output, results);
+      totalProcessed += results.processed;
+      totalErrors += results.errors;
+      totalUnchanged += results.unchanged;
       
-      if (results) {
-        // Write results to sheet
-        writeResults(sheet, results, columns);
-        totalProcessed += results.processed;
-        totalErrors += results.errors;
+      batchCount++;
+      if (FLUSH_EVERY_N_BATCHES > 0 && batchCount % FLUSH_EVERY_N_BATCHES === 0) {
+        flushResults(sheet, output, columns);
       }
-    }
+    });
+    
+    // Write all buffered results to the sheet
+    flushResults(sheet, output, columns);
     
-    // 3. Clear existing predictions and apply formatting
-    clearExistingPredictions(sheet, columns);
+    // 3. Apply formatting (rows the server reported unchanged keep their prediction)
     applyFormatting(sheet, columns);
     
     // 4. Show summary
     ui.alert(
       'Processing Complete',
-      `Total transactions: ${transactions.length}\n` +
+      `Total transactions: ${transactions.length}` +
+      (toSend.length < transactions.length ? ` (${transactions.length - toSend.length} left for when the quota resets)` : '') + '\n' +
       `Successfully processed: ${totalProcessed}\n` +
+      `Unchanged (skipped): ${totalUnchanged}\n` +
       `Errors: ${totalErrors}\n\n` +
-      `Batch size used: ${BATCH_SIZE} transactions`,
+      `Batch size used: ${limits.batchSize} transactions (${limits.waveWidth} in parallel)`,
       ui.ButtonSet.OK
     );
     
@@ -77,7 +109,8 @@ function getSheetData(sheet) {
     amountCol: headers.indexOf('amount'),
     categoryCol: headers.indexOf('predicted_category'),
     confidenceCol: headers.indexOf('confidence'),
-    errorCol: headers.indexOf('error')
+    errorCol: headers.indexOf('error'),
+    fingerprintCol: headers.indexOf('fingerprint')
   };
   
   // Validate required columns
@@ -98,6 +131,10 @@ function getSheetData(sheet) {
     columns.errorCol = columns.confidenceCol + 1;
     sheet.getRange(1, columns.errorCol + 1).setValue('error');
   }
+  if (columns.fingerprintCol === -1) {
+    columns.fingerprintCol = columns.errorCol + 1;
+    sheet.getRange(1, columns.fingerprintCol + 1).setValue('fingerprint');
+  }
   
   // Prepare transactions data
   const transactions = [];
@@ -122,82 +159,197 @@ function getSheetData(sheet) {
       amount = parseFloat(amount.replace(',', '.'));
     }
     
-    transactions.push({
+    const transaction = {
       id: i,
       dateOp: date.toISOString(),
       transaction_description: String(row[columns.descCol]),
       amount: Number(amount)
-    });
+    };
+    
+    // Send back the fingerprint of the last prediction so the server can skip
+    // rows whose content and model version have not changed
+    if (row[columns.fingerprintCol] && row[columns.categoryCol] && !row[columns.errorCol]) {
+      transaction.fingerprint = String(row[columns.fingerprintCol]);
+    }
+    
+    transactions.push(transaction);
   }
   
-  return { transactions, columns };
+  // Buffer the current prediction columns so results can be written back in bulk
+  const output = {
+    rows: values.slice(1).map(row => OUTPUT_COLUMNS.map(col => {
+      const value = row[columns[col]];
+      return value === undefined ? '' : value;
+    })),
+    dirty: false
+  };
+  
+  return { transactions, columns, output };
 }
 
-// Process a batch of transactions
-function processBatch(transactions) {
+// Get batch limits advertised by the cloud function, falling back to local defaults
+function fetchServerLimits() {
+  const defaults = { batchSize: BATCH_SIZE, waveWidth: 1 };
   try {
-    // Prepare request payload
-    const payload = JSON.stringify({ transactions: transactions });
-    
-    // Call cloud function
-    const response = UrlFetchApp.fetch(CLOUD_FUNCTION_URL, {
-      method: 'post',
-      contentType: 'application/json',
-      payload: payload,
+    const response = UrlFetchApp.fetch(CLOUD_FUNCTION_URL + '/limits', {
+      method: 'get',
       muteHttpExceptions: true
     });
+    if (response.getResponseCode() !== 200) {
+      return defaults;
+    }
     
-    // Get response text and save it to JSON sheet
+    const limits = JSON.parse(response.getContentText()).limits;
+    const cellsPerRow = limits.n_features * limits.n_estimators;
+    return {
+      batchSize: Math.max(1, Math.min(limits.max_batch_rows, Math.floor(limits.max_cells_per_request / cellsPerRow))),
+      waveWidth: Math.max(1, Math.min(limits.max_concurrent_batches, MAX_PARALLEL_BATCHES))
+    };
+  } catch (error) {
+    console.error('Error fetching server limits:', error);
+    return defaults;
+  }
+}
+
+// Identify this spreadsheet to the cloud function, which meters usage per caller:
+// the caller key issued by the function's operator (CALLER_KEYS), kept in the
+// script properties under CALLER_KEY
+function callerHeaders() {
+  const key = PropertiesService.getScriptProperties().getProperty('CALLER_KEY');
+  return key ? { 'X-Caller-Key': key } : {};
+}
+
+// Build the UrlFetchApp request for a batch of transactions
+function buildBatchRequest(transactions) {
+  const headers = callerHeaders();
+  let payload = JSON.stringify({ transactions: transactions });
+  
+  if (GZIP_REQUESTS) {
+    payload = Utilities.gzip(Utilities.newBlob(payload, 'application/json')).getBytes();
+    headers['Content-Encoding'] = 'gzip';
+  }
+  
+  return {
+    url: CLOUD_FUNCTION_URL,
+    method: 'post',
+    contentType: 'application/json',
+    headers: headers,
+    payload: payload,
+    muteHttpExceptions: true
+  };
+}
+
+// Send batches in waves of at most waveWidth concurrent requests, retrying
+// failed batches, and pass each batch's parsed results to onResults
+function processBatches(batches, waveWidth, onResults) {
+  let pending = batches;
+  
+  for (let attempt = 0; attempt <= MAX_BATCH_RETRIES && pending.length > 0; attempt++) {
+    if (attempt > 0) {
+      Utilities.sleep(RETRY_DELAY_MS * Math.pow(2, attempt - 1));
+    }
+    
+    const failed = [];
+    for (let i = 0; i < pending.length; i += waveWidth) {
+      const wave = pending.slice(i, i + waveWidth);
+      const requests = wave.map(buildBatchRequest);
+      
+      let responses;
+      try {
+        responses = UrlFetchApp.fetchAll(requests);
+      } catch (error) {
+        // A transport failure aborts the whole wave
+        console.error('Error sending batch wave:', error);
+        responses = wave.map(() => null);
+      }
+      
+      wave.forEach((batch, index) => {
+        const results = parseBatchResponse(batch, responses[index]);
+        if (results.retryable && attempt < MAX_BATCH_RETRIES) {
+          failed.push(batch);
+        } else {
+          onResults(results);
+        }
+      });
+    }
+    pending = failed;
+  }
+}
+
+// Parse the response for a batch of transactions (null response = transport failure)
+function parseBatchResponse(transactions, response) {
+  const failure = (message, retryable) => ({
+    processed: 0,
+    errors: transactions.length,
+    unchanged: 0,
+    retryable: retryable,
+    errorMessage: message,
+    results: new Map(),
+    errorMap: new Map(transactions.map(t => [t.id.toString(), { error: message }]))
+  });
+  
+  if (response === null) {
+    return failure('Request failed', true);
+  }
+  
+  try {
+    const statusCode = response.getResponseCode();
+    
+    // Get response text and save it to JSON sheet when debugging
     const responseText = response.getContentText();
-    saveJsonResponse(payload, responseText);
+    if (DEBUG_JSON) {
+      // The request was sent gzip-compressed when GZIP_REQUESTS is on, so log
+      // the JSON it was built from rather than the bytes on the wire
+      saveJsonResponse(JSON.stringify({ transactions: transactions }), responseText);
+    }
     
     // Parse response
     const responseData = JSON.parse(responseText);
+    const unchangedIds = Array.isArray(responseData.unchanged) ? responseData.unchanged : [];
+    
+    // The predictor's own response (results, errors, totals) is nested under "results"
+    const predictions = (responseData.results && !Array.isArray(responseData.results))
+      ? responseData.results
+      : responseData;
     
     // Handle errors
     if (responseData.error) {
       console.error('API Error:', responseData);
-      return {
-        processed: 0,
-        errors: transactions.length,
-        errorMessage: responseData.message || 'Unknown API error',
-        results: [],
-        errorMap: new Map(transactions.map(t => [t.id.toString(), { error: responseData.message }]))
-      };
+      // An exhausted daily quota will not recover within the retry window
+      const retryable = statusCode >= 500 || (statusCode === 429 && responseData.error !== 'QUOTA_EXCEEDED');
+      return failure(responseData.message || responseData.error || 'Unknown API error', retryable);
     }
     
     // Process results
     const resultMap = new Map();
     const errorMap = new Map();
     
-    if (Array.isArray(responseData.results)) {
-      responseData.results.forEach(result => {
+    if (Array.isArray(predictions.results)) {
+      predictions.results.forEach(result => {
         resultMap.set(result.transaction_id.toString(), result);
       });
     }
     
-    if (Array.isArray(responseData.errors)) {
-      responseData.errors.forEach(error => {
-        errorMap.set(error.transaction_id.toString(), error);
+    if (Array.isArray(predictions.errors)) {
+      predictions.errors.forEach(error => {
+        if (error.transaction_id !== undefined) {
+          errorMap.set(error.transaction_id.toString(), error);
+        }
       });
     }
     
     return {
-      processed: responseData.total_processed || 0,
-      errors: responseData.total_errors || 0,
+      processed: predictions.total_processed || 0,
+      errors: predictions.total_errors || 0,
+      unchanged: unchangedIds.length,
+      retryable: false,
       results: resultMap,
       errorMap: errorMap
     };
     
   } catch (error) {
     console.error('Error processing batch:', error);
-    return {
-      processed: 0,
-      errors: transactions.length,
-      errorMessage: error.toString(),
-      results: [],
-      errorMap: new Map(transactions.map(t => [t.id.toString(), { error: error.toString() }]))
-    };
+    return failure(error.toString(), true);
   }
 }
 
@@ -227,31 +379,44 @@ function saveJsonResponse(requestPayload, responseText) {
   jsonSheet.autoResizeColumn(1);
 }
 
-// Write results to sheet
-function writeResults(sheet, results, columns) {
+// Write results to the in-memory output buffer (transaction ids are data row indices)
+function writeResults(output, results) {
   results.results.forEach((result, transactionId) => {
-    const row = parseInt(transactionId) + 1;
-    sheet.getRange(row, columns.categoryCol + 1).setValue(result.predicted_category);
-    sheet.getRange(row, columns.confidenceCol + 1).setValue(result.confidence);
-    sheet.getRange(row, columns.errorCol + 1).setValue('');
+    const row = parseInt(transactionId) - 1;
+    output.rows[row] = [result.predicted_category, result.confidence, '', result.fingerprint || ''];
+    output.dirty = true;
   });
   
   results.errorMap.forEach((error, transactionId) => {
-    const row = parseInt(transactionId) + 1;
-    sheet.getRange(row, columns.categoryCol + 1).setValue('');
-    sheet.getRange(row, columns.confidenceCol + 1).setValue('');
-    sheet.getRange(row, columns.errorCol + 1).setValue(error.error || error.message || 'Unknown error');
+    const row = parseInt(transactionId) - 1;
+    output.rows[row] = ['', '', error.error || error.message || 'Unknown error', ''];
+    output.dirty = true;
   });
 }
 
-// Clear existing predictions
-function clearExistingPredictions(sheet, columns) {
-  const numRows = sheet.getLastRow() - 1;
-  if (numRows > 0) {
-    sheet.getRange(2, columns.categoryCol + 1, numRows, 1).clearContent();
-    sheet.getRange(2, columns.confidenceCol + 1, numRows, 1).clearContent();
-    sheet.getRange(2, columns.errorCol + 1, numRows, 1).clearContent();
-  }
+// Write the output buffer to the sheet with one setValues per block of adjacent columns
+function flushResults(sheet, output, columns) {
+  if (!output.dirty || output.rows.length === 0) return;
+  
+  // Group prediction columns that sit next to each other in the sheet
+  const order = OUTPUT_COLUMNS
+    .map((col, index) => ({ sheetCol: columns[col], index: index }))
+    .sort((a, b) => a.sheetCol - b.sheetCol);
+  const blocks = [];
+  order.forEach(entry => {
+    const last = blocks[blocks.length - 1];
+    if (last && entry.sheetCol === last.startCol + last.indices.length) {
+      last.indices.push(entry.index);
+    } else {
+      blocks.push({ startCol: entry.sheetCol, indices: [entry.index] });
+    }
+  });
+  
+  blocks.forEach(block => {
+    const values = output.rows.map(row => block.indices.map(index => row[index]));
+    sheet.getRange(2, block.startCol + 1, values.length, block.indices.length).setValues(values);
+  });
+  output.dirty = false;
 }
 
 // Apply conditional formatting
@@ -299,30 +464,23 @@ function applyFormatting(sheet, columns) {
 // Check API status and limits
 function checkAPIStatus() {
   try {
-    const response = UrlFetchApp.fetch(CLOUD_FUNCTION_URL, {
-      method: 'post',
-      contentType: 'application/json',
-      payload: JSON.stringify({ 
-        transactions: [{
-          id: 1,
-          dateOp: new Date().toISOString(),
-          transaction_description: "test",
-          amount: 0
-        }] 
-      }),
+    // The usage endpoint reports the caller's quota without running a prediction
+    const response = UrlFetchApp.fetch(CLOUD_FUNCTION_URL + '/usage', {
+      method: 'get',
+      headers: callerHeaders(),
       muteHttpExceptions: true
     });
     
-    const headers = response.getAllHeaders();
-    
-    // Set reset time to midnight UTC
-    const resetTime = new Date();
-    resetTime.setUTCHours(24, 0, 0, 0);  // This will set it to next day midnight UTC
+    if (response.getResponseCode() !== 200) {
+      console.error('Error checking API status:', response.getContentText());
+      return null;
+    }
     
+    const usage = JSON.parse(response.getContentText()).usage;
     return {
-      limit: parseInt(headers['X-RateLimit-Limit'] || '5000000'),
-      remaining: parseInt(headers['X-RateLimit-Remaining'] || '0'),
-      resetTime: resetTime
+      limit: usage.limit,
+      remaining: usage.remaining,
+      resetTime: new Date(usage.reset * 1000)
     };
   } catch (error) {
     console.error('Error checking API status:', error);
@@ -330,7 +488,8 @@ function checkAPIStatus() {
   }
 }
 
-// Check if we can process the requested number of transactions
+// Number of the requested transactions that may be processed within the quota
+// (all of them, the available capacity if the user agrees, or 0)
 function checkAPILimit(numTransactions, apiUsage) {
   const ui = SpreadsheetApp.getUi();
   const cellsNeeded = numTransactions * N_FEATURES * N_ESTIMATORS;
@@ -343,7 +502,7 @@ function checkAPILimit(numTransactions, apiUsage) {
       timeZone: 'UTC'
     });
     
-    ui.alert(
+    const answer = ui.alert(
       'API Limit Warning',
       `Not enough capacity to process ${numTransactions} transactions.\n\n` +
       `Available capacity: ${remainingTransactions} transactions\n` +
@@ -352,12 +511,23 @@ function checkAPILimit(numTransactions, apiUsage) {
       remainingTransactions > 0 ? ui.ButtonSet.YES_NO : ui.ButtonSet.OK
     );
     
-    if (remainingTransactions > 0) {
-      return ui.getResponseText() === 'YES';
+    if (remainingTransactions > 0 && answer === ui.Button.YES) {
+      return remainingTransactions;
     }
-    return false;
+    return 0;
   }
-  return true;
+  return numTransactions;
+}
+
+// Keep every fingerprinted row (not charged when unchanged) and the first
+// ``maxNewRows`` rows that need a prediction
+function limitNewRows(transactions, maxNewRows) {
+  let newRows = 0;
+  return transactions.filter(t => {
+    if (t.fingerprint) return true;
+    newRows++;
+    return newRows <= maxNewRows;
+  });
 }
 
 // Show current API usage
@@ -0,0 +1,190 @@
+import math
+import time
+import logging
+import threading
+import itertools
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, n_rows, small, seq):
+        self.n_rows = n_rows
+        self.small = small
+        self.seq = seq
+
+    @property
+    def priority(self):
+        # Small interactive requests first, then arrival order
+        return (not self.small, self.seq)
+
+
+class _Ticket:
+    """Context manager releasing an admitted request's rows."""
+
+    def __init__(self, controller, n_rows):
+        self.controller = controller
+        self.n_rows = n_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.controller._release(self.n_rows)
+
+
+class AdmissionController:
+    """Bound the rows being processed at once and shed excess load.
+
+    Requests are admitted while the rows in flight stay under
+    ``max_inflight_rows``. Large requests (more than ``small_request_rows``)
+    may only use ``large_request_share`` of that capacity so that small
+    interactive requests always find room. Requests that do not fit wait in
+    a priority queue (small first) for up to ``max_wait_s``; when the queue
+    holds more than ``max_queue_rows`` or the wait times out they are
+    rejected with a Retry-After computed from recent throughput.
+    """
+
+    def __init__(self, max_inflight_rows=5000, max_queue_rows=20000, max_wait_s=10.0,
+                 small_request_rows=200, large_request_share=0.75, cells_per_row=1,
+                 throughput_window_s=30.0):
+        self.max_inflight_rows = max_inflight_rows
+        self.max_queue_rows = max_queue_rows
+        self.max_wait_s = max_wait_s
+        self.small_request_rows = small_request_rows
+        self.large_request_share = large_request_share
+        self.cells_per_row = cells_per_row
+        self.throughput_window_s = throughput_window_s
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiters = []
+        self._inflight_rows = 0
+        self._inflight_requests = 0
+        self._completions = deque()
+
+        self.admitted = 0
+        self.rejected = 0
+
+    def admit(self, n_rows):
+        """Admit a request of ``n_rows`` rows, waiting if needed.
+
+        Returns:
+            A context manager to hold while the request is processed.
+
+        Raises:
+            AdmissionRejected: If the request is shed.
+        """
+        waiter = _Waiter(n_rows, n_rows <= self.small_request_rows, next(self._seq))
+        deadline = time.monotonic() + self.max_wait_s
+
+        with self._cond:
+            self._waiters.append(waiter)
+            if not (self._is_next(waiter) and self._fits(waiter)):
+                # Only requests that would actually wait count against the queue bound
+                if self._queued_rows() > self.max_queue_rows:
+                    self._waiters.remove(waiter)
+                    self._reject(waiter, "Admission queue full", 'queue_full')
+
+                while not (self._is_next(waiter) and self._fits(waiter)):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiters.remove(waiter)
+                        self._cond.notify_all()
+                        self._reject(waiter, "Timed out waiting for capacity", 'timed_out')
+                    self._cond.wait(remaining)
+
+            self._waiters.remove(waiter)
+            ticket = self._start(waiter)
+            # Let the next waiter re-check now that the queue changed
+            self._cond.notify_all()
+            return ticket
+
+    def stats(self):
+        """Current load, for metrics and the /limits endpoint."""
+        with self._cond:
+            return {
+                'queue_depth': len(self._waiters),
+                'queued_rows': self._queued_rows(),
+                'inflight_requests': self._inflight_requests,
+                'inflight_rows': self._inflight_rows,
+                'inflight_cells': self._inflight_rows * self.cells_per_row,
+                'throughput_rows_per_s': round(self._throughput(), 1),
+                'admitted': self.admitted,
+                'rejected': self.rejected
+            }
+
+    def _fits(self, waiter):
+        if self._inflight_rows == 0:
+            # Always let a request through on an idle instance, even one
+            # larger than the whole capacity
+            return True
+        capacity = self.max_inflight_rows
+        if not waiter.small:
+            capacity = int(capacity * self.large_request_share)
+        return self._inflight_rows + waiter.n_rows <= capacity
+
+    def _is_next(self, waiter):
+        """Whether no higher-priority waiter that could run is ahead of us."""
+        for other in sorted(self._waiters, key=lambda w: w.priority):
+            if other is waiter:
+                return True
+            if self._fits(other):
+                return False
+        return True
+
+    def publish_metrics(self):
+        """Report this controller's queue and in-flight rows through the metrics registry."""
+        metrics.ADMISSION_QUEUE_DEPTH.set_function(lambda: self.stats()['queue_depth'])
+        metrics.ADMISSION_QUEUED_ROWS.set_function(lambda: self.stats()['queued_rows'])
+        metrics.ADMISSION_INFLIGHT_ROWS.set_function(lambda: self.stats()['inflight_rows'])
+
+    def _start(self, waiter):
+        self._inflight_rows += waiter.n_rows
+        self._inflight_requests += 1
+        self.admitted += 1
+        metrics.ADMISSION_DECISIONS.inc(result='admitted')
+        return _Ticket(self, waiter.n_rows)
+
+    def _release(self, n_rows):
+        with self._cond:
+            self._inflight_rows -= n_rows
+            self._inflight_requests -= 1
+            self._completions.append((time.monotonic(), n_rows))
+            self._cond.notify_all()
+
+    def _queued_rows(self):
+        return sum(w.n_rows for w in self._waiters)
+
+    def _throughput(self):
+        """Rows per second completed over the recent window."""
+        now = time.monotonic()
+        while self._completions and self._completions[0][0] < now - self.throughput_window_s:
+            self._completions.popleft()
+        if not self._completions:
+            return 0.0
+        elapsed = max(1.0, now - self._completions[0][0])
+        return sum(rows for _, rows in self._completions) / elapsed
+
+    def _reject(self, waiter, reason, result):
+        self.rejected += 1
+        metrics.ADMISSION_DECISIONS.inc(result=result)
+        throughput = self._throughput()
+        backlog = self._inflight_rows + self._queued_rows() + waiter.n_rows
+        if throughput > 0:
+            retry_after = min(60, max(1, math.ceil(backlog / throughput)))
+        else:
+            retry_after = 1
+        logger.warning(f"{reason}: rejecting {waiter.n_rows} rows, retry after {retry_after}s")
+        raise AdmissionRejected(reason, retry_after)
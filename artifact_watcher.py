@@ -0,0 +1,164 @@
+"""
+Hot reload of model artifacts.
+
+ArtifactWatcher polls the generation of the deployed artifacts (GCS object
+generations, or file modification times for a local model directory) from a
+background thread. When they change it builds a new predictor off the
+request path and hands it to ``on_swap``, which publishes it for new
+requests. Requests already running keep the predictor they started with;
+the replaced predictor is cleaned up after a grace period.
+
+A new generation is only loaded once it has been seen on two consecutive
+polls, so a deployment uploading several files is not picked up halfway.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Files whose changes trigger a reload
+ARTIFACT_FILES = ('transformers.pkl', 'surrogate.pkl', 'tabpfn_model.pkl')
+
+
+def _digest(parts):
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:12]
+
+
+class LocalArtifactSource:
+    """Generation of the artifacts in a local directory."""
+
+    def __init__(self, model_dir, files=ARTIFACT_FILES):
+        self.model_dir = model_dir
+        self.files = files
+
+    def generation(self):
+        parts = []
+        for name in self.files:
+            path = os.path.join(self.model_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            parts.append(f'{name}:{stat.st_mtime_ns}:{stat.st_size}')
+        return _digest(parts) if parts else None
+
+
+class GCSArtifactSource:
+    """Generation of the artifacts in a GCS bucket, from object metadata only."""
+
+    def __init__(self, bucket_name, prefix='models/tabpfn-client/', files=ARTIFACT_FILES, client=None):
+        if client is None:
+            from google.cloud import storage
+            client = storage.Client()
+        self.bucket = client.bucket(bucket_name)
+        self.prefix = prefix
+        self.files = files
+
+    def generation(self):
+        parts = []
+        for name in self.files:
+            blob = self.bucket.get_blob(f'{self.prefix}{name}')
+            if blob is not None:
+                parts.append(f'{name}:{blob.generation}')
+        return _digest(parts) if parts else None
+
+
+class ArtifactWatcher:
+    """Reload a predictor when the artifacts it was built from change.
+
+    Args:
+        source: Object whose generation() identifies the deployed artifacts
+        load_fn: Builds a ready predictor for a generation; runs on the
+            watcher thread
+        on_swap: Publishes a new predictor and returns the one it replaced
+        interval_s: Seconds between polls
+        retire_grace_s: Seconds replaced predictors stay alive for requests
+            still using them before they are cleaned up
+    """
+
+    def __init__(self, source, load_fn, on_swap, interval_s=60, retire_grace_s=300, generation=None):
+        self.source = source
+        self.load_fn = load_fn
+        self.on_swap = on_swap
+        self.interval_s = interval_s
+        self.retire_grace_s = retire_grace_s
+
+        self.generation = generation
+        self._candidate = None
+        self._retired = []
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.reloads = 0
+        self.failures = 0
+
+    def start(self):
+        """Start polling on a daemon thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='artifact-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.check()
+
+    def check(self):
+        """Poll once; returns True if a new predictor was swapped in."""
+        self._cleanup_retired()
+        try:
+            generation = self.source.generation()
+        except Exception as e:
+            logger.warning(f"Failed to read artifact generation: {str(e)}")
+            return False
+
+        if generation is None or generation == self.generation:
+            self._candidate = None
+            return False
+
+        # Wait for the generation to settle before loading it
+        if generation != self._candidate:
+            self._candidate = generation
+            return False
+
+        self._candidate = None
+        logger.info(f"Artifacts changed from {self.generation} to {generation}, reloading")
+        try:
+            new_predictor = self.load_fn(generation)
+        except Exception as e:
+            # Keep serving the current version, retry on the next change or restart
+            self.failures += 1
+            self.generation = generation
+            logger.error(f"Failed to load artifacts {generation}, keeping the current predictor: {str(e)}")
+            return False
+
+        old_predictor = self.on_swap(new_predictor)
+        self.generation = generation
+        self.reloads += 1
+        if old_predictor is not None:
+            self._retired.append((time.monotonic() + self.retire_grace_s, old_predictor))
+        logger.info(f"Now serving artifacts {generation}")
+        return True
+
+    def _cleanup_retired(self, force=False):
+        now = time.monotonic()
+        keep = []
+        for deadline, old_predictor in self._retired:
+            if force or deadline <= now:
+                try:
+                    old_predictor.cleanup()
+                except Exception as e:
+                    logger.warning(f"Failed to clean up a replaced predictor: {str(e)}")
+            else:
+                keep.append((deadline, old_predictor))
+        self._retired = keep
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Categorize a large CSV or Parquet file of transactions offline.
+
+Reads the input in chunks, predicts each chunk with TransactionPredictor in
+a pool of worker processes and appends the results, in input order, to an
+output CSV. Progress is checkpointed after every chunk written, so a run
+that crashes or is interrupted resumes where it stopped when started again
+with the same arguments.
+
+Usage:
+    python batch_categorize.py bank_export.csv categorized.csv --chunk-size 5000 --workers 4
+
+The predictor is configured from the same environment variables as the
+Cloud Function (USE_MOCK, USE_GCS, GCS_BUCKET, TABPFN_API_TOKEN, ...).
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from predictor import TransactionPredictor
+
+logger = logging.getLogger(__name__)
+
+RESULT_COLUMNS = ('predicted_category', 'confidence', 'tier')
+
+# Predictor of the current worker process, created by _init_worker
+_worker_predictor = None
+
+
+def read_chunks(path, chunk_size, skip_rows=0):
+    """Yield DataFrames of up to ``chunk_size`` rows from a CSV or Parquet file.
+
+    The first ``skip_rows`` data rows are skipped without being parsed into
+    DataFrames (CSV) or read at all when they fill whole row groups (Parquet).
+    """
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Reading Parquet files requires the pyarrow package")
+        parquet_file = pq.ParquetFile(path)
+        row_groups = []
+        for i in range(parquet_file.num_row_groups):
+            group_rows = parquet_file.metadata.row_group(i).num_rows
+            if skip_rows >= group_rows and not row_groups:
+                skip_rows -= group_rows
+            else:
+                row_groups.append(i)
+        if not row_groups:
+            return
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, row_groups=row_groups):
+            if skip_rows >= batch.num_rows:
+                skip_rows -= batch.num_rows
+                continue
+            yield batch.slice(skip_rows).to_pandas()
+            skip_rows = 0
+    else:
+        # Keep ids and descriptions as read; blank or unparseable amounts
+        # count as 0 rather than failing the whole run
+        for chunk in pd.read_csv(
+            path, chunksize=chunk_size, dtype=str, keep_default_na=False,
+            skiprows=range(1, skip_rows + 1)
+        ):
+            if 'amount' in chunk:
+                chunk['amount'] = pd.to_numeric(chunk['amount'].str.replace(',', '.'), errors='coerce').fillna(0)
+            yield chunk
+
+
+def _init_worker(options):
+    global _worker_predictor
+    logging.basicConfig(level=options['log_level'])
+    _worker_predictor = TransactionPredictor(
+        model_dir=options['model_dir'],
+        use_mock=options['use_mock'],
+        use_gcs=options['use_gcs'],
+        gcs_bucket=options['gcs_bucket']
+    )
+    _worker_predictor.initialize()
+
+
+def _predict_chunk(chunk_index, chunk):
+    """Predict one chunk in a worker and return it with the result columns added."""
+    result = _worker_predictor.predict(chunk.to_dict('records'))
+    if not result.get('success', False):
+        raise RuntimeError(f"Prediction failed for chunk {chunk_index}: {result.get('errors')}")
+
+    results = result['results']
+    output = chunk.copy()
+    for column in RESULT_COLUMNS:
+        output[column] = [r.get(column, '') for r in results]
+    return chunk_index, output
+
+
+class Checkpoint:
+    """Progress of a run: chunks written and the output size after the last one."""
+
+    def __init__(self, path, input_path, chunk_size):
+        self.path = path
+        self.input_path = os.path.abspath(input_path)
+        self.chunk_size = chunk_size
+        self.chunks_done = 0
+        self.rows_done = 0
+        self.output_bytes = 0
+
+    def load(self):
+        """Load a previous run's progress; returns False when starting fresh."""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            state = json.load(f)
+        if state['input_path'] != self.input_path or state['chunk_size'] != self.chunk_size:
+            raise ValueError(
+                f"Checkpoint {self.path} belongs to {state['input_path']} with chunk size "
+                f"{state['chunk_size']}; delete it or use the same arguments"
+            )
+        self.chunks_done = state['chunks_done']
+        self.rows_done = state['rows_done']
+        self.output_bytes = state['output_bytes']
+        return True
+
+    def save(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'input_path': self.input_path,
+                'chunk_size': self.chunk_size,
+                'chunks_done': self.chunks_done,
+                'rows_done': self.rows_done,
+                'output_bytes': self.output_bytes
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.chunks_done = 0
+        self.rows_done = 0
+        self.output_bytes = 0
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def categorize_file(input_path, output_path, chunk_size=5000, workers=4, options=None, checkpoint_path=None):
+    """Categorize ``input_path`` into ``output_path``, resuming from a checkpoint if present.
+
+    Args:
+        options: Predictor configuration passed to every worker
+        workers: Number of worker processes (1 predicts in this process)
+
+    Returns:
+        Dictionary with rows processed, elapsed seconds and rows per second
+    """
+    options = options or predictor_options_from_env()
+    checkpoint = Checkpoint(checkpoint_path or f'{output_path}.checkpoint', input_path, chunk_size)
+
+    resuming = checkpoint.load()
+    output_bytes = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+    if resuming and output_bytes < checkpoint.output_bytes:
+        # The output was deleted or replaced since the checkpoint was written
+        logger.warning(f"{output_path} is missing or shorter than {checkpoint.path} records, starting over")
+        checkpoint.reset()
+        resuming = False
+
+    if resuming:
+        logger.info(f"Resuming after chunk {checkpoint.chunks_done} ({checkpoint.rows_done} rows already written)")
+        # Drop anything written after the last checkpoint (e.g. a half-written chunk)
+        with open(output_path, 'r+b') as f:
+            f.truncate(checkpoint.output_bytes)
+    elif os.path.exists(output_path):
+        os.remove(output_path)
+
+    started = time.perf_counter()
+    rows_at_start = checkpoint.rows_done
+    # Rows already written are skipped by the reader rather than parsed again
+    chunks = read_chunks(input_path, chunk_size, skip_rows=checkpoint.rows_done)
+
+    with open(output_path, 'a', newline='', encoding='utf-8') as output:
+        def write(chunk_output):
+            chunk_output.to_csv(output, header=checkpoint.output_bytes == 0, index=False)
+            output.flush()
+            os.fsync(output.fileno())
+            checkpoint.chunks_done += 1
+            checkpoint.rows_done += len(chunk_output)
+            checkpoint.output_bytes = output.tell()
+            checkpoint.save()
+
+            elapsed = time.perf_counter() - started
+            rate = (checkpoint.rows_done - rows_at_start) / elapsed if elapsed > 0 else 0.0
+            logger.info(f"Chunk {checkpoint.chunks_done}: {checkpoint.rows_done} rows written, {rate:.0f} rows/sec")
+
+        pending_chunks = enumerate(chunks, start=checkpoint.chunks_done)
+        if workers <= 1:
+            _init_worker(options)
+            for index, chunk in pending_chunks:
+                write(_predict_chunk(index, chunk)[1])
+        else:
+            _run_pool(pending_chunks, workers, options, write)
+
+    elapsed = time.perf_counter() - started
+    processed = checkpoint.rows_done - rows_at_start
+    checkpoint.remove()
+
+    summary = {
+        'rows': processed,
+        'total_rows': checkpoint.rows_done,
+        'elapsed_s': round(elapsed, 2),
+        'rows_per_sec': round(processed / elapsed, 1) if elapsed > 0 else 0.0
+    }
+    logger.info(f"Categorized {processed} rows in {summary['elapsed_s']}s ({summary['rows_per_sec']} rows/sec)")
+    return summary
+
+
+def _run_pool(pending_chunks, workers, options, write):
+    """Predict chunks in parallel and write them back in input order."""
+    # Bound the chunks held in memory: a couple per worker in flight
+    max_in_flight = workers * 2
+    futures = {}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(options,)) as pool:
+        for index, chunk in pending_chunks:
+            futures[index] = pool.submit(_predict_chunk, index, chunk)
+            if len(futures) >= max_in_flight:
+                # Dicts keep insertion order, so the first key is the oldest chunk
+                write(futures.pop(next(iter(futures))).result()[1])
+
+        while futures:
+            write(futures.pop(next(iter(futures))).result()[1])
+
+
+def predictor_options_from_env():
+    return {
+        'model_dir': os.getenv('MODEL_PATH', 'models/tabpfn-client'),
+        'use_mock': os.getenv('USE_MOCK', '').lower() == 'true',
+        'use_gcs': os.getenv('USE_GCS', '').lower() == 'true',
+        'gcs_bucket': os.getenv('GCS_BUCKET'),
+        'log_level': logging.WARNING
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Categorize a CSV or Parquet file of transactions")
+    parser.add_argument("input", help="CSV or .parquet file with dateOp, transaction_description and amount columns")
+    parser.add_argument("output", help="CSV file to write the input rows and their predictions to")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows per chunk")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--mock", action="store_true", help="Use the mock predictor")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Per-chunk progress only; the predictor logs every batch at INFO
+    logging.getLogger('predictor').setLevel(logging.WARNING)
+    logging.getLogger('preprocessing').setLevel(logging.WARNING)
+
+    options = predictor_options_from_env()
+    if args.mock:
+        options['use_mock'] = True
+
+    summary = categorize_file(
+        args.input, args.output,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        options=options,
+        checkpoint_path=args.checkpoint
+    )
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Load-test admission control in front of infer_category.
+
+Fires a burst of mixed small (interactive) and large (backfill) requests
+at infer_category in-process, with a predictor whose cost grows with the
+number of rows, and reports latency per request class, shed requests and
+peak queue depth with and without admission limits.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+
+import flask
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+from admission import AdmissionController
+from predictor import TransactionPredictor, CELLS_PER_ROW
+
+
+class SlowPredictor(TransactionPredictor):
+    """Mock predictor sharing a fixed amount of CPU-like capacity between calls."""
+
+    def __init__(self, row_cost_ms):
+        super().__init__(use_mock=True)
+        self.row_cost = row_cost_ms / 1000.0
+        self.capacity = threading.Semaphore(4)
+
+    def predict(self, transactions):
+        with self.capacity:
+            time.sleep(self.row_cost * len(transactions))
+        return super().predict(transactions)
+
+
+def make_transactions(n_rows):
+    return [
+        {
+            'id': i,
+            'dateOp': '2024-01-15',
+            'transaction_description': f'CARTE SNCF {random.random()}',
+            'amount': -12.5
+        }
+        for i in range(n_rows)
+    ]
+
+
+def run(args, controller):
+    app = flask.Flask(__name__)
+    latencies = {'small': [], 'large': []}
+    shed = {'small': 0, 'large': 0}
+    peak_queue = [0]
+    lock = threading.Lock()
+
+    def call(kind):
+        n_rows = args.small_rows if kind == 'small' else args.large_rows
+        payload = {'transactions': make_transactions(n_rows)}
+        started = time.perf_counter()
+        # A fresh client address per request keeps the quota out of the way
+        with app.test_request_context('/infer-category', method='POST', json=payload,
+                                      environ_base={'REMOTE_ADDR': f'10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(256)}'}):
+            _, status_code, _ = main.infer_category(flask.request)
+        elapsed = time.perf_counter() - started
+        with lock:
+            if status_code == 503:
+                shed[kind] += 1
+            else:
+                latencies[kind].append(elapsed)
+            peak_queue[0] = max(peak_queue[0], controller.stats()['queue_depth'])
+
+    kinds = ['large'] * args.large_requests + ['small'] * args.small_requests
+    random.shuffle(kinds)
+
+    with patch('main.admission', controller), patch('main.predictor', SlowPredictor(args.row_cost_ms)):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(call, kinds))
+        elapsed = time.perf_counter() - started
+
+    return latencies, shed, peak_queue[0], elapsed
+
+
+def report(name, latencies, shed, peak_queue, elapsed):
+    print(f"{name}: wall {elapsed:.2f}s, peak queue depth {peak_queue}")
+    for kind in ('small', 'large'):
+        values = np.array(latencies[kind]) * 1000
+        if len(values):
+            print(f"  {kind:5s}: {len(values):4d} ok, {shed[kind]:4d} shed, "
+                  f"p50 {np.percentile(values, 50):7.0f}ms, p95 {np.percentile(values, 95):7.0f}ms")
+        else:
+            print(f"  {kind:5s}:    0 ok, {shed[kind]:4d} shed")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Load-test admission control")
+    parser.add_argument("--small-requests", type=int, default=200)
+    parser.add_argument("--large-requests", type=int, default=20)
+    parser.add_argument("--small-rows", type=int, default=20)
+    parser.add_argument("--large-rows", type=int, default=2000)
+    parser.add_argument("--row-cost-ms", type=float, default=0.2, help="Simulated processing cost per row")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-inflight-rows", type=int, default=5000)
+    parser.add_argument("--max-queue-rows", type=int, default=20000)
+    parser.add_argument("--max-wait-s", type=float, default=2.0)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    main.meter.limit_cells = 10 ** 12
+
+    unlimited = AdmissionController(max_inflight_rows=10 ** 9, max_queue_rows=10 ** 9, cells_per_row=CELLS_PER_ROW)
+    report("no admission control", *run(args, unlimited))
+
+    limited = AdmissionController(
+        max_inflight_rows=args.max_inflight_rows,
+        max_queue_rows=args.max_queue_rows,
+        max_wait_s=args.max_wait_s,
+        small_request_rows=200,
+        cells_per_row=CELLS_PER_ROW
+    )
+    report("admission control", *run(args, limited))
+    print(json.dumps(limited.stats()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark request coalescing against direct predictor calls.
+
+Simulates concurrent Sheets callers sending small batches to a predictor
+whose calls carry a fixed round-trip overhead (like a TabPFN API call),
+and reports throughput with and without the coalescing layer.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from coalescer import RequestCoalescer
+from predictor import TransactionPredictor, CELLS_PER_ROW
+
+
+class SimulatedRemotePredictor:
+    """Mock predictor with a per-call round-trip overhead and per-row cost.
+
+    At most ``concurrency`` calls are in flight at once, like a remote API
+    enforcing a per-token connection limit.
+    """
+
+    def __init__(self, call_overhead_ms, row_cost_ms, concurrency):
+        self.predictor = TransactionPredictor(use_mock=True)
+        self.call_overhead = call_overhead_ms / 1000.0
+        self.row_cost = row_cost_ms / 1000.0
+        self.slots = threading.Semaphore(concurrency)
+        self.calls = 0
+
+    def predict(self, transactions, positions=None):
+        with self.slots:
+            self.calls += 1
+            time.sleep(self.call_overhead + self.row_cost * len(transactions))
+        return self.predictor.predict(transactions)
+
+
+def make_batch(client, request_idx, rows):
+    return [
+        {
+            'id': f'{client}-{request_idx}-{i}',
+            'dateOp': '2024-01-15',
+            'transaction_description': f'CARTE SNCF {client} {request_idx} {i}',
+            'amount': -12.5
+        }
+        for i in range(rows)
+    ]
+
+
+def run(predict_fn, clients, requests_per_client, rows):
+    def client_loop(client):
+        for request_idx in range(requests_per_client):
+            predict_fn(make_batch(client, request_idx, rows))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client_loop, range(clients)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request coalescing")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent callers")
+    parser.add_argument("--requests", type=int, default=10, help="Requests per caller")
+    parser.add_argument("--rows", type=int, default=5, help="Rows per request")
+    parser.add_argument("--call-overhead-ms", type=float, default=40.0, help="Simulated round-trip overhead")
+    parser.add_argument("--row-cost-ms", type=float, default=0.05, help="Simulated per-row cost")
+    parser.add_argument("--backend-concurrency", type=int, default=4, help="Simulated concurrent call limit")
+    parser.add_argument("--max-wait-ms", type=float, nargs='+', default=[2.0, 5.0, 10.0], help="Coalescing windows to try")
+    args = parser.parse_args()
+
+    # Keep per-request predictor logging out of the measurement
+    logging.disable(logging.INFO)
+
+    total_rows = args.clients * args.requests * args.rows
+    print(f"{args.clients} clients x {args.requests} requests x {args.rows} rows = {total_rows} rows")
+
+    backend = SimulatedRemotePredictor(args.call_overhead_ms, args.row_cost_ms, args.backend_concurrency)
+    elapsed = run(backend.predict, args.clients, args.requests, args.rows)
+    print(f"direct         : {total_rows / elapsed:9.0f} rows/s  {backend.calls:5d} backend calls  {elapsed:6.2f}s")
+
+    for max_wait_ms in args.max_wait_ms:
+        backend = SimulatedRemotePredictor(args.call_overhead_ms, args.row_cost_ms, args.backend_concurrency)
+        coalescer = RequestCoalescer(
+            backend,
+            max_wait_ms=max_wait_ms,
+            max_rows=1000,
+            max_cells=100000,
+            cells_per_row=CELLS_PER_ROW
+        )
+        elapsed = run(coalescer.submit, args.clients, args.requests, args.rows)
+        print(f"coalesced {max_wait_ms:4.1f}ms: {total_rows / elapsed:9.0f} rows/s  {backend.calls:5d} backend calls  {elapsed:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
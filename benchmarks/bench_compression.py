@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Bytes on the wire and CPU cost of gzip / zstd bodies per batch size.
+
+For each batch size, builds the JSON request body and the JSON response
+infer_category returns for it, then reports their raw and compressed
+sizes and the CPU time to compress and to decompress them with every
+supported encoding.
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compression import compress, supported_encodings
+from predictor import TransactionPredictor
+from tests.fixtures import make_labeled_transactions
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def decompress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+
+
+def cpu_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.process_time()
+        fn()
+        timings.append(time.process_time() - started)
+    return round(min(timings) * 1000, 2)
+
+
+def measure(raw, repeat):
+    report = {'raw_bytes': len(raw)}
+    for encoding in supported_encodings():
+        compressed = compress(raw, encoding)
+        report[encoding] = {
+            'bytes': len(compressed),
+            'ratio': round(len(raw) / len(compressed), 1),
+            'compress_cpu_ms': cpu_ms(lambda: compress(raw, encoding), repeat),
+            'decompress_cpu_ms': cpu_ms(lambda: decompress(compressed, encoding), repeat)
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gzip / zstd request and response bodies")
+    parser.add_argument("--batch-sizes", type=int, nargs='+', default=[10, 100, 1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    predictor = TransactionPredictor(use_mock=True)
+
+    report = []
+    for n_rows in args.batch_sizes:
+        transactions = make_labeled_transactions(n_rows).drop(columns=['category']).to_dict('records')
+        request_body = json.dumps({'transactions': transactions}).encode('utf-8')
+        response_body = json.dumps({'success': True, 'results': predictor.predict(transactions)}).encode('utf-8')
+        report.append({
+            'rows': n_rows,
+            'request': measure(request_body, args.repeat),
+            'response': measure(response_body, args.repeat)
+        })
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
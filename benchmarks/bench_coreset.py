@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Accuracy versus TabPFN cells consumed for different context selections.
+
+Builds a synthetic labeled history, then for each cell budget selects a
+context with k-center, k-means and uniform random sampling, fits a
+classifier on that context only and scores it on held-out transactions.
+By default the classifier is a 1-nearest-neighbour model, a cheap local
+stand-in for an in-context learner; pass --classifier tabpfn (with
+TABPFN_API_TOKEN set) to score with the TabPFN API itself.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+from sklearn.neighbors import KNeighborsClassifier
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from coreset import context_rows_for_budget, select_context
+from predictor import CELLS_PER_ROW
+from preprocessing import preprocess_data
+from tests.fixtures import make_labeled_transactions, fit_transformers
+
+
+def make_classifier(name):
+    if name == 'tabpfn':
+        from tabpfn_client import TabPFNClassifier
+        return TabPFNClassifier()
+    return KNeighborsClassifier(n_neighbors=1)
+
+
+def run(args):
+    history = make_labeled_transactions(args.history_rows, seed=0)
+    holdout = make_labeled_transactions(args.holdout_rows, seed=1)
+    transformers = fit_transformers(history)
+    features = preprocess_data(history, transformers=transformers, is_training=True).to_numpy()
+    labels = history['category'].to_numpy()
+    holdout_features = preprocess_data(holdout, transformers=transformers, is_training=True).to_numpy()
+    holdout_labels = holdout['category'].to_numpy()
+    rng = np.random.default_rng(0)
+
+    report = []
+    for budget in args.budgets:
+        n_rows = context_rows_for_budget(budget, args.holdout_rows)
+        if n_rows == 0:
+            continue
+        for method in ('kcenter', 'kmeans', 'random'):
+            started = time.perf_counter()
+            if method == 'random':
+                positions = np.sort(rng.choice(len(labels), size=min(n_rows, len(labels)), replace=False))
+            else:
+                positions = select_context(features, labels, n_rows, method=method)
+            selection_s = time.perf_counter() - started
+
+            classifier = make_classifier(args.classifier).fit(features[positions], labels[positions])
+            accuracy = float((classifier.predict(holdout_features) == holdout_labels).mean())
+            report.append({
+                'cell_budget': budget,
+                'context_rows': len(positions),
+                'cells': (len(positions) + args.holdout_rows) * CELLS_PER_ROW,
+                'method': method,
+                'accuracy': round(accuracy, 4),
+                'selection_ms': round(selection_s * 1000, 1)
+            })
+
+    full = make_classifier(args.classifier).fit(features, labels)
+    baseline = {
+        'context_rows': len(labels),
+        'cells': (len(labels) + args.holdout_rows) * CELLS_PER_ROW,
+        'accuracy': round(float((full.predict(holdout_features) == holdout_labels).mean()), 4)
+    }
+    return {'full_history': baseline, 'budgets': report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark context selection: accuracy vs cells")
+    parser.add_argument("--history-rows", type=int, default=5000)
+    parser.add_argument("--holdout-rows", type=int, default=500)
+    parser.add_argument("--budgets", type=int, nargs='+', default=[80000, 100000, 150000, 250000, 500000])
+    parser.add_argument("--classifier", choices=['knn', 'tabpfn'], default='knn')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
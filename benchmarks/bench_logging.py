@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Overhead of hot-path logging at 10k rows, before and after the overhaul.
+
+Times the legacy statements predict used to run on every call (rendering
+the whole input DataFrame into an f-string at INFO) against the sampled,
+row-capped log_payload that replaced them, through a real handler writing
+to /dev/null, and puts both next to the time of predict itself.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from log_utils import DataFramePreview, JsonFormatter, log_payload, request_context
+from predictor import TransactionPredictor
+from tests.fixtures import make_labeled_transactions
+
+
+def best_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return round(min(timings) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hot-path logging overhead")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    devnull = open(os.devnull, 'w')
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(logging.INFO)
+    logger = logging.getLogger('bench_logging')
+
+    df = make_labeled_transactions(args.rows).drop(columns=['category'])
+    transactions = df.to_dict('records')
+
+    def legacy():
+        logger.info(f"Input DataFrame:\n{df}")
+
+    def sampled_out():
+        with request_context('bench', sampled=False):
+            log_payload(logger, "Input DataFrame", df)
+
+    def sampled_in():
+        with request_context('bench', sampled=True):
+            log_payload(logger, "Input DataFrame", df)
+
+    with patch('predictor._ensure_tabpfn_client'), patch.dict(os.environ, {'TABPFN_API_TOKEN': 'benchmark-token'}):
+        predictor = TransactionPredictor(model_dir=os.devnull)
+
+    def predict():
+        with request_context('bench', sampled=False):
+            predictor.predict(transactions)
+
+    report = {
+        'rows': args.rows,
+        'predict_ms': best_ms(predict, args.repeat),
+        'legacy_dataframe_log_ms': best_ms(legacy, args.repeat),
+        'payload_log_sampled_out_ms': best_ms(sampled_out, args.repeat),
+        'payload_log_sampled_in_ms': best_ms(sampled_in, args.repeat),
+    }
+    report['legacy_overhead_pct_of_predict'] = round(100 * report['legacy_dataframe_log_ms'] / report['predict_ms'], 1)
+    # Bytes shipped to the log backend per request
+    report['legacy_log_bytes_per_request'] = len(f"Input DataFrame:\n{df}")
+    report['sampled_log_bytes_per_request'] = len(f"Input DataFrame:\n{DataFramePreview(df)}")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Single-pass vs pipelined predict on a large batch.
+
+The TabPFN tier is replaced by a pure wait standing in for the network
+(per call and per row latency), every row is escalated (cascade threshold
+above 1) so each chunk pays both preprocessing and a remote call, and the
+per-stage utilization of the pipelined run is printed to show the overlap.
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import tempfile
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from predictor import TransactionPredictor
+from surrogate import train_surrogate
+from tests.fixtures import make_labeled_transactions, fit_transformers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the staged chunk pipeline")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--chunk-rows", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=20, help="Simulated TabPFN latency per call")
+    parser.add_argument("--row-latency-ms", type=float, default=0.03, help="Simulated TabPFN latency per row")
+    args = parser.parse_args()
+
+    train_df = make_labeled_transactions(1000)
+    transformers = fit_transformers(train_df)
+    transactions = make_labeled_transactions(args.rows, seed=1).drop(columns=['category']).to_dict('records')
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        with open(os.path.join(model_dir, 'transformers.pkl'), 'wb') as f:
+            pickle.dump(transformers, f)
+        with open(os.path.join(model_dir, 'surrogate.pkl'), 'wb') as f:
+            pickle.dump(train_surrogate(train_df, transformers), f)
+
+        with patch('predictor._ensure_tabpfn_client'), patch.dict(os.environ, {'TABPFN_API_TOKEN': 'bench-token'}):
+            predictor = TransactionPredictor(model_dir=model_dir, cascade_threshold=1.01)
+
+    def remote_predict(df):
+        time.sleep((args.latency_ms + args.row_latency_ms * len(df)) / 1000)
+        return [{'category': 'Other', 'confidence': 0.9}] * len(df)
+
+    predictor._remote_predict = remote_predict
+
+    report = {'rows': args.rows, 'chunk_rows': args.chunk_rows, 'latency_ms': args.latency_ms, 'row_latency_ms': args.row_latency_ms}
+    predictor.pipeline_chunk_rows = 0
+    started = time.perf_counter()
+    response = predictor.predict(transactions)
+    report['single_pass_s'] = round(time.perf_counter() - started, 3)
+    assert response['success'], response['errors']
+
+    predictor.pipeline_chunk_rows = args.chunk_rows
+    started = time.perf_counter()
+    response, stats = predictor._pipelined_predict(transactions)
+    report['pipelined_s'] = round(time.perf_counter() - started, 3)
+    assert response['success'], response['errors']
+
+    report['speedup'] = round(report['single_pass_s'] / report['pipelined_s'], 2)
+    report['pipeline'] = stats
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Payload size and decode time of JSON vs Arrow IPC vs Parquet bodies.
+
+For each batch size, encodes a synthetic batch of transactions as a
+request body in every format and measures its size and the time to decode
+it into the DataFrame predict works on. Then does the same for the
+response body, comparing full JSON (descriptions echoed back), compact
+JSON and the binary formats. Requires pyarrow.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from wire_format import (
+    ARROW_STREAM, PARQUET, read_table, binary_formats_available, compact_results,
+    encode_request, encode_response
+)
+from predictor import TransactionPredictor
+from tests.fixtures import make_labeled_transactions
+
+
+def best_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def bench_requests(transactions, repeat):
+    bodies = {
+        'json': json.dumps({'transactions': transactions}).encode('utf-8'),
+        'arrow': encode_request(transactions, ARROW_STREAM),
+        'parquet': encode_request(transactions, PARQUET),
+    }
+    decoders = {
+        'json': lambda: pd.DataFrame(json.loads(bodies['json'])['transactions']),
+        'arrow': lambda: read_table(bodies['arrow'], ARROW_STREAM).to_pandas(),
+        'parquet': lambda: read_table(bodies['parquet'], PARQUET).to_pandas(),
+    }
+    return {
+        name: {'bytes': len(body), 'decode_ms': round(best_time(decoders[name], repeat), 2)}
+        for name, body in bodies.items()
+    }
+
+
+def bench_responses(results, repeat):
+    def response(rows):
+        return {'success': True, 'results': dict(results, results=rows), 'unchanged': [], 'model_version': 'mock-1'}
+
+    compact = compact_results(results['results'])
+    encoders = {
+        'json': lambda: encode_response(response(results['results']), 'application/json').encode('utf-8'),
+        'json_compact': lambda: encode_response(response(compact), 'application/json').encode('utf-8'),
+        'arrow_compact': lambda: encode_response(response(compact), ARROW_STREAM),
+        'parquet_compact': lambda: encode_response(response(compact), PARQUET),
+    }
+    return {
+        name: {'bytes': len(encode()), 'encode_ms': round(best_time(encode, repeat), 2)}
+        for name, encode in encoders.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON vs Arrow/Parquet request and response bodies")
+    parser.add_argument("--batch-sizes", type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if not binary_formats_available():
+        sys.exit("pyarrow is required for this benchmark")
+
+    logging.disable(logging.WARNING)
+
+    predictor = TransactionPredictor(use_mock=True)
+    report = []
+    for n_rows in args.batch_sizes:
+        df = make_labeled_transactions(n_rows).drop(columns=['category'])
+        df['id'] = df['id'].astype(str)
+        transactions = df.to_dict('records')
+        results = predictor.predict(transactions)
+        for row in results['results']:
+            row['fingerprint'] = 'f' * 20
+        report.append({
+            'rows': n_rows,
+            'request': bench_requests(transactions, args.repeat),
+            'response': bench_responses(results, args.repeat)
+        })
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
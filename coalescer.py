@@ -0,0 +1,166 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingRequest:
+    """One caller's rows waiting to be merged into a shared batch."""
+
+    def __init__(self, transactions):
+        self.transactions = transactions
+        self.wake = threading.Event()
+        self.result = None
+        self.error = None
+        self.done = False
+
+
+class RequestCoalescer:
+    """Merge concurrent predict calls into a single batch.
+
+    The first caller to arrive becomes the batch leader: it waits up to
+    ``max_wait_ms`` (or until ``max_rows`` rows are pending), runs one
+    ``predictor.predict`` call over every pending request and hands each caller
+    back its own slice of the results. Callers that do not fit in the batch
+    stay queued and the oldest of them leads the next one.
+
+    Args:
+        predictor: Predictor whose ``predict(transactions, positions)`` takes
+            a list of transaction dicts with each row's position in its own
+            request, and returns the response dict (one result per row, in order).
+        max_wait_ms: Maximum time the leader waits for other callers.
+        max_rows: Maximum number of rows in a merged batch.
+        max_cells: Maximum TabPFN cells in a merged batch (optional).
+        cells_per_row: Cells consumed by a single row.
+    """
+
+    def __init__(self, predictor, max_wait_ms=5, max_rows=1000, max_cells=None, cells_per_row=1):
+        self.predictor = predictor
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_rows = max_rows
+        if max_cells:
+            self.max_rows = max(1, min(self.max_rows, max_cells // cells_per_row))
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._pending_rows = 0
+        self._leader = None
+
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+
+    def submit(self, transactions):
+        """Predict ``transactions``, possibly batched with concurrent callers."""
+        item = _PendingRequest(self._with_local_ids(transactions))
+
+        with self._cond:
+            self._pending.append(item)
+            self._pending_rows += len(item.transactions)
+            if self._leader is None:
+                self._leader = item
+            elif self._pending_rows >= self.max_rows:
+                self._cond.notify_all()
+            is_leader = self._leader is item
+
+        while True:
+            if is_leader:
+                self._lead()
+            else:
+                item.wake.wait()
+                item.wake.clear()
+
+            if item.done:
+                break
+            # Woken without a result: we were promoted to lead the next batch
+            is_leader = True
+
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def stats(self):
+        """Return batching counters."""
+        with self._cond:
+            return {
+                'batches': self.batches,
+                'requests': self.requests,
+                'rows': self.rows,
+                'pending_rows': self._pending_rows
+            }
+
+    def _with_local_ids(self, transactions):
+        """Give id-less rows their position in the caller's own request.
+
+        The predictor falls back to the row position for ``transaction_id``,
+        which would otherwise be the position in the merged batch.
+        """
+        return [
+            t if 'id' in t else dict(t, id=idx)
+            for idx, t in enumerate(transactions)
+        ]
+
+    def _lead(self):
+        """Collect pending requests, run them as one batch and distribute."""
+        deadline = time.monotonic() + self.max_wait
+
+        with self._cond:
+            while self._pending_rows < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # Always take the oldest request, then as many as fit
+            batch = [self._pending.pop(0)]
+            batch_rows = len(batch[0].transactions)
+            while self._pending and batch_rows + len(self._pending[0].transactions) <= self.max_rows:
+                next_item = self._pending.pop(0)
+                batch.append(next_item)
+                batch_rows += len(next_item.transactions)
+            self._pending_rows -= batch_rows
+
+            # Hand leadership to the oldest request left behind
+            self._leader = self._pending[0] if self._pending else None
+            if self._leader is not None:
+                self._leader.wake.set()
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.rows += batch_rows
+
+        logger.info(f"Coalesced {len(batch)} requests into one batch of {batch_rows} rows")
+        self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        merged = [t for item in batch for t in item.transactions]
+        positions = [pos for item in batch for pos in range(len(item.transactions))]
+        try:
+            response = self.predictor.predict(merged, positions)
+            results = response.get('results', [])
+            if response.get('success') and len(results) != len(merged):
+                raise RuntimeError(
+                    f"Predictor returned {len(results)} results for {len(merged)} coalesced rows"
+                )
+
+            offset = 0
+            for item in batch:
+                n_rows = len(item.transactions)
+                item_results = results[offset:offset + n_rows]
+                offset += n_rows
+                item.result = dict(
+                    response,
+                    results=item_results,
+                    total_processed=len(item_results),
+                    coalesced_requests=len(batch),
+                    batch_rows=len(merged)
+                )
+        except Exception as e:
+            logger.error(f"Coalesced batch failed: {str(e)}")
+            for item in batch:
+                item.error = e
+
+        for item in batch:
+            item.done = True
+            item.wake.set()
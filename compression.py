@@ -0,0 +1,183 @@
+"""
+Content-Encoding support for infer_category.
+
+Request bodies sent with ``Content-Encoding: gzip`` or ``zstd`` are
+decompressed while streaming from the socket, stopping as soon as the
+decompressed size passes a cap so a small compressed body cannot expand
+into gigabytes. Uncompressed bodies without a Content-Length (chunked
+transfer encoding) are read under the same cap. Responses above a size threshold are compressed with the
+best encoding the caller lists in ``Accept-Encoding``.
+
+zstd needs the optional zstandard package; gzip is always available.
+"""
+
+import gzip
+import zlib
+import logging
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_BYTES = 64 * 1024
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+class PayloadTooLarge(Exception):
+    """Raised when a (decompressed) request body exceeds the size cap."""
+
+
+class UnsupportedEncoding(Exception):
+    """Raised for a Content-Encoding this instance cannot decode."""
+
+
+class InvalidEncoding(Exception):
+    """Raised when a compressed body is corrupt."""
+
+
+def supported_encodings():
+    """Encodings accepted for request bodies and used for responses, most preferred first."""
+    return ['zstd', 'gzip'] if zstandard is not None else ['gzip']
+
+
+def read_request_body(request, max_bytes):
+    """Return the decompressed request body, or None for an uncompressed one.
+
+    Uncompressed bodies with a Content-Length are left to the request
+    object (so get_json and get_data keep working) after checking the
+    declared length; without one, the body is read here, up to ``max_bytes``.
+
+    Raises:
+        PayloadTooLarge: If the body is larger than ``max_bytes``
+        UnsupportedEncoding: If the Content-Encoding is not supported
+        InvalidEncoding: If the compressed data is corrupt
+    """
+    encoding = (request.headers.get('Content-Encoding') or 'identity').strip().lower()
+    if encoding == 'identity':
+        if request.content_length is None:
+            # An empty body is left to the request too, which reports no data
+            return _read_stream(request.stream, max_bytes) or None
+        if request.content_length > max_bytes:
+            raise PayloadTooLarge(f"Request body of {request.content_length} bytes exceeds {max_bytes} bytes")
+        return None
+
+    if encoding == 'gzip':
+        body = _gunzip_stream(request.stream, max_bytes)
+    elif encoding == 'zstd' and zstandard is not None:
+        body = _unzstd_stream(request.stream, max_bytes)
+    else:
+        raise UnsupportedEncoding(f"Unsupported Content-Encoding: {encoding}")
+
+    logger.info(f"Decompressed {encoding} request body to {len(body)} bytes")
+    return body
+
+
+def _read_stream(stream, max_bytes):
+    parts = []
+    size = 0
+    while True:
+        chunk = stream.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise PayloadTooLarge(f"Request body exceeds {max_bytes} bytes")
+        parts.append(chunk)
+    return b''.join(parts)
+
+
+def _gunzip_stream(stream, max_bytes):
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    parts = []
+    size = 0
+    try:
+        while True:
+            chunk = stream.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            # Bound the output of every call so a bomb never expands in memory
+            while chunk:
+                part = decompressor.decompress(chunk, max_bytes - size + 1)
+                size += len(part)
+                if size > max_bytes:
+                    raise PayloadTooLarge(f"Decompressed request body exceeds {max_bytes} bytes")
+                parts.append(part)
+                chunk = decompressor.unconsumed_tail
+            if decompressor.eof:
+                break
+        parts.append(decompressor.flush())
+    except zlib.error as e:
+        raise InvalidEncoding(f"Invalid gzip body: {str(e)}")
+    if not decompressor.eof:
+        raise InvalidEncoding("Truncated gzip body")
+    return b''.join(parts)
+
+
+def _unzstd_stream(stream, max_bytes):
+    reader = zstandard.ZstdDecompressor().stream_reader(stream)
+    parts = []
+    size = 0
+    try:
+        while True:
+            part = reader.read(READ_CHUNK_BYTES)
+            if not part:
+                break
+            size += len(part)
+            if size > max_bytes:
+                raise PayloadTooLarge(f"Decompressed request body exceeds {max_bytes} bytes")
+            parts.append(part)
+    except zstandard.ZstdError as e:
+        raise InvalidEncoding(f"Invalid zstd body: {str(e)}")
+    return b''.join(parts)
+
+
+def choose_response_encoding(request):
+    """Best encoding both sides support according to Accept-Encoding, or None."""
+    accepted = request.accept_encodings
+    best = accepted.best_match(supported_encodings())
+    if best is None or accepted.quality(best) == 0:
+        return None
+    return best
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    raise UnsupportedEncoding(f"Unsupported encoding: {encoding}")
+
+
+def compress_response(request, body, headers, min_bytes):
+    """Compress a response body for the caller if it is large enough.
+
+    Updates ``headers`` with Content-Encoding and Vary as needed.
+
+    Returns:
+        The body to send (bytes when compressed, unchanged otherwise)
+    """
+    _add_vary(headers, 'Accept-Encoding')
+    raw = body.encode('utf-8') if isinstance(body, str) else body
+    if len(raw) < min_bytes:
+        return body
+
+    encoding = choose_response_encoding(request)
+    if encoding is None:
+        return body
+
+    compressed = compress(raw, encoding)
+    headers['Content-Encoding'] = encoding
+    logger.info(f"Compressed response from {len(raw)} to {len(compressed)} bytes with {encoding}")
+    return compressed
+
+
+def _add_vary(headers, field):
+    vary = [v.strip() for v in headers.get('Vary', '').split(',') if v.strip()]
+    if field not in vary:
+        vary.append(field)
+    headers['Vary'] = ', '.join(vary)
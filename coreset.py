@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Training-context selection for TabPFN.
+
+TabPFN is an in-context learner: every call sends the labeled context rows
+along with the rows to predict, and both are billed as
+rows x N_FEATURES x N_ESTIMATORS cells. Sending the whole labeled history
+quickly exhausts the budget, so this module picks a small, class-balanced,
+representative subset of it (a coreset) that fits a cell budget.
+
+Contexts are selected offline, when the labeled history is loaded, not per
+request:
+    python coreset.py --data labeled.csv --transformers models/tabpfn-client/transformers.pkl --cell-budget 200000
+"""
+
+import os
+import pickle
+import hashlib
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+# preprocess_text must be importable from __main__ to unpickle transformers.pkl
+from preprocessing import preprocess_data, preprocess_text
+from fingerprint import frame_fingerprints
+from predictor import CELLS_PER_ROW
+
+logger = logging.getLogger(__name__)
+
+SELECTION_METHODS = ('kcenter', 'kmeans')
+
+
+def context_rows_for_budget(cell_budget, n_query_rows=0, cells_per_row=CELLS_PER_ROW):
+    """Number of context rows that fit a cell budget next to ``n_query_rows`` rows to predict."""
+    return max(0, cell_budget // cells_per_row - n_query_rows)
+
+
+def labeled_data_fingerprint(df, model_version=''):
+    """Fingerprint labeled transactions: row contents, labels and their order."""
+    digest = hashlib.sha256(str(model_version).encode('utf-8'))
+    categories = df['category'].tolist() if 'category' in df.columns else [''] * len(df)
+    for fingerprint, category in zip(frame_fingerprints(df, model_version), categories):
+        digest.update(fingerprint.encode('utf-8'))
+        digest.update(b'\x1f')
+        digest.update(str(category).encode('utf-8'))
+        digest.update(b'\x1e')
+    return digest.hexdigest()[:20]
+
+
+def allocate_rows(class_counts, n_rows):
+    """Split ``n_rows`` between classes as evenly as their sizes allow.
+
+    Every class gets the same share; classes smaller than their share keep
+    all their rows and the remainder is redistributed to the larger ones.
+    When there are fewer rows than classes the most frequent classes win.
+
+    Args:
+        class_counts: Dictionary mapping class label to number of available rows
+
+    Returns:
+        Dictionary mapping class label to number of rows to select
+    """
+    allocation = {label: 0 for label in class_counts}
+    remaining = min(n_rows, sum(class_counts.values()))
+    # Largest classes first so leftovers of an uneven split go to them
+    open_classes = sorted(class_counts, key=lambda label: -class_counts[label])
+
+    while remaining > 0 and open_classes:
+        share = max(1, remaining // len(open_classes))
+        for label in list(open_classes):
+            take = min(share, class_counts[label] - allocation[label], remaining)
+            allocation[label] += take
+            remaining -= take
+            if allocation[label] == class_counts[label]:
+                open_classes.remove(label)
+            if remaining == 0:
+                break
+
+    return allocation
+
+
+def _standardize(features):
+    """Z-score each column so no single feature dominates the distances."""
+    std = features.std(axis=0)
+    std[std == 0] = 1.0
+    return (features - features.mean(axis=0)) / std
+
+
+def kcenter_select(points, k):
+    """Greedy k-center: repeatedly add the point farthest from those already chosen.
+
+    Starts from the point closest to the mean, so the selection covers the
+    whole class, outliers included, with the smallest covering radius the
+    greedy algorithm can guarantee (a 2-approximation).
+
+    Returns:
+        Positions of the selected points
+    """
+    if k >= len(points):
+        return list(range(len(points)))
+    if k <= 0:
+        return []
+
+    first = int(np.argmin(((points - points.mean(axis=0)) ** 2).sum(axis=1)))
+    selected = [first]
+    distances = ((points - points[first]) ** 2).sum(axis=1)
+    for _ in range(k - 1):
+        farthest = int(np.argmax(distances))
+        selected.append(farthest)
+        distances = np.minimum(distances, ((points - points[farthest]) ** 2).sum(axis=1))
+    return selected
+
+
+def kmeans_select(points, k, random_state=0):
+    """Cluster into k groups and keep the real point nearest each centroid.
+
+    Returns:
+        Positions of the selected points
+    """
+    if k >= len(points):
+        return list(range(len(points)))
+    if k <= 0:
+        return []
+
+    kmeans = KMeans(n_clusters=k, n_init=1, random_state=random_state).fit(points)
+    selected = []
+    taken = np.zeros(len(points), dtype=bool)
+    for centroid in kmeans.cluster_centers_:
+        distances = ((points - centroid) ** 2).sum(axis=1)
+        distances[taken] = np.inf
+        nearest = int(np.argmin(distances))
+        taken[nearest] = True
+        selected.append(nearest)
+    return selected
+
+
+def select_context(features, labels, n_rows, method='kcenter', random_state=0):
+    """Pick a class-balanced coreset of ``n_rows`` labeled rows.
+
+    Args:
+        features: 2D array of preprocessed features (the 16 model features)
+        labels: Array of category labels, one per row
+        n_rows: Number of rows to keep
+        method: 'kcenter' (greedy farthest-point) or 'kmeans' (nearest to centroids)
+
+    Returns:
+        Sorted array of selected row positions
+    """
+    if method not in SELECTION_METHODS:
+        raise ValueError(f"Unknown selection method: {method}")
+
+    points = _standardize(np.asarray(features, dtype=float))
+    labels = np.asarray(labels)
+    classes, counts = np.unique(labels, return_counts=True)
+    allocation = allocate_rows(dict(zip(classes, counts)), n_rows)
+
+    selected = []
+    for label in classes:
+        positions = np.flatnonzero(labels == label)
+        if method == 'kcenter':
+            chosen = kcenter_select(points[positions], allocation[label])
+        else:
+            chosen = kmeans_select(points[positions], allocation[label], random_state)
+        selected.extend(positions[chosen])
+
+    return np.sort(np.asarray(selected, dtype=int))
+
+
+class ContextSelector:
+    """Select and cache TabPFN training contexts of one labeled history under a cell budget.
+
+    The labeled data is fingerprinted once, when the selector is built.
+    Selections are cached in memory, and on disk when ``cache_dir`` is set,
+    keyed by that fingerprint, the budget and the method, so the context is
+    only recomputed when the labeled data changes.
+
+    Args:
+        df: Labeled transactions (with a 'category' column)
+        transformers: Dictionary with 'scaler', 'tfidf' and 'pca' transformers
+        model_version: Artifact version the features are computed with
+    """
+
+    def __init__(self, df, transformers, model_version='', method='kcenter', cache_dir=None, random_state=0,
+                 cells_per_row=CELLS_PER_ROW):
+        if method not in SELECTION_METHODS:
+            raise ValueError(f"Unknown selection method: {method}")
+        self.labeled = df.dropna(subset=['category'])
+        self.transformers = transformers
+        self.fingerprint = labeled_data_fingerprint(self.labeled, model_version)
+        self.method = method
+        self.cache_dir = cache_dir
+        self.random_state = random_state
+        self.cells_per_row = cells_per_row
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def cache_key(self, n_rows):
+        return f"{self.fingerprint}-{self.method}-{n_rows}"
+
+    def select(self, cell_budget, n_query_rows=0):
+        """Return the labeled rows to send as context.
+
+        Args:
+            cell_budget: TabPFN cells available for context plus query rows
+            n_query_rows: Rows that will be predicted alongside the context
+
+        Returns:
+            Subset of the labeled rows (original index) fitting the budget
+        """
+        labeled = self.labeled
+        n_rows = context_rows_for_budget(cell_budget, n_query_rows, self.cells_per_row)
+        if n_rows >= len(labeled):
+            return labeled
+
+        key = self.cache_key(n_rows)
+        positions = self._load(key)
+        if positions is None:
+            self.misses += 1
+            features = preprocess_data(labeled, transformers=self.transformers, is_training=True)
+            positions = select_context(
+                features.to_numpy(), labeled['category'].to_numpy(), n_rows,
+                method=self.method, random_state=self.random_state
+            )
+            self._store(key, positions)
+            logger.info(f"Selected {len(positions)} of {len(labeled)} labeled rows as context ({self.method})")
+        else:
+            self.hits += 1
+
+        return labeled.iloc[positions]
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, f'context-{key}.pkl')
+
+    def _load(self, key):
+        if key in self._cache:
+            return self._cache[key]
+        if self.cache_dir and os.path.exists(self._cache_path(key)):
+            try:
+                with open(self._cache_path(key), 'rb') as f:
+                    positions = pickle.load(f)
+                self._cache[key] = positions
+                return positions
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable context cache {key}: {str(e)}")
+        return None
+
+    def _store(self, key, positions):
+        self._cache[key] = positions
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write then rename so concurrent readers never see a partial file
+            tmp_path = f'{self._cache_path(key)}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(positions, f)
+            os.replace(tmp_path, self._cache_path(key))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Select a class-balanced TabPFN context under a cell budget")
+    parser.add_argument("--data", required=True, help="CSV with dateOp, transaction_description, amount and category columns")
+    parser.add_argument("--transformers", required=True, help="Path to transformers.pkl")
+    parser.add_argument("--cell-budget", type=int, required=True, help="TabPFN cells available for the context")
+    parser.add_argument("--query-rows", type=int, default=0, help="Rows predicted alongside the context")
+    parser.add_argument("--method", choices=SELECTION_METHODS, default='kcenter')
+    parser.add_argument("--cache-dir", default=None, help="Directory caching selections between runs")
+    parser.add_argument("--output", default="context.csv", help="Where to write the selected rows")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with open(args.transformers, 'rb') as f:
+        transformers = pickle.load(f)
+
+    df = pd.read_csv(args.data)
+    selector = ContextSelector(df, transformers, method=args.method, cache_dir=args.cache_dir)
+    context = selector.select(args.cell_budget, n_query_rows=args.query_rows)
+
+    context.to_csv(args.output, index=False)
+    logger.info(f"Wrote {len(context)} context rows ({len(context) * CELLS_PER_ROW} cells) to {args.output}")
+    logger.info(f"Class balance: {context['category'].value_counts().to_dict()}")
+
+
+if __name__ == "__main__":
+    main()
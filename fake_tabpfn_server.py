@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the TabPFN API, for tests and benchmarks.
+
+Serves the subset of the API tabpfn_client uses (``/``, ``/protected/``,
+``/retrieve_greeting_messages/``, multipart ``/fit/`` and the server-sent
+events stream of ``/predict/``) plus the JSON ``/predict`` endpoint of
+tabpfn_transport, with injectable:
+
+- latency: a per-call distribution plus a per-cell cost
+- quotas: cells each token may use per window; calls over it get a 429
+  whose body carries ``next_available_at``, like the real service
+- failures: a share of calls answered with a 500
+
+Predictions are cheap stand-ins (1-nearest-neighbor on the uploaded train
+set, keyword rules for the JSON endpoint); only the protocol and the
+timing are realistic.
+
+Usage:
+    python fake_tabpfn_server.py --port 8080 --latency lognormal:0.2,0.5 --quota-cells 1000000
+    TABPFN_API_URL=http://127.0.0.1:8080 TABPFN_API_TOKEN=fake-token functions-framework --target=infer_category
+
+From Python:
+    with FakeTabPFNServer(latency='constant:0.05', failure_rate=0.01) as server:
+        ...  # server.url
+"""
+
+import io
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+import email.policy
+from email.parser import BytesParser
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from predictor import CELLS_PER_ROW, N_ESTIMATORS, KEYWORD_CATEGORIES
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyModel:
+    """Call latency: a per-call distribution plus a cost per cell.
+
+    Specs: ``0``, ``constant:S``, ``uniform:LOW,HIGH`` or
+    ``lognormal:MEDIAN,SIGMA`` (all in seconds).
+    """
+
+    def __init__(self, spec='0', per_cell_s=0.0, seed=None):
+        self.spec = spec
+        self.per_cell_s = per_cell_s
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        kind, _, args = spec.partition(':')
+        self.kind = kind if args else 'constant'
+        self.args = [float(a) for a in (args or kind).split(',')]
+        if self.kind not in ('constant', 'uniform', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, cells=0):
+        with self._lock:
+            if self.kind == 'uniform':
+                base = self._rng.uniform(*self.args)
+            elif self.kind == 'lognormal':
+                median, sigma = self.args
+                base = median * float(np.exp(self._rng.gauss(0, sigma)))
+            else:
+                base = self.args[0]
+        return base + self.per_cell_s * cells
+
+
+class CellQuota:
+    """Cells each token may use per fixed window."""
+
+    def __init__(self, cells_per_window, window_s=86400):
+        self.cells_per_window = cells_per_window
+        self.window_s = window_s
+        self._usage = {}
+        self._lock = threading.Lock()
+
+    def try_consume(self, token, cells, now=None):
+        """Charge ``cells``; returns (allowed, next_available_at ISO string)."""
+        now = time.time() if now is None else now
+        window_start = now - now % self.window_s
+        reset_at = datetime.fromtimestamp(window_start + self.window_s, timezone.utc).isoformat()
+        with self._lock:
+            start, used = self._usage.get(token, (window_start, 0))
+            if start != window_start:
+                used = 0
+            if used + cells > self.cells_per_window:
+                return False, reset_at
+            self._usage[token] = (window_start, used + cells)
+        return True, reset_at
+
+
+class FakeTabPFNServer:
+    """Threaded HTTP server imitating the TabPFN API.
+
+    Args:
+        latency: LatencyModel spec for every fit / predict call
+        per_cell_s: Extra latency per cell of a call
+        quota_cells: Cells each token may use per quota window (None: unlimited)
+        quota_window_s: Length of the quota window
+        failure_rate: Share of fit / predict calls answered with a 500
+        tokens: Accepted bearer tokens (None accepts any)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency='0', per_cell_s=0.0, quota_cells=None,
+                 quota_window_s=86400, failure_rate=0.0, tokens=None, seed=None):
+        self.latency = LatencyModel(latency, per_cell_s, seed=seed)
+        self.quota = CellQuota(quota_cells, quota_window_s) if quota_cells else None
+        self.failure_rate = failure_rate
+        self.tokens = set(tokens) if tokens else None
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+        self.train_sets = {}
+        self.test_sets = {}
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'cells': 0, 'throttled': 0, 'failures': 0, 'unauthorized': 0}
+
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-tabpfn', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def _should_fail(self):
+        if self.failure_rate <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < self.failure_rate
+
+    def _authorized(self, token):
+        return token is not None and (self.tokens is None or token in self.tokens)
+
+    def admit(self, token, cells):
+        """Apply quota, failure injection and latency to a call.
+
+        Returns:
+            None to proceed, or (status, body) to answer with instead
+        """
+        if not self._authorized(token):
+            self._count('unauthorized')
+            return 401, {'detail': 'Invalid or missing token'}
+
+        if self.quota is not None:
+            allowed, next_available_at = self.quota.try_consume(token, cells)
+            if not allowed:
+                self._count('throttled')
+                return 429, {
+                    'detail': f'Usage limit exceeded: this call needs {cells} cells',
+                    'next_available_at': next_available_at
+                }
+
+        time.sleep(self.latency.sample(cells))
+
+        if self._should_fail():
+            self._count('failures')
+            return 500, {'detail': 'Injected failure'}
+
+        self._count('cells', cells)
+        return None
+
+    def fit(self, x_csv, y_csv):
+        X = pd.read_csv(io.BytesIO(x_csv))
+        y = pd.read_csv(io.BytesIO(y_csv)).iloc[:, 0].to_numpy()
+        uid = str(uuid.uuid4())
+        with self._lock:
+            self.train_sets[uid] = (X, y)
+        return uid
+
+    def predict(self, train_set_uid, X, output_type):
+        with self._lock:
+            X_train, y_train = self.train_sets[train_set_uid]
+        train = _numeric(X_train)
+        test = _numeric(X)
+        # 1-NN on the numeric columns, squared distances in one matrix product
+        distances = (test ** 2).sum(1)[:, None] - 2 * test @ train.T + (train ** 2).sum(1)[None, :]
+        predictions = y_train[distances.argmin(axis=1)]
+        if output_type == 'probas':
+            classes = np.unique(y_train)
+            return (predictions[:, None] == classes[None, :]).astype(float).tolist()
+        return predictions.tolist()
+
+
+def _numeric(df):
+    return df.apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=float)
+
+
+def _categorize(row):
+    desc = str(row.get('transaction_description') or '').lower()
+    for keyword, category in KEYWORD_CATEGORIES:
+        if keyword in desc:
+            return {'category': category, 'confidence': 0.9}
+    try:
+        amount = float(row.get('amount') or 0)
+    except ValueError:
+        amount = 0.0
+    if amount > 0:
+        return {'category': 'Income', 'confidence': 0.85}
+    return {'category': 'Other', 'confidence': 0.65}
+
+
+def _parse_multipart(content_type, body):
+    message = BytesParser(policy=email.policy.HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + body
+    )
+    return {
+        part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+        for part in message.iter_parts()
+    }
+
+
+def _make_handler(server):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+        def _token(self):
+            auth = self.headers.get('Authorization', '')
+            return auth[len('Bearer '):] if auth.startswith('Bearer ') else None
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_events(self, events):
+            data = ''.join(f'data: {json.dumps(event)}\n\n' for event in events).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            server._count('requests')
+            path = urlsplit(self.path).path
+            if path == '/':
+                self._send_json(200, {'message': 'Fake TabPFN server'})
+            elif path == '/protected/':
+                if server._authorized(self._token()):
+                    self._send_json(200, {'message': 'Authorized'})
+                else:
+                    self._send_json(401, {'detail': 'Invalid or missing token'})
+            elif path == '/retrieve_greeting_messages/':
+                self._send_json(200, {'messages': []})
+            else:
+                self._send_json(404, {'detail': f'Not found: {path}'})
+
+        def do_POST(self):
+            server._count('requests')
+            url = urlsplit(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            body = self._body()
+            try:
+                if url.path == '/predict':
+                    self._transport_predict(body)
+                elif url.path == '/fit/':
+                    self._fit(body)
+                elif url.path == '/predict/':
+                    self._client_predict(params, body)
+                else:
+                    self._send_json(404, {'detail': f'Not found: {url.path}'})
+            except Exception as e:
+                logger.exception("Fake TabPFN request failed")
+                self._send_json(400, {'detail': str(e)})
+
+        def _transport_predict(self, body):
+            rows = json.loads(body)['rows']
+            rejected = server.admit(self._token(), len(rows) * CELLS_PER_ROW)
+            if rejected:
+                self._send_json(*rejected)
+                return
+            self._send_json(200, {'predictions': [_categorize(row) for row in rows]})
+
+        def _fit(self, body):
+            files = _parse_multipart(self.headers['Content-Type'], body)
+            x_csv = files['x_file']
+            n_rows = max(0, x_csv.count(b'\n') - 1)
+            n_cols = x_csv.split(b'\n', 1)[0].count(b',') + 1
+            rejected = server.admit(self._token(), n_rows * n_cols)
+            if rejected:
+                self._send_json(*rejected)
+                return
+            self._send_json(200, {'train_set_uid': server.fit(x_csv, files['y_file'])})
+
+        def _client_predict(self, params, body):
+            if 'test_set_uid' in params:
+                with server._lock:
+                    X = server.test_sets.get(params['test_set_uid'])
+                test_set_uid = params['test_set_uid']
+            else:
+                files = _parse_multipart(self.headers['Content-Type'], body)
+                X = pd.read_csv(io.BytesIO(files['x_file']))
+                test_set_uid = str(uuid.uuid4())
+                with server._lock:
+                    server.test_sets[test_set_uid] = X
+            with server._lock:
+                train = server.train_sets.get(params.get('train_set_uid'))
+            if X is None or train is None:
+                self._send_json(400, {'detail': 'Invalid train or test set uid'})
+                return
+
+            # Context and test rows, every feature, once per estimator
+            cells = (len(train[0]) + len(X)) * X.shape[1] * N_ESTIMATORS
+            rejected = server.admit(self._token(), cells)
+            if rejected:
+                self._send_json(*rejected)
+                return
+
+            task = params.get('task', 'classification')
+            output_type = json.loads(params.get('predict_params') or 'null') or {}
+            result = server.predict(params['train_set_uid'], X, output_type.get('output_type', 'preds'))
+            self._send_events([{'event': 'result', 'data': {task: result, 'test_set_uid': test_set_uid}}])
+
+    return Handler
+
+
+def point_tabpfn_client_at(url):
+    """Send tabpfn_client's calls to ``url`` (e.g. a FakeTabPFNServer) instead of the real service."""
+    import httpx
+    from tabpfn_client.client import ServiceClient, get_client_version
+
+    headers = {'client-version': get_client_version()}
+    if ServiceClient.get_access_token():
+        headers['Authorization'] = f'Bearer {ServiceClient.get_access_token()}'
+    ServiceClient.httpx_client = httpx.Client(base_url=url, timeout=ServiceClient.httpx_timeout_s, headers=headers)
+    ServiceClient.base_url = url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake TabPFN server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", default="0", help="constant:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--per-cell-s", type=float, default=0.0, help="Extra latency per cell")
+    parser.add_argument("--quota-cells", type=int, default=None, help="Cells per token per quota window")
+    parser.add_argument("--quota-window-s", type=float, default=86400)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = FakeTabPFNServer(
+        host=args.host, port=args.port, latency=args.latency, per_cell_s=args.per_cell_s,
+        quota_cells=args.quota_cells, quota_window_s=args.quota_window_s,
+        failure_rate=args.failure_rate, seed=args.seed
+    )
+    logger.info(f"Fake TabPFN server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        logger.info(f"Served: {json.dumps(server.stats())}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import pandas as pd
+from preprocessing import normalize_description
+
+logger = logging.getLogger(__name__)
+
+def _normalize_amount(amount):
+    """Normalize an amount the way preprocess_data parses it."""
+    try:
+        return f"{float(str(amount).replace(',', '.')):.2f}"
+    except (TypeError, ValueError):
+        return str(amount)
+
+def _normalize_date(date):
+    """Normalize a date to YYYY-MM-DD, trying DD/MM/YYYY first like preprocess_data."""
+    if date is None:
+        return ''
+    try:
+        return pd.to_datetime(date, format='%d/%m/%Y').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        pass
+    try:
+        return pd.to_datetime(date).strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return str(date)
+
+def transaction_fingerprint(transaction, model_version):
+    """Fingerprint a transaction's content for a given model version.
+
+    Only fields that influence the prediction are included, normalized the
+    same way preprocessing does, so case, punctuation and whitespace edits
+    to the description do not change the fingerprint.
+    """
+    description = transaction.get('transaction_description', transaction.get('description', ''))
+    date = transaction.get('dateOp', transaction.get('date'))
+    content = '\x1f'.join([
+        str(model_version),
+        normalize_description(description),
+        _normalize_amount(transaction.get('amount', 0)),
+        _normalize_date(date)
+    ])
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:20]
+
+def _memoized(normalize):
+    """Apply ``normalize`` once per distinct value (dates and amounts repeat a lot)."""
+    cache = {}
+    def wrapper(value):
+        try:
+            return cache[value]
+        except KeyError:
+            result = cache[value] = normalize(value)
+            return result
+        except TypeError:  # unhashable
+            return normalize(value)
+    return wrapper
+
+def _column(df, *names, default=None):
+    """Values of the first of ``names`` present in ``df``, as transaction.get would find them."""
+    for name in names:
+        if name in df.columns:
+            return df[name].tolist()
+    return [default] * len(df)
+
+def frame_fingerprints(df, model_version):
+    """transaction_fingerprint of every row of a DataFrame, normalizing each distinct value once."""
+    descriptions = map(_memoized(normalize_description), _column(df, 'transaction_description', 'description', default=''))
+    amounts = map(_memoized(_normalize_amount), _column(df, 'amount', default=0))
+    dates = map(_memoized(_normalize_date), _column(df, 'dateOp', 'date'))
+    version = str(model_version)
+    return [
+        hashlib.sha256('\x1f'.join([version, description, amount, date]).encode('utf-8')).hexdigest()[:20]
+        for description, amount, date in zip(descriptions, amounts, dates)
+    ]
+
+def split_changed(transactions, model_version, if_none_match=None):
+    """Split transactions into rows that need a prediction and unchanged rows.
+
+    A row is unchanged when its fingerprint is listed in ``if_none_match`` or
+    equals the ``fingerprint`` field sent with the row (the value returned by
+    a previous response).
+
+    ``transactions`` is a list of dictionaries or a DataFrame (decoded from a
+    columnar request body); changed rows are returned in the same form.
+
+    Returns:
+        Tuple of (changed transactions, their fingerprints, unchanged transaction ids)
+    """
+    if isinstance(transactions, pd.DataFrame):
+        return _split_changed_frame(transactions, model_version, if_none_match)
+
+    known = set(if_none_match or [])
+    changed = []
+    fingerprints = []
+    unchanged_ids = []
+
+    for idx, transaction in enumerate(transactions):
+        fingerprint = transaction_fingerprint(transaction, model_version)
+        if fingerprint in known or transaction.get('fingerprint') == fingerprint:
+            unchanged_ids.append(str(transaction.get('id', idx)))
+            continue
+        # Keep the original position as id so results still map back to the caller's rows
+        if 'id' not in transaction:
+            transaction = dict(transaction, id=idx)
+        changed.append(transaction)
+        fingerprints.append(fingerprint)
+
+    logger.info(f"{len(changed)} changed and {len(unchanged_ids)} unchanged transactions")
+    return changed, fingerprints, unchanged_ids
+
+def _split_changed_frame(df, model_version, if_none_match):
+    """split_changed for a DataFrame: keep it columnar and select the changed rows."""
+    ids = df['id'].astype(str).tolist() if 'id' in df.columns else [str(idx) for idx in range(len(df))]
+    sent = _column(df, 'fingerprint')
+    known = set(if_none_match or [])
+    keep = []
+    fingerprints = []
+    unchanged_ids = []
+
+    for idx, fingerprint in enumerate(frame_fingerprints(df, model_version)):
+        if fingerprint in known or sent[idx] == fingerprint:
+            unchanged_ids.append(ids[idx])
+            continue
+        keep.append(idx)
+        fingerprints.append(fingerprint)
+
+    changed = df.iloc[keep].reset_index(drop=True)
+    if 'id' not in changed.columns:
+        changed.insert(0, 'id', keep)
+
+    logger.info(f"{len(changed)} changed and {len(unchanged_ids)} unchanged transactions")
+    return changed, fingerprints, unchanged_ids
@@ -0,0 +1,142 @@
+"""
+Logging setup for the service.
+
+- configure_logging sets up the root logger, once, to emit one JSON object
+  per record (the format Cloud Logging parses into structured entries) or
+  plain text for local runs. Handlers the host already installed
+  (functions_framework, gunicorn) are reformatted rather than duplicated.
+- request_context tags every record logged while handling a request with
+  its request_id and decides, once per request, whether verbose payload
+  logs are sampled in.
+- log_payload logs a DataFrame preview only for sampled requests, and only
+  renders it (capped to a few rows) if the record is actually emitted.
+
+Library modules only call logging.getLogger(__name__); entry points call
+configure_logging.
+"""
+
+import os
+import sys
+import json
+import zlib
+import logging
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Fraction of requests whose payloads (input DataFrames, ...) are logged
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0.01'))
+
+# Rows shown in DataFrame previews
+LOG_PREVIEW_ROWS = int(os.getenv('LOG_PREVIEW_ROWS', '5'))
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_payload_sampled = contextvars.ContextVar('payload_sampled', default=False)
+
+_configured = False
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON with Cloud Logging field names."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'severity': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        request_id = _request_id.get()
+        if request_id is not None:
+            entry['request_id'] = request_id
+        # Structured fields passed with extra={...}
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=None, json_format=None):
+    """Format the root logger's output for the service; later calls are no-ops.
+
+    When the host already installed root handlers they keep their streams
+    but get the service's formatter, so nothing is logged twice or in the
+    host's format; otherwise a stderr handler is added.
+
+    Args:
+        level: Log level name (default LOG_LEVEL, or INFO)
+        json_format: Emit JSON records (default LOG_FORMAT == 'json', or
+            running on Cloud Functions / Cloud Run)
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    if level is None:
+        level = os.getenv('LOG_LEVEL', 'INFO')
+    if json_format is None:
+        log_format = os.getenv('LOG_FORMAT', '').lower()
+        json_format = log_format == 'json' or (not log_format and 'K_SERVICE' in os.environ)
+
+    if json_format:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    root = logging.getLogger()
+    if not root.handlers:
+        root.addHandler(logging.StreamHandler(sys.stderr))
+    for handler in root.handlers:
+        handler.setFormatter(formatter)
+    root.setLevel(level)
+
+
+def is_sampled(request_id, rate=None):
+    """Deterministic per-request sampling decision."""
+    rate = LOG_PAYLOAD_SAMPLE_RATE if rate is None else rate
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    return zlib.crc32(str(request_id).encode('utf-8')) / 0xFFFFFFFF < rate
+
+
+@contextmanager
+def request_context(request_id, sampled=None):
+    """Tag records with ``request_id`` and fix the payload sampling decision for the request."""
+    id_token = _request_id.set(request_id)
+    sampled_token = _payload_sampled.set(is_sampled(request_id) if sampled is None else sampled)
+    try:
+        yield
+    finally:
+        _request_id.reset(id_token)
+        _payload_sampled.reset(sampled_token)
+
+
+def payload_sampled():
+    return _payload_sampled.get()
+
+
+class DataFramePreview:
+    """Renders the first rows of a DataFrame, only when formatted."""
+
+    def __init__(self, df, max_rows=None):
+        self.df = df
+        self.max_rows = LOG_PREVIEW_ROWS if max_rows is None else max_rows
+
+    def __str__(self):
+        if len(self.df) <= self.max_rows:
+            return self.df.to_string()
+        return f"{self.df.head(self.max_rows).to_string()}\n... ({len(self.df)} rows total)"
+
+
+def log_payload(logger, message, df, level=logging.INFO):
+    """Log a capped DataFrame preview for requests sampled for payload logging."""
+    if payload_sampled() and logger.isEnabledFor(level):
+        logger.log(level, "%s:\n%s", message, DataFramePreview(df))
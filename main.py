@@ -1,18 +1,36 @@
 import functions_framework
 import os
+import time
 from datetime import datetime
 import json
 import logging
+import threading
+from contextlib import nullcontext
 from dotenv import load_dotenv
-from predictor import TransactionPredictor
+from predictor import TransactionPredictor, CELLS_PER_ROW, N_FEATURES, N_ESTIMATORS
+from coalescer import RequestCoalescer
+from fingerprint import split_changed
+from metering import QuotaMeter, create_caller_identity, create_usage_store
+from admission import AdmissionController, AdmissionRejected
+from compression import (
+    PayloadTooLarge, UnsupportedEncoding, InvalidEncoding, compress_response, read_request_body,
+    supported_encodings
+)
+from wire_format import (
+    JSON, ARROW_STREAM, PARQUET, InvalidBody, UnsupportedMediaType, binary_formats_available,
+    compact_results, decode_request, encode_response, negotiate_response_format
+)
+from log_utils import configure_logging, request_context
+from artifact_watcher import ArtifactWatcher, GCSArtifactSource, LocalArtifactSource
+from trace_capture import create_trace_recorder
+from profiling import create_profiler
+import metrics
+import memory_accounting
 from google.cloud import storage
 from google.api_core import retry
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (JSON records on Cloud Functions, text locally)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -22,52 +40,288 @@ load_dotenv()
 GCS_BUCKET = os.getenv('GCS_BUCKET', 'your-bucket-name')
 MODEL_PATH = "models/tabpfn-client"
 
-# Global predictor instance
+# Batch limits advertised to clients (GET /limits)
+MAX_CELLS_PER_REQUEST = int(os.getenv('MAX_CELLS_PER_REQUEST', '100000'))
+MAX_BATCH_ROWS = int(os.getenv('MAX_BATCH_ROWS', '100'))
+MAX_CONCURRENT_BATCHES = int(os.getenv('MAX_CONCURRENT_BATCHES', '4'))
+
+# Quota metering: TabPFN cells each caller may consume per day (UTC)
+QUOTA_CELLS_PER_DAY = int(os.getenv('QUOTA_CELLS_PER_DAY', '5000000'))
+USAGE_STORE_URL = os.getenv('USAGE_STORE_URL', 'memory://')
+
+# Admission control: rows processed at once and how much excess may queue
+ADMISSION_MAX_INFLIGHT_ROWS = int(os.getenv('ADMISSION_MAX_INFLIGHT_ROWS', '5000'))
+ADMISSION_MAX_QUEUE_ROWS = int(os.getenv('ADMISSION_MAX_QUEUE_ROWS', '20000'))
+ADMISSION_MAX_WAIT_S = float(os.getenv('ADMISSION_MAX_WAIT_S', '10'))
+ADMISSION_SMALL_REQUEST_ROWS = int(os.getenv('ADMISSION_SMALL_REQUEST_ROWS', '200'))
+
+# Request bodies: cap on the (decompressed) size, and smallest response worth compressing
+MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_BYTES', str(32 * 1024 * 1024)))
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+
+# Request coalescing (disabled when COALESCE_MAX_WAIT_MS is 0)
+COALESCE_MAX_WAIT_MS = float(os.getenv('COALESCE_MAX_WAIT_MS', '0'))
+COALESCE_MAX_ROWS = int(os.getenv('COALESCE_MAX_ROWS', '1000'))
+COALESCE_MAX_CELLS = int(os.getenv('COALESCE_MAX_CELLS', '100000'))
+
+# Hot reload of model artifacts (disabled when ARTIFACT_POLL_INTERVAL_S is 0)
+ARTIFACT_POLL_INTERVAL_S = float(os.getenv('ARTIFACT_POLL_INTERVAL_S', '0'))
+ARTIFACT_RETIRE_GRACE_S = float(os.getenv('ARTIFACT_RETIRE_GRACE_S', '300'))
+
+# Global predictor instance, shared by every request handled by this process.
+# It is only ever assigned once, fully initialized, under _predictor_lock so that
+# concurrent cold requests cannot race and build it twice.
 predictor = None
+_predictor_lock = threading.Lock()
+
+# Optional coalescing layer in front of predictor.predict
+coalescer = None
+
+# Background hot reload of the artifacts (started with the predictor)
+artifact_watcher = None
+
+# Per-caller usage of the TabPFN cell budget, keyed on a server-verified identity
+meter = QuotaMeter(create_usage_store(USAGE_STORE_URL), QUOTA_CELLS_PER_DAY, CELLS_PER_ROW)
+callers = create_caller_identity()
+
+# Optional anonymized trace of sampled requests (TRACE_SAMPLE_RATE)
+tracer = create_trace_recorder()
+
+# On-demand profiling of single requests (PROFILE_TOKEN)
+profiler = create_profiler()
+
+# Load shedding for the whole instance
+admission = AdmissionController(
+    max_inflight_rows=ADMISSION_MAX_INFLIGHT_ROWS,
+    max_queue_rows=ADMISSION_MAX_QUEUE_ROWS,
+    max_wait_s=ADMISSION_MAX_WAIT_S,
+    small_request_rows=ADMISSION_SMALL_REQUEST_ROWS,
+    cells_per_row=CELLS_PER_ROW
+)
+admission.publish_metrics()
+
+def build_predictor(request_id="init", artifact_version=None):
+    """Build and initialize a predictor from the current environment and artifacts."""
+    # Initialize predictor with GCS configuration
+    raw_use_mock = os.getenv('USE_MOCK', '')
+    raw_use_gcs = os.getenv('USE_GCS', '')
+    
+    # Log the actual environment variables for debugging
+    logger.info(f"[{request_id}] Environment variables - USE_MOCK: '{raw_use_mock}', USE_GCS: '{raw_use_gcs}'")
+    
+    use_mock = raw_use_mock.lower() == 'true'
+    use_gcs = raw_use_gcs.lower() == 'true'
+    
+    logger.info(f"[{request_id}] Using mock: {use_mock}, Using GCS: {use_gcs}")
+    
+    new_predictor = TransactionPredictor(
+        model_dir=MODEL_PATH,
+        use_mock=use_mock,
+        use_gcs=use_gcs,
+        gcs_bucket=GCS_BUCKET,
+        artifact_version=artifact_version
+    )
+    
+    new_predictor.initialize()
+    return new_predictor
+
+def build_coalescer(new_predictor):
+    """Coalescing layer in front of ``new_predictor``, or None when disabled."""
+    if COALESCE_MAX_WAIT_MS <= 0:
+        return None
+    logger.info(f"Coalescing requests for up to {COALESCE_MAX_WAIT_MS}ms")
+    return RequestCoalescer(
+        new_predictor,
+        max_wait_ms=COALESCE_MAX_WAIT_MS,
+        max_rows=COALESCE_MAX_ROWS,
+        max_cells=COALESCE_MAX_CELLS,
+        cells_per_row=CELLS_PER_ROW
+    )
+
+def swap_predictor(new_predictor):
+    """Serve new requests with ``new_predictor`` and return the predictor it replaces.
+    
+    Requests already running keep the predictor they started with.
+    """
+    global predictor, coalescer
+    new_coalescer = build_coalescer(new_predictor)
+    with _predictor_lock:
+        old_predictor = predictor
+        coalescer = new_coalescer
+        predictor = new_predictor
+    # Neighbor rows indexed since reload_predictor saved the index move along
+    if old_predictor is not None:
+        old_predictor.hand_over_neighbors(new_predictor)
+    logger.info(f"Serving model version {new_predictor.model_version}")
+    return old_predictor
+
+def reload_predictor(generation):
+    """Build a predictor for new artifacts (runs on the watcher thread)."""
+    current = predictor
+    if current is not None:
+        # The new predictor loads the neighbor index from disk
+        current.save_neighbor_index()
+    return build_predictor("reload", artifact_version=generation)
+
+def start_artifact_watcher(request_id="init"):
+    """Watch the deployed artifacts and hot-reload the predictor when they change."""
+    global artifact_watcher
+    if os.getenv('USE_GCS', '').lower() == 'true':
+        source = GCSArtifactSource(GCS_BUCKET, prefix=f'{MODEL_PATH}/')
+    else:
+        source = LocalArtifactSource(MODEL_PATH)
+    generation = source.generation()
+    artifact_watcher = ArtifactWatcher(
+        source, reload_predictor, swap_predictor,
+        interval_s=ARTIFACT_POLL_INTERVAL_S,
+        retire_grace_s=ARTIFACT_RETIRE_GRACE_S,
+        generation=generation
+    )
+    artifact_watcher.start()
+    logger.info(f"[{request_id}] Watching artifacts every {ARTIFACT_POLL_INTERVAL_S}s (generation {generation})")
+    return generation
 
 def initialize_predictor(request_id="init"):
-    """Initialize the global predictor instance."""
-    global predictor
-    if predictor is None:
+    """Initialize the global predictor instance (single-flight) and return it."""
+    global predictor, coalescer
+    if predictor is not None:
+        return predictor
+
+    with _predictor_lock:
+        # Another request may have finished initialization while we waited
+        if predictor is not None:
+            return predictor
+
         try:
-            # Initialize predictor with GCS configuration
-            raw_use_mock = os.getenv('USE_MOCK', '')
-            raw_use_gcs = os.getenv('USE_GCS', '')
-            
-            # Log the actual environment variables for debugging
-            logger.info(f"[{request_id}] Environment variables - USE_MOCK: '{raw_use_mock}', USE_GCS: '{raw_use_gcs}'")
-            
-            use_mock = raw_use_mock.lower() == 'true'
-            use_gcs = raw_use_gcs.lower() == 'true'
+            # With hot reload, versions follow the artifact generation
+            artifact_version = None
+            if ARTIFACT_POLL_INTERVAL_S > 0 and artifact_watcher is None:
+                artifact_version = start_artifact_watcher(request_id)
             
-            logger.info(f"[{request_id}] Using mock: {use_mock}, Using GCS: {use_gcs}")
+            new_predictor = build_predictor(request_id, artifact_version)
+            coalescer = build_coalescer(new_predictor)
             
-            predictor = TransactionPredictor(
-                model_dir=MODEL_PATH,
-                use_mock=use_mock,
-                use_gcs=use_gcs,
-                gcs_bucket=GCS_BUCKET
-            )
-            
-            predictor.initialize()
+            # Publish only once fully initialized
+            predictor = new_predictor
             logger.info("Predictor initialization completed successfully")
+            return predictor
             
         except Exception as e:
             logger.error(f"Failed to initialize predictor: {str(e)}")
             raise
 
+def get_limits():
+    """Batch limits clients should respect when splitting and dispatching work."""
+    return {
+        'max_batch_rows': min(MAX_BATCH_ROWS, MAX_CELLS_PER_REQUEST // CELLS_PER_ROW),
+        'max_concurrent_batches': MAX_CONCURRENT_BATCHES,
+        'max_cells_per_request': MAX_CELLS_PER_REQUEST,
+        'n_features': N_FEATURES,
+        'n_estimators': N_ESTIMATORS,
+        'formats': [JSON, ARROW_STREAM, PARQUET] if binary_formats_available() else [JSON],
+        'encodings': supported_encodings(),
+        'max_request_bytes': MAX_REQUEST_BYTES
+    }
+
+def is_compact(request, request_json):
+    """Whether the caller asked for compact results (body field or ?compact=1)."""
+    if request_json.get('compact'):
+        return True
+    return request.args.get('compact', '').lower() in ('1', 'true')
+
+def get_caller_id(request):
+    """Identify the caller whose quota a request is charged to (None without valid credentials)."""
+    return callers.identify(request)
+
+def handle_get(request, request_id, headers, caller):
+    """Serve the read-only endpoints, which never run a prediction."""
+    path = request.path.rstrip('/')
+    
+    if path.endswith('/usage'):
+        usage = meter.usage(caller)
+        return (json.dumps({
+            'success': True,
+            'caller': caller,
+            'usage': usage,
+            'cells_per_row': CELLS_PER_ROW,
+            'request_id': request_id
+        }), 200, headers)
+    
+    if '/profiles/' in path:
+        if not profiler.authorized(request):
+            return (json.dumps({
+                'error': 'FORBIDDEN',
+                'message': 'A valid X-Profile-Token is required',
+                'success': False,
+                'request_id': request_id
+            }), 403, headers)
+        artifact = profiler.artifact(path.rsplit('/', 1)[-1])
+        if artifact is None:
+            return (json.dumps({
+                'error': 'NOT_FOUND',
+                'message': 'No profile with this id on this instance',
+                'success': False,
+                'request_id': request_id
+            }), 404, headers)
+        artifact_path, content_type = artifact
+        with open(artifact_path, 'rb') as f:
+            return (f.read(), 200, dict(headers, **{'Content-Type': content_type}))
+    
+    if path.endswith('/metrics'):
+        return (metrics.render(), 200, dict(headers, **{'Content-Type': metrics.CONTENT_TYPE}))
+    
+    if path.endswith('/limits'):
+        return (json.dumps({
+            'success': True,
+            'limits': get_limits(),
+            'load': admission.stats(),
+            'request_id': request_id
+        }), 200, headers)
+    
+    return (json.dumps({
+        'error': f"Unknown endpoint: {request.path}",
+        'success': False,
+        'request_id': request_id
+    }), 404, headers)
+
 @functions_framework.http
 def infer_category(request):
     """HTTP Cloud Function to infer transaction category."""
     request_id = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
+    
+    # Every record logged while handling the request carries its id
+    with request_context(request_id), metrics.request_metrics() as request_metrics:
+        started_at = time.time()
+        started = time.perf_counter()
+        trace = {} if tracer is not None and tracer.should_sample(request_id) else None
+        profile = profiler.session(request, request_id)
+        with profile or nullcontext(), metrics.stage_memory('request'):
+            response = handle_request(request, request_id, trace)
+        elapsed = time.perf_counter() - started
+        if profile is not None:
+            response[2].update(profile.headers())
+        
+        if trace and 'transactions' in trace:
+            tracer.record(trace['transactions'], response[1], elapsed, started_at)
+        # Scrapes and preflights are not prediction requests
+        if request.method == 'POST':
+            metrics.finish_request(request_metrics, response[1], elapsed)
+        return response
+
+def handle_request(request, request_id, trace=None):
+    """Handle one request to the function.
+    
+    When ``trace`` is a dict, the request's transactions are stored in it
+    for the trace recorder.
+    """
     logger.info(f"Processing request {request_id}")
     
     # Set CORS headers for the preflight request
     if request.method == 'OPTIONS':
         headers = {
             'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'POST',
-            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Allow-Methods': 'GET, POST',
+            'Access-Control-Allow-Headers': 'Content-Type, Content-Encoding, Authorization, X-Caller-Key, X-Profile, X-Profile-Token',
             'Access-Control-Max-Age': '3600'
         }
         return ('', 204, headers)
@@ -75,17 +329,76 @@ def infer_category(request):
     # Set CORS headers for the main request
     headers = {
         'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'X-RateLimit-Limit, X-RateLimit-Remaining, X-RateLimit-Reset, X-Model-Version, X-Profile-Status, X-Profile-Id',
         'Content-Type': 'application/json'
     }
     
+    # Every response reports the caller's quota; predictions and usage
+    # need an identity the server trusts
+    caller = get_caller_id(request)
+    if caller is not None:
+        headers.update(meter.headers(meter.usage(caller)))
+    elif request.method == 'POST' or request.path.rstrip('/').endswith('/usage'):
+        return (json.dumps({
+            'error': 'UNAUTHORIZED',
+            'message': 'A valid X-Caller-Key or invoker token is required',
+            'success': False,
+            'request_id': request_id
+        }), 401, headers)
+    
+    if request.method == 'GET':
+        return handle_get(request, request_id, headers, caller)
+    
     try:
-        # Initialize predictor if needed
-        if predictor is None:
+        # Initialize predictor if needed; keep a local reference for the
+        # rest of the request
+        active_predictor = predictor
+        if active_predictor is None:
             logger.info(f"[{request_id}] Initializing predictor...")
-            initialize_predictor(request_id)
+            active_predictor = initialize_predictor(request_id)
+        # A hot reload may have swapped the coalescer since; only batch with
+        # requests served by the same predictor
+        active_coalescer = coalescer
+        if active_coalescer is not None and active_coalescer.predictor is not active_predictor:
+            active_coalescer = None
+        headers['X-Model-Version'] = active_predictor.model_version
         
-        # Get request data
-        request_json = request.get_json()
+        # Get request data (JSON, or an Arrow / Parquet table of transactions),
+        # decompressing gzip / zstd bodies
+        try:
+            request_json = decode_request(request, read_request_body(request, MAX_REQUEST_BYTES))
+        except PayloadTooLarge as e:
+            logger.warning(f"[{request_id}] {str(e)}")
+            return (json.dumps({
+                'error': 'PAYLOAD_TOO_LARGE',
+                'message': str(e),
+                'success': False,
+                'request_id': request_id
+            }), 413, headers)
+        except InvalidEncoding as e:
+            logger.warning(f"[{request_id}] {str(e)}")
+            return (json.dumps({
+                'error': 'INVALID_ENCODING',
+                'message': str(e),
+                'success': False,
+                'request_id': request_id
+            }), 400, headers)
+        except InvalidBody as e:
+            logger.warning(f"[{request_id}] {str(e)}")
+            return (json.dumps({
+                'error': 'INVALID_BODY',
+                'message': str(e),
+                'success': False,
+                'request_id': request_id
+            }), 400, headers)
+        except (UnsupportedMediaType, UnsupportedEncoding) as e:
+            logger.warning(f"[{request_id}] {str(e)}")
+            return (json.dumps({
+                'error': 'UNSUPPORTED_MEDIA_TYPE',
+                'message': str(e),
+                'success': False,
+                'request_id': request_id
+            }), 415, headers)
         if not request_json:
             logger.warning(f"[{request_id}] No JSON data in request")
             return (json.dumps({
@@ -103,7 +416,7 @@ def infer_category(request):
             }), 400, headers)
         
         transactions = request_json['transactions']
-        if not transactions:
+        if len(transactions) == 0:
             logger.warning(f"[{request_id}] Empty transactions list")
             return (json.dumps({
                 'error': 'Empty transactions list',
@@ -112,29 +425,127 @@ def infer_category(request):
             }), 400, headers)
         
         logger.info(f"[{request_id}] Processing {len(transactions)} transactions")
+        if trace is not None:
+            trace['transactions'] = transactions
+        metrics.annotate(rows=len(transactions))
         
-        # Get predictions
+        # Shed load before doing any work on the batch
         try:
-            results = predictor.predict(transactions)
-            
-            response_data = {
-                'success': True,
-                'results': results,
-                'request_id': request_id,
-                'mode': 'mock' if predictor.use_mock else 'smart-categories'
-            }
-            
-            logger.info(f"[{request_id}] Successfully processed {len(results)} transactions")
-            return (json.dumps(response_data), 200, headers)
-            
-        except Exception as e:
-            logger.error(f"[{request_id}] Error during prediction: {str(e)}")
+            ticket = admission.admit(len(transactions))
+        except AdmissionRejected as e:
+            headers['Retry-After'] = str(e.retry_after)
             return (json.dumps({
-                'error': str(e),
+                'error': 'OVERLOADED',
+                'message': str(e),
+                'retry_after': e.retry_after,
                 'success': False,
                 'request_id': request_id
-            }), 500, headers)
-            
+            }), 503, headers)
+        
+        with ticket:
+            # Get predictions; ``charged`` is what the caller still pays for,
+            # so nothing is refunded twice
+            charged = 0
+            try:
+                # Skip rows whose content and model version match a fingerprint
+                # the caller already has a prediction for
+                model_version = active_predictor.model_version
+                changed, fingerprints, unchanged_ids = split_changed(
+                    transactions, model_version, request_json.get('if_none_match')
+                )
+                if request_json.get('if_none_match'):
+                    metrics.record_cache('fingerprint', len(unchanged_ids), len(changed))
+                
+                # Charge the rows we are about to predict, rejecting the whole
+                # batch before any preprocessing if it does not fit the budget
+                cells = meter.cost(len(changed))
+                allowed, usage = meter.try_consume(caller, cells)
+                headers.update(meter.headers(usage))
+                if not allowed:
+                    headers['Retry-After'] = str(max(1, usage['reset'] - int(time.time())))
+                    return (json.dumps({
+                        'error': 'QUOTA_EXCEEDED',
+                        'message': f"Batch needs {cells} cells but only {usage['remaining']} remain",
+                        'next_available_at': usage['reset_at'],
+                        'success': False,
+                        'request_id': request_id
+                    }), 429, headers)
+                charged = cells
+                
+                if len(changed) == 0:
+                    results = {
+                        'success': True,
+                        'results': [],
+                        'errors': [],
+                        'total_processed': 0,
+                        'total_errors': 0
+                    }
+                elif active_coalescer is not None:
+                    # Coalesced batches are merged as lists of rows
+                    if hasattr(changed, 'to_dict'):
+                        changed = changed.to_dict('records')
+                    results = active_coalescer.submit(changed)
+                else:
+                    results = active_predictor.predict(changed)
+                
+                failed = isinstance(results, dict) and not results.get('success', True)
+                metrics.annotate(mode='error' if failed else 'mock' if active_predictor.use_mock else 'tabpfn')
+                if failed and charged:
+                    meter.refund(caller, charged)
+                    charged = 0
+                    headers.update(meter.headers(meter.usage(caller)))
+                
+                result_rows = results.get('results', []) if isinstance(results, dict) else results
+                
+                # Rows answered by a local cascade tier did not use TabPFN cells
+                local_rows = sum(1 for r in result_rows if r.get('tier', 'tabpfn') != 'tabpfn')
+                if local_rows and charged:
+                    local_cells = min(charged, meter.cost(local_rows))
+                    meter.refund(caller, local_cells)
+                    charged -= local_cells
+                    headers.update(meter.headers(meter.usage(caller)))
+                if len(result_rows) == len(fingerprints):
+                    for result, fingerprint in zip(result_rows, fingerprints):
+                        result['fingerprint'] = fingerprint
+                
+                # Compact mode drops fields that only echo the request
+                if is_compact(request, request_json):
+                    if isinstance(results, dict):
+                        results['results'] = compact_results(result_rows)
+                    else:
+                        results = compact_results(result_rows)
+                
+                response_data = {
+                    'success': True,
+                    'results': results,
+                    'unchanged': unchanged_ids,
+                    'model_version': model_version,
+                    'request_id': request_id,
+                    'mode': 'mock' if active_predictor.use_mock else 'smart-categories'
+                }
+                if memory_accounting.enabled() and metrics.request_memory():
+                    response_data['memory'] = metrics.request_memory()
+                
+                response_format = negotiate_response_format(request)
+                headers['Content-Type'] = response_format
+                headers['Vary'] = 'Accept'
+                
+                logger.info(f"[{request_id}] Successfully processed {len(changed)} transactions, {len(unchanged_ids)} unchanged")
+                with metrics.stage_memory('encode'):
+                    body = compress_response(request, encode_response(response_data, response_format), headers, COMPRESS_MIN_BYTES)
+                return (body, 200, headers)
+                
+            except Exception as e:
+                logger.error(f"[{request_id}] Error during prediction: {str(e)}")
+                if charged:
+                    meter.refund(caller, charged)
+                    headers.update(meter.headers(meter.usage(caller)))
+                return (json.dumps({
+                    'error': str(e),
+                    'success': False,
+                    'request_id': request_id
+                }), 500, headers)
+                
     except Exception as e:
         logger.error(f"[{request_id}] Error in infer_category: {str(e)}")
         return (json.dumps({
@@ -0,0 +1,121 @@
+"""
+Optional memory accounting of prediction stages.
+
+With MEMORY_ACCOUNTING=true, tracemalloc traces Python allocations (numpy
+and pandas buffers included) and ``measure`` reports, for the code run
+inside it:
+
+- ``peak_alloc_mb``: highest traced memory above what was allocated on entry
+- ``retained_mb``: traced memory still held on exit
+- ``rss_mb`` / ``max_rss_mb``: resident set size on exit, and the process's
+  high-water mark (what the OOM killer sees)
+
+tracemalloc has one peak counter for the whole process: measurements that
+overlap (nested stages, concurrent requests) fold the peak into each other
+before it is reset, so an outer stage's peak covers its inner stages, and
+stages of concurrent requests are charged for each other's allocations.
+Tracing slows allocation-heavy code down noticeably; enable it to find the
+stage responsible for memory growth, not permanently.
+"""
+
+import os
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+_enabled = False
+_lock = threading.Lock()
+# Peaks of the measurements currently open, anywhere in the process
+_open = []
+
+
+def enabled():
+    return _enabled
+
+
+def enable():
+    """Start tracing allocations (idempotent)."""
+    global _enabled
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def rss_bytes():
+    """Current resident set size, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def max_rss_bytes():
+    """High-water mark of the resident set size, or None."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return max_rss if os.uname().sysname == 'Darwin' else max_rss * 1024
+
+
+def _fold_peak():
+    """Credit the current peak to every open measurement; call with _lock held."""
+    _, peak = tracemalloc.get_traced_memory()
+    for measurement in _open:
+        measurement['peak'] = max(measurement['peak'], peak)
+
+
+def _mb(n_bytes):
+    return None if n_bytes is None else round(n_bytes / MB, 3)
+
+
+@contextmanager
+def measure():
+    """Yield a dict filled, on exit, with the memory used inside the block (empty when disabled)."""
+    usage = {}
+    if not _enabled or not tracemalloc.is_tracing():
+        yield usage
+        return
+
+    with _lock:
+        _fold_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        measurement = {'peak': start}
+        _open.append(measurement)
+        tracemalloc.reset_peak()
+    try:
+        yield usage
+    finally:
+        with _lock:
+            _fold_peak()
+            # By identity: measurements with equal peaks compare equal
+            _open[:] = [m for m in _open if m is not measurement]
+            current, _ = tracemalloc.get_traced_memory()
+        usage.update(
+            peak_alloc_mb=_mb(max(0, measurement['peak'] - start)),
+            retained_mb=_mb(current - start),
+            rss_mb=_mb(rss_bytes()),
+            max_rss_mb=_mb(max_rss_bytes())
+        )
+
+
+if os.getenv('MEMORY_ACCOUNTING', '').lower() == 'true':
+    enable()
@@ -0,0 +1,301 @@
+import os
+import hmac
+import json
+import time
+import base64
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryUsageStore:
+    """Usage counters kept in process memory (per instance, lost on restart)."""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires_at = self._values.get(key, (0, None))
+            if expires_at is not None and expires_at <= time.time():
+                del self._values[key]
+                return 0
+            return value
+
+    def incr(self, key, amount, ttl):
+        with self._lock:
+            value, expires_at = self._values.get(key, (0, None))
+            if expires_at is not None and expires_at <= time.time():
+                value = 0
+            value += amount
+            self._values[key] = (value, time.time() + ttl)
+            return value
+
+
+class FileUsageStore:
+    """Usage counters in a JSON file, shared by processes on the same host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._locked():
+            return self._read().get(key, {}).get('value', 0)
+
+    def incr(self, key, amount, ttl):
+        with self._locked():
+            values = self._read()
+            entry = values.get(key, {'value': 0})
+            entry['value'] += amount
+            entry['expires_at'] = time.time() + ttl
+            values[key] = entry
+            self._write(values)
+            return entry['value']
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                values = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        now = time.time()
+        return {k: v for k, v in values.items() if v.get('expires_at', now + 1) > now}
+
+    def _write(self, values):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(values, f)
+        os.replace(tmp_path, self.path)
+
+    def _locked(self):
+        return _FileLock(f"{self.path}.lock", self._lock)
+
+
+class _FileLock:
+    """Thread lock plus an exclusive flock on a lock file where available."""
+
+    def __init__(self, path, thread_lock):
+        self.path = path
+        self.thread_lock = thread_lock
+        self.file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            self.file = open(self.path, 'a')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+
+class RedisUsageStore:
+    """Usage counters in Redis or any client exposing get/incrby/expire."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(key)
+        return int(value) if value is not None else 0
+
+    def incr(self, key, amount, ttl):
+        value = self.client.incrby(key, amount)
+        self.client.expire(key, int(ttl))
+        return int(value)
+
+
+def create_usage_store(url):
+    """Create a usage store from a URL: memory://, file:///path or redis://host:port/db."""
+    if not url or url.startswith('memory://'):
+        return InMemoryUsageStore()
+    if url.startswith('file://'):
+        return FileUsageStore(url[len('file://'):])
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis package is required for redis:// usage stores")
+        return RedisUsageStore(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported usage store URL: {url}")
+
+
+class QuotaMeter:
+    """Track TabPFN cells consumed per caller against a daily (UTC) budget.
+
+    Args:
+        store: Usage store holding the counters.
+        limit_cells: Cells each caller may consume per day.
+        cells_per_row: Cells consumed by one predicted row.
+    """
+
+    def __init__(self, store, limit_cells, cells_per_row):
+        self.store = store
+        self.limit_cells = limit_cells
+        self.cells_per_row = cells_per_row
+
+    def cost(self, n_rows):
+        """Cells consumed by predicting ``n_rows`` rows."""
+        return n_rows * self.cells_per_row
+
+    def usage(self, caller, now=None):
+        """Current usage for a caller."""
+        now = now or datetime.now(timezone.utc)
+        used = self.store.get(self._key(caller, now))
+        return self._usage(used, now)
+
+    def try_consume(self, caller, cells, now=None):
+        """Charge ``cells`` to a caller if it fits in the remaining budget.
+
+        Returns:
+            Tuple of (allowed, usage after the call)
+        """
+        now = now or datetime.now(timezone.utc)
+        key = self._key(caller, now)
+        ttl = self._seconds_to_reset(now)
+
+        used = self.store.incr(key, cells, ttl)
+        if used > self.limit_cells:
+            # Roll back so a rejected batch does not eat the remaining budget
+            used = self.store.incr(key, -cells, ttl)
+            logger.warning(f"Quota exceeded for {caller}: requested {cells} cells, {self.limit_cells - used} remaining")
+            return False, self._usage(used, now)
+        return True, self._usage(used, now)
+
+    def refund(self, caller, cells, now=None):
+        """Give back cells charged for work that failed."""
+        now = now or datetime.now(timezone.utc)
+        self.store.incr(self._key(caller, now), -cells, self._seconds_to_reset(now))
+
+    def headers(self, usage):
+        """Rate-limit response headers for a usage dict."""
+        return {
+            'X-RateLimit-Limit': str(usage['limit']),
+            'X-RateLimit-Remaining': str(usage['remaining']),
+            'X-RateLimit-Reset': str(usage['reset'])
+        }
+
+    def _key(self, caller, now):
+        return f"usage:{caller}:{now.strftime('%Y%m%d')}"
+
+    def _reset_time(self, now):
+        return (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _seconds_to_reset(self, now):
+        return max(1, (self._reset_time(now) - now).total_seconds())
+
+    def _usage(self, used, now):
+        reset_time = self._reset_time(now)
+        return {
+            'limit': self.limit_cells,
+            'used': used,
+            'remaining': max(0, self.limit_cells - used),
+            'reset': int(reset_time.timestamp()),
+            'reset_at': reset_time.isoformat()
+        }
+
+
+class CallerIdentity:
+    """Identify the caller a request is charged to, from something the server can trust.
+
+    In order of preference:
+
+    - ``keys``: caller name -> secret; the request must carry one of the
+      secrets in ``X-Caller-Key``
+    - ``trust_invoker``: the function only accepts authenticated invocations,
+      so the platform has already verified the ``Authorization`` ID token and
+      its ``email`` (or ``sub``) claim names the caller
+    - otherwise the client address, taken from ``X-Forwarded-For`` as written
+      by the last ``trusted_proxy_hops`` proxies (entries further left are
+      supplied by the client and ignored)
+
+    Client-chosen headers such as ``X-Caller-Id`` are never used, so a caller
+    cannot reset its quota by changing them.
+    """
+
+    def __init__(self, keys=None, trust_invoker=False, trusted_proxy_hops=0):
+        self.keys = dict(keys or {})
+        self.trust_invoker = trust_invoker
+        self.trusted_proxy_hops = trusted_proxy_hops
+
+    @property
+    def requires_credentials(self):
+        return bool(self.keys) or self.trust_invoker
+
+    def identify(self, request):
+        """The caller's identity, or None when the request lacks valid credentials."""
+        if self.keys:
+            key = request.headers.get('X-Caller-Key', '')
+            for caller, secret in self.keys.items():
+                if key and hmac.compare_digest(key, secret):
+                    return f"key:{caller}"
+            return None
+        if self.trust_invoker:
+            claims = _bearer_claims(request.headers.get('Authorization', ''))
+            caller = claims.get('email') or claims.get('sub')
+            return f"invoker:{caller}" if caller else None
+        return self._client_address(request)
+
+    def _client_address(self, request):
+        if self.trusted_proxy_hops > 0:
+            forwarded_for = [
+                address.strip()
+                for address in request.headers.get('X-Forwarded-For', '').split(',')
+                if address.strip()
+            ]
+            if len(forwarded_for) >= self.trusted_proxy_hops:
+                return forwarded_for[-self.trusted_proxy_hops]
+        return request.remote_addr or 'anonymous'
+
+
+def _bearer_claims(authorization):
+    """Claims of a bearer JWT, without verifying it (the platform did); {} if malformed."""
+    scheme, _, token = authorization.partition(' ')
+    parts = token.strip().split('.')
+    if scheme.lower() != 'bearer' or len(parts) != 3:
+        return {}
+    try:
+        payload = base64.urlsafe_b64decode(parts[1] + '=' * (-len(parts[1]) % 4))
+        claims = json.loads(payload)
+    except (ValueError, TypeError):
+        return {}
+    return claims if isinstance(claims, dict) else {}
+
+
+def parse_caller_keys(value):
+    """Parse ``name=secret,name2=secret2`` into a dict."""
+    keys = {}
+    for entry in filter(None, (entry.strip() for entry in value.split(','))):
+        name, _, secret = entry.partition('=')
+        if not name or not secret:
+            raise ValueError("CALLER_KEYS entries must look like name=secret")
+        keys[name] = secret
+    return keys
+
+
+def create_caller_identity():
+    """CallerIdentity configured from CALLER_KEYS, QUOTA_TRUST_INVOKER and TRUSTED_PROXY_HOPS.
+
+    Cloud Functions sit behind one Google front end that appends the client
+    address to X-Forwarded-For, so one hop is trusted there by default.
+    """
+    default_hops = '1' if 'K_SERVICE' in os.environ else '0'
+    return CallerIdentity(
+        keys=parse_caller_keys(os.getenv('CALLER_KEYS', '')),
+        trust_invoker=os.getenv('QUOTA_TRUST_INVOKER', 'false').lower() == 'true',
+        trusted_proxy_hops=int(os.getenv('TRUSTED_PROXY_HOPS', default_hops))
+    )
@@ -0,0 +1,342 @@
+"""
+Prometheus-style metrics for the prediction service.
+
+A small thread-safe registry of counters and histograms, rendered in the
+Prometheus text exposition format by ``GET /metrics``. Instances keep their
+own counts; scrape each one (or aggregate the per-request log records).
+
+Besides the process-wide registry, every request gets a record of what it
+did (rows, mode, time per stage, TabPFN calls, cache hits, and with
+MEMORY_ACCOUNTING the memory of each stage), opened with request_metrics.
+finish_request folds it into the registry and, on Cloud Functions where
+instances are not scraped, logs it as one structured record (``metrics``
+field) per request.
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import memory_accounting
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Latency buckets in seconds, up to the slowest TabPFN calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Log one metrics record per request (default: on Cloud Functions / Cloud Run)
+METRICS_LOG_REQUESTS = os.getenv('METRICS_LOG_REQUESTS', 'true' if 'K_SERVICE' in os.environ else 'false').lower() == 'true'
+
+_request = contextvars.ContextVar('request_metrics', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter, one series per label combination."""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label combination."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    _key = Counter._key
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series['count'] if series else 0
+
+    def samples(self):
+        with self._lock:
+            series_by_key = {key: dict(series, buckets=list(series['buckets'])) for key, series in self._series.items()}
+        samples = []
+        for key, series in sorted(series_by_key.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['buckets']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                samples.append((f'{self.name}_bucket', labels, cumulative))
+            labels = _format_labels(self.labelnames, key)
+            samples.append((f'{self.name}_sum', labels, series['sum']))
+            samples.append((f'{self.name}_count', labels, series['count']))
+        return samples
+
+
+class Gauge:
+    """Value that goes up and down, set directly or read from a function at render time."""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = ()
+        self._value = 0.0
+        self._function = None
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def set_function(self, function):
+        """Render the value ``function()`` returns instead of the set one."""
+        with self._lock:
+            self._function = function
+
+    def value(self):
+        with self._lock:
+            function, value = self._function, self._value
+        return function() if function is not None else value
+
+    def samples(self):
+        return [(self.name, '', self.value())]
+
+
+class MetricsRegistry:
+    """Named metrics rendered together in the text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation):
+        return self._register(Gauge(name, documentation))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.counter(
+    'infer_category_requests_total', 'Prediction requests handled', ('mode', 'status'))
+ROWS = REGISTRY.counter(
+    'infer_category_rows_total', 'Transactions received in prediction requests', ('mode',))
+REQUEST_LATENCY = REGISTRY.histogram(
+    'infer_category_request_seconds', 'Latency of prediction requests', ('mode',))
+STAGE_LATENCY = REGISTRY.histogram(
+    'infer_category_stage_seconds', 'Time spent in each prediction stage', ('stage', 'mode'))
+CACHE_LOOKUPS = REGISTRY.counter(
+    'infer_category_cache_lookups_total', 'Rows looked up in the fingerprint cache and the local tiers', ('cache', 'result'))
+TABPFN_CALLS = REGISTRY.counter(
+    'tabpfn_calls_total', 'Calls to the TabPFN tier', ('outcome',))
+KEYWORD_CALLS = REGISTRY.counter(
+    'keyword_standin_calls_total', 'Escalated batches answered by the keyword stand-in (no TABPFN_API_URL)')
+TABPFN_RATE_LIMITED = REGISTRY.counter(
+    'tabpfn_rate_limit_events_total', 'TabPFN calls rejected by the API rate limit')
+ADMISSION_DECISIONS = REGISTRY.counter(
+    'admission_requests_total', 'Requests admitted or shed by admission control', ('result',))
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    'admission_queue_depth', 'Requests waiting for capacity')
+ADMISSION_QUEUED_ROWS = REGISTRY.gauge(
+    'admission_queued_rows', 'Rows of the requests waiting for capacity')
+ADMISSION_INFLIGHT_ROWS = REGISTRY.gauge(
+    'admission_inflight_rows', 'Rows being processed')
+
+
+def render():
+    return REGISTRY.render()
+
+
+@contextmanager
+def request_metrics():
+    """Collect the metrics of the current request into a fresh record."""
+    record = {'stages': {}, 'cache': {}, 'tabpfn_calls': 0, 'keyword_calls': 0, 'rate_limited': 0}
+    token = _request.set(record)
+    try:
+        yield record
+    finally:
+        _request.reset(token)
+
+
+def annotate(**fields):
+    """Set fields (rows, mode, ...) of the current request's record."""
+    record = _request.get()
+    if record is not None:
+        record.update(fields)
+
+
+def observe_stage(stage, mode, seconds):
+    STAGE_LATENCY.observe(seconds, stage=stage, mode=mode)
+    record = _request.get()
+    if record is not None:
+        record['stages'][stage] = round(record['stages'].get(stage, 0.0) + seconds, 6)
+
+
+@contextmanager
+def stage_memory(stage):
+    """Record the memory used by a stage in the request's record (MEMORY_ACCOUNTING only)."""
+    with memory_accounting.measure() as usage:
+        yield
+    record = _request.get()
+    if usage and record is not None:
+        previous = record.setdefault('memory', {}).get(stage)
+        if previous is not None:
+            # Repeated stages (one per chunk) keep their worst peak
+            usage = dict(usage, peak_alloc_mb=max(usage['peak_alloc_mb'], previous['peak_alloc_mb']))
+        record['memory'][stage] = usage
+
+
+def request_memory():
+    """Memory per stage recorded so far for the current request, or None."""
+    record = _request.get()
+    return None if record is None else record.get('memory')
+
+
+@contextmanager
+def timed_stage(stage, mode='tabpfn'):
+    """Time a stage, and account its memory; stages that raise are recorded under mode 'error'."""
+    started = time.perf_counter()
+    try:
+        with stage_memory(stage):
+            yield
+    except BaseException:
+        observe_stage(stage, 'error', time.perf_counter() - started)
+        raise
+    observe_stage(stage, mode, time.perf_counter() - started)
+
+
+def record_cache(cache, hits, misses):
+    if hits:
+        CACHE_LOOKUPS.inc(hits, cache=cache, result='hit')
+    if misses:
+        CACHE_LOOKUPS.inc(misses, cache=cache, result='miss')
+    record = _request.get()
+    if record is not None:
+        counts = record['cache'].setdefault(cache, {'hit': 0, 'miss': 0})
+        counts['hit'] += hits
+        counts['miss'] += misses
+
+
+def record_tabpfn_call(outcome):
+    TABPFN_CALLS.inc(outcome=outcome)
+    record = _request.get()
+    if record is not None:
+        record['tabpfn_calls'] += 1
+
+
+def record_keyword_call():
+    KEYWORD_CALLS.inc()
+    record = _request.get()
+    if record is not None:
+        record['keyword_calls'] += 1
+
+
+def record_rate_limit():
+    TABPFN_RATE_LIMITED.inc()
+    record = _request.get()
+    if record is not None:
+        record['rate_limited'] += 1
+
+
+def finish_request(record, status, latency_s, log_record=None):
+    """Fold a request's record into the registry, and log it when enabled.
+
+    Requests that did not get as far as a prediction are counted under
+    mode 'error'.
+    """
+    mode = record.get('mode') or 'error'
+    if status >= 500:
+        mode = 'error'
+    record.update(mode=mode, status=status, latency_s=round(latency_s, 6))
+    REQUESTS.inc(mode=mode, status=status)
+    ROWS.inc(record.get('rows', 0), mode=mode)
+    REQUEST_LATENCY.observe(latency_s, mode=mode)
+    if METRICS_LOG_REQUESTS if log_record is None else log_record:
+        logger.info("Request metrics", extra={'metrics': record})
+    elif 'memory' in record:
+        logger.info("Request memory", extra={'memory': record['memory'], 'rows': record.get('rows', 0)})
@@ -0,0 +1,472 @@
+"""
+Nearest-neighbor label reuse for previously categorized transactions.
+
+Transactions from the same merchant differ mostly by reference numbers,
+which the TF-IDF vocabulary ignores, so their text embeddings are nearly
+identical. A vector index over the desc_emb_* embeddings and the amount of
+past predictions lets TransactionPredictor reuse a neighbor's label instead
+of calling a model.
+
+Two index kinds share one interface (add / predict / save / load):
+- BruteForceIndex: exact cosine similarity with numpy, for up to ~100k rows
+- IVFIndex: k-means inverted lists over int8-quantized vectors, probing only
+  the lists closest to the query, for millions of rows
+
+Indexes are persisted as .npy files in a directory and memory-mapped back,
+so a large index does not have to fit in the heap of every instance. Each
+save writes a new generation of files and publishes it by replacing
+meta.json, so readers never see a mix of two saves. Rows added at runtime
+are kept apart until the next save, which folds them into the
+memory-mapped base; ``grow_index`` turns a brute-force index that has grown
+past BRUTE_FORCE_MAX_ROWS into an IVF one.
+
+Build an index offline from labeled history with:
+    python neighbors.py --data labeled.csv --transformers models/tabpfn-client/transformers.pkl --output neighbor-index
+"""
+
+import os
+import json
+import pickle
+import logging
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_PREFIX = 'desc_emb_'
+
+# Above this many rows build_index builds an IVF index instead of a brute-force one
+BRUTE_FORCE_MAX_ROWS = 100000
+
+# Indexed rows compared per matrix product, bounding the similarity matrix size
+SEARCH_BLOCK_ROWS = 16384
+
+
+def feature_vectors(features, amount_weight=0.5):
+    """Unit vectors over the text embeddings and the (scaled) amount.
+
+    Args:
+        features: DataFrame from preprocess_inference_data
+        amount_weight: Relative weight of the amount against the embeddings
+
+    Returns:
+        float32 array of shape (n_rows, n_embeddings + 1)
+    """
+    embedding_cols = sorted(
+        (col for col in features.columns if col.startswith(EMBEDDING_PREFIX)),
+        key=lambda col: int(col[len(EMBEDDING_PREFIX):])
+    )
+    vectors = np.hstack([
+        features[embedding_cols].to_numpy(dtype=np.float32),
+        amount_weight * features[['amount']].to_numpy(dtype=np.float32)
+    ])
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _nearest(queries, vectors, labels):
+    """Label and cosine similarity of each query's nearest row."""
+    best_labels = np.full(len(queries), '', dtype=object)
+    best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+    for start in range(0, len(labels), SEARCH_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+        similarities = queries @ block.T
+        nearest = similarities.argmax(axis=1)
+        scores = similarities[np.arange(len(queries)), nearest]
+        better = scores > best_scores
+        best_scores[better] = scores[better]
+        best_labels[better] = labels[start:start + SEARCH_BLOCK_ROWS][nearest[better]]
+    return best_labels, best_scores
+
+
+class BruteForceIndex:
+    """Exact nearest-neighbor index: one matrix product per query batch."""
+
+    kind = 'brute_force'
+
+    def __init__(self, dim=None, amount_weight=0.5):
+        self.dim = dim
+        self.amount_weight = amount_weight
+        self._vectors = np.zeros((0, dim or 0), dtype=np.float32)
+        self._labels = np.zeros(0, dtype=str)
+        # Rows added since the last save, kept apart so a memory-mapped
+        # base never has to be copied on every add
+        self._new_vectors = []
+        self._new_labels = []
+        self._lock = threading.Lock()
+        # Generation of the saved files the base comes from (None: never saved)
+        self.version = None
+
+    def __len__(self):
+        return len(self._labels) + sum(len(labels) for labels in self._new_labels)
+
+    def add(self, features, labels):
+        """Add categorized rows given their preprocessed features."""
+        self.add_vectors(feature_vectors(features, self.amount_weight), labels)
+
+    def add_vectors(self, vectors, labels):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self._new_vectors.append(vectors)
+            self._new_labels.append(np.asarray(labels, dtype=str))
+
+    def predict(self, features):
+        """Label of the most similar indexed row, used as a cascade tier.
+
+        Returns:
+            Tuple of (categories, similarities) arrays; similarity is 0 when
+            the index is empty
+        """
+        return self.search(feature_vectors(features, self.amount_weight))
+
+    def search(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        best_labels = np.full(len(vectors), '', dtype=object)
+        best_scores = np.zeros(len(vectors), dtype=np.float32)
+        with self._lock:
+            blocks = [(self._vectors, self._labels)] + list(zip(self._new_vectors, self._new_labels))
+        for block_vectors, block_labels in blocks:
+            if len(block_labels) == 0:
+                continue
+            labels, scores = _nearest(vectors, block_vectors, block_labels)
+            better = scores > best_scores
+            best_scores[better] = scores[better]
+            best_labels[better] = labels[better]
+        return best_labels, best_scores
+
+    def _all_rows(self):
+        with self._lock:
+            vectors = np.vstack([np.asarray(self._vectors)] + self._new_vectors) if self.dim else self._vectors
+            labels = np.concatenate([np.asarray(self._labels)] + self._new_labels)
+            n_blocks = len(self._new_labels)
+        return vectors, labels, n_blocks
+
+    def pending_vectors(self):
+        """Vectors and labels of the rows added since the last save."""
+        with self._lock:
+            if not self._new_labels:
+                return np.zeros((0, self.dim or 0), dtype=np.float32), np.zeros(0, dtype=str)
+            return np.vstack(self._new_vectors), np.concatenate(self._new_labels)
+
+    def save(self, path):
+        """Write the index to ``path`` (a directory) and serve the saved rows from it.
+
+        Rows added while the index is written stay pending until the next save.
+        """
+        vectors, labels, n_blocks = self._all_rows()
+        meta = _write_arrays(path, {'vectors': vectors, 'labels': labels}, self._meta())
+        arrays = _read_arrays(path, meta)
+        with self._lock:
+            self._vectors, self._labels = arrays['vectors'], arrays['labels']
+            del self._new_vectors[:n_blocks]
+            del self._new_labels[:n_blocks]
+            self.version = meta['version']
+
+    def to_ivf(self, n_lists=None, n_probe=8):
+        """An IVF index holding the saved rows (pending ones are left out, all of its rows are pending)."""
+        with self._lock:
+            vectors, labels = np.asarray(self._vectors), np.asarray(self._labels)
+        index = IVFIndex.train(vectors, n_lists=n_lists, amount_weight=self.amount_weight, n_probe=n_probe)
+        index.add_vectors(vectors, labels)
+        return index
+
+    def _meta(self):
+        return {'kind': self.kind, 'dim': self.dim, 'amount_weight': self.amount_weight}
+
+    @classmethod
+    def _from_arrays(cls, meta, arrays):
+        index = cls(dim=meta['dim'], amount_weight=meta['amount_weight'])
+        index._vectors = arrays['vectors']
+        index._labels = arrays['labels']
+        return index
+
+
+class IVFIndex:
+    """Approximate index with inverted lists and int8 scalar quantization.
+
+    Vectors are assigned to the nearest of ``n_lists`` k-means centroids and
+    stored quantized to int8 (4x smaller than float32), grouped by list. A
+    query only scans the ``n_probe`` lists whose centroids are closest.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, centroids, amount_weight=0.5, n_probe=8):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.dim = self.centroids.shape[1]
+        self.amount_weight = amount_weight
+        self.n_probe = n_probe
+        n_lists = len(self.centroids)
+        # Base rows, sorted by list: list l holds codes[offsets[l]:offsets[l + 1]]
+        self._codes = np.zeros((0, self.dim), dtype=np.int8)
+        self._labels = np.zeros(0, dtype=str)
+        self._offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        # Rows added since the last save, per list
+        self._new = [([], []) for _ in range(n_lists)]
+        self._n_new = 0
+        self._lock = threading.Lock()
+        self.version = None
+
+    @classmethod
+    def train(cls, vectors, n_lists=None, amount_weight=0.5, n_probe=8, random_state=0):
+        """Learn the coarse quantizer from a sample of vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, n_init=1, random_state=random_state).fit(vectors)
+        centroids = kmeans.cluster_centers_
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return cls(centroids / norms, amount_weight=amount_weight, n_probe=n_probe)
+
+    def __len__(self):
+        return len(self._labels) + self._n_new
+
+    @staticmethod
+    def _quantize(vectors):
+        # Unit vectors have components in [-1, 1]
+        return np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8)
+
+    def _nearest_lists(self, vectors, n):
+        scores = vectors @ self.centroids.T
+        if n >= len(self.centroids):
+            return np.tile(np.arange(len(self.centroids)), (len(vectors), 1))
+        return np.argpartition(-scores, n - 1, axis=1)[:, :n]
+
+    def add(self, features, labels):
+        """Add categorized rows given their preprocessed features."""
+        self.add_vectors(feature_vectors(features, self.amount_weight), labels)
+
+    def add_vectors(self, vectors, labels):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        lists = self._nearest_lists(vectors, 1)[:, 0]
+        codes = self._quantize(vectors)
+        with self._lock:
+            for list_id, code, label in zip(lists, codes, labels):
+                self._new[list_id][0].append(code)
+                self._new[list_id][1].append(str(label))
+            self._n_new += len(vectors)
+
+    def predict(self, features):
+        """Label of the most similar indexed row among the probed lists.
+
+        Returns:
+            Tuple of (categories, approximate similarities) arrays
+        """
+        return self.search(feature_vectors(features, self.amount_weight))
+
+    def search(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        best_labels = np.full(len(vectors), '', dtype=object)
+        best_scores = np.zeros(len(vectors), dtype=np.float32)
+        if len(self) == 0:
+            return best_labels, best_scores
+
+        probes = self._nearest_lists(vectors, self.n_probe)
+        # Group queries by probed list so each list is scanned once per batch
+        for list_id in np.unique(probes):
+            rows = np.flatnonzero((probes == list_id).any(axis=1))
+            codes, labels = self._list_rows(list_id)
+            if len(labels) == 0:
+                continue
+            labels, scores = _nearest(vectors[rows], codes.astype(np.float32) / 127, labels)
+            better = scores > best_scores[rows]
+            best_scores[rows[better]] = scores[better]
+            best_labels[rows[better]] = labels[better]
+        return best_labels, best_scores
+
+    def _list_rows(self, list_id):
+        with self._lock:
+            start, end = self._offsets[list_id], self._offsets[list_id + 1]
+            codes, labels = self._codes[start:end], self._labels[start:end]
+            new_codes, new_labels = self._new[list_id]
+            if new_codes:
+                codes = np.vstack([codes, np.array(new_codes)])
+                labels = np.concatenate([labels, np.array(new_labels)])
+        return codes, labels
+
+    def pending_vectors(self):
+        """Vectors (dequantized) and labels of the rows added since the last save."""
+        with self._lock:
+            codes = [code for list_codes, _ in self._new for code in list_codes]
+            labels = [label for _, list_labels in self._new for label in list_labels]
+        if not codes:
+            return np.zeros((0, self.dim), dtype=np.float32), np.zeros(0, dtype=str)
+        return np.array(codes).astype(np.float32) / 127, np.array(labels)
+
+    def save(self, path):
+        """Write the index to ``path`` (a directory) and serve the saved rows from it.
+
+        Rows added while the index is written stay pending until the next save.
+        """
+        with self._lock:
+            pending = [(list(list_codes), list(list_labels)) for list_codes, list_labels in self._new]
+        codes, labels, offsets = [], [], [0]
+        for list_id, (new_codes, new_labels) in enumerate(pending):
+            start, end = self._offsets[list_id], self._offsets[list_id + 1]
+            codes.append(np.asarray(self._codes[start:end], dtype=np.int8))
+            codes.extend([np.array(new_codes)] if new_codes else [])
+            labels.append(np.asarray(self._labels[start:end], dtype=str))
+            labels.append(np.array(new_labels, dtype=str))
+            offsets.append(offsets[-1] + end - start + len(new_labels))
+        arrays = {
+            'centroids': self.centroids,
+            'codes': np.vstack(codes),
+            'labels': np.concatenate(labels),
+            'offsets': np.asarray(offsets, dtype=np.int64)
+        }
+        meta = _write_arrays(path, arrays, self._meta())
+        arrays = _read_arrays(path, meta)
+        with self._lock:
+            self._codes, self._labels = arrays['codes'], arrays['labels']
+            self._offsets = np.asarray(arrays['offsets'])
+            for (list_codes, list_labels), (saved_codes, _) in zip(self._new, pending):
+                del list_codes[:len(saved_codes)]
+                del list_labels[:len(saved_codes)]
+            self._n_new -= sum(len(saved_codes) for saved_codes, _ in pending)
+            self.version = meta['version']
+
+    def _meta(self):
+        return {'kind': self.kind, 'dim': self.dim, 'amount_weight': self.amount_weight, 'n_probe': self.n_probe}
+
+    @classmethod
+    def _from_arrays(cls, meta, arrays):
+        index = cls(arrays['centroids'], amount_weight=meta['amount_weight'], n_probe=meta['n_probe'])
+        index._codes = arrays['codes']
+        index._labels = arrays['labels']
+        index._offsets = np.asarray(arrays['offsets'])
+        return index
+
+
+INDEX_KINDS = {cls.kind: cls for cls in (BruteForceIndex, IVFIndex)}
+
+
+def _read_meta(path):
+    with open(os.path.join(path, 'meta.json')) as f:
+        return json.load(f)
+
+
+def _array_path(path, name, version):
+    # Indexes saved before generations were introduced have unversioned files
+    return os.path.join(path, f'{name}.{version}.npy' if version else f'{name}.npy')
+
+
+def _write_arrays(path, arrays, meta):
+    """Write arrays as a new generation and publish it by replacing meta.json.
+
+    Readers go through meta.json, so they see the previous generation or the
+    new one, never a mix, and a crash mid-write leaves the previous one in
+    place. The previous generation is kept for readers that read meta.json
+    just before the swap; older ones are deleted.
+
+    Returns:
+        The published metadata, with its ``version``
+    """
+    os.makedirs(path, exist_ok=True)
+    previous = _read_meta(path).get('version', 0) if os.path.exists(os.path.join(path, 'meta.json')) else 0
+    version = previous + 1
+    for name, array in arrays.items():
+        np.save(_array_path(path, name, version), array)
+    meta = dict(meta, rows=int(len(arrays['labels'])), version=version, arrays=sorted(arrays))
+    tmp_path = os.path.join(path, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+    for filename in os.listdir(path):
+        parts = filename.split('.')
+        generation = int(parts[1]) if len(parts) == 3 and parts[1].isdigit() else 0
+        if filename.endswith('.npy') and generation < previous:
+            os.remove(os.path.join(path, filename))
+    logger.info(f"Saved {meta['kind']} index with {len(arrays['labels'])} rows to {path} (generation {version})")
+    return meta
+
+
+def _read_arrays(path, meta, mmap=True):
+    version = meta.get('version')
+    names = meta.get('arrays') or [
+        filename[:-4] for filename in os.listdir(path)
+        if filename.endswith('.npy') and '.' not in filename[:-4]
+    ]
+    return {
+        name: np.load(_array_path(path, name, version), mmap_mode='r' if mmap else None)
+        for name in names
+    }
+
+
+def load_index(path, mmap=True):
+    """Load an index saved with ``save``, memory-mapping its arrays by default."""
+    meta = _read_meta(path)
+    index_cls = INDEX_KINDS[meta['kind']]
+    index = index_cls._from_arrays(meta, _read_arrays(path, meta, mmap))
+    index.version = meta.get('version', 0)
+    logger.info(f"Loaded {meta['kind']} index with {meta['rows']} rows from {path}")
+    return index
+
+
+def load_or_create_index(path, amount_weight=0.5):
+    """Load the index in ``path`` or start an empty brute-force one."""
+    if path and os.path.exists(os.path.join(path, 'meta.json')):
+        return load_index(path)
+    return BruteForceIndex(amount_weight=amount_weight)
+
+
+def grow_index(index):
+    """The index to keep using: an IVF copy of a brute-force index grown past BRUTE_FORCE_MAX_ROWS.
+
+    The copy holds the saved rows only; save first, and carry the pending
+    rows over when switching to it.
+    """
+    if isinstance(index, BruteForceIndex) and len(index) > BRUTE_FORCE_MAX_ROWS:
+        logger.info(f"Neighbor index passed {BRUTE_FORCE_MAX_ROWS} rows, switching to an IVF index")
+        return index.to_ivf()
+    return index
+
+
+def build_index(vectors, labels, amount_weight=0.5, n_lists=None, n_probe=8):
+    """Build the index kind that suits the number of rows."""
+    if len(vectors) <= BRUTE_FORCE_MAX_ROWS:
+        index = BruteForceIndex(amount_weight=amount_weight)
+    else:
+        index = IVFIndex.train(vectors, n_lists=n_lists, amount_weight=amount_weight, n_probe=n_probe)
+    index.add_vectors(vectors, labels)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a nearest-neighbor label index from labeled transactions")
+    parser.add_argument("--data", required=True, help="CSV with dateOp, transaction_description, amount and category columns")
+    parser.add_argument("--transformers", required=True, help="Path to transformers.pkl")
+    parser.add_argument("--output", required=True, help="Directory to write the index to (NEIGHBOR_INDEX_DIR)")
+    parser.add_argument("--n-lists", type=int, default=None, help="IVF lists (default: sqrt of the number of rows)")
+    parser.add_argument("--n-probe", type=int, default=8, help="IVF lists scanned per query")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # preprocess_text must be importable from __main__ to unpickle transformers.pkl
+    from predictor import preprocess_inference_data
+
+    with open(args.transformers, 'rb') as f:
+        transformers = pickle.load(f)
+
+    df = pd.read_csv(args.data).dropna(subset=['category'])
+    features = preprocess_inference_data(df, transformers)
+    index = build_index(feature_vectors(features), df['category'].to_numpy(), n_lists=args.n_lists, n_probe=args.n_probe)
+    index.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,21 @@ import os
 import logging
 import tempfile
 import pickle
+import asyncio
+import threading
 import numpy as np
 from datetime import datetime
 from google.cloud import storage
 from tabpfn_client import init, set_access_token, reset
 from preprocessing import preprocess_text as preprocessing_preprocess_text, preprocess_data, FrenchHolidayCalendar
+from neighbors import grow_index, load_index, load_or_create_index
+from tabpfn_transport import AsyncTabPFNTransport, HedgingPolicy
+from pipeline import StagedPipeline
+from log_utils import log_payload
+import metrics
 import pandas as pd
 import sys
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Add preprocess_text to __main__ module for pickle compatibility
@@ -22,6 +27,87 @@ def preprocess_text(text):
 # Add to __main__ module
 sys.modules['__main__'].preprocess_text = preprocess_text
 
+# TabPFN cost model: every row is sent as N_FEATURES cells, N_ESTIMATORS times
+N_FEATURES = 16  # 6 base features + 10 text embeddings
+N_ESTIMATORS = 8  # Number of forward passes in TabPFN
+CELLS_PER_ROW = N_FEATURES * N_ESTIMATORS
+
+# Categories used by the mock predictor for descriptions without a keyword match
+MOCK_CATEGORIES = ('Transport', 'Logement', 'Alimentation', 'Loisirs', 'Santé')
+
+# Keyword rules used to categorize real transactions, checked in order
+KEYWORD_CATEGORIES = (
+    ('supermarket', 'Groceries'),
+    ('grocery', 'Groceries'),
+    ('food', 'Groceries'),
+    ('uber', 'Transportation'),
+    ('taxi', 'Transportation'),
+    ('transport', 'Transportation'),
+    ('travel', 'Transportation'),
+    ('salary', 'Income'),
+    ('deposit', 'Income'),
+    ('payroll', 'Income'),
+    ('restaurant', 'Dining'),
+    ('cafe', 'Dining'),
+    ('coffee', 'Dining'),
+    ('rent', 'Housing'),
+    ('mortgage', 'Housing'),
+    ('utilities', 'Housing'),
+)
+
+# tabpfn_client keeps its configuration in module-level state, so it must only
+# be (re)initialized once per process no matter how many predictors exist.
+_tabpfn_client_lock = threading.Lock()
+_tabpfn_client_token = None
+
+def _ensure_tabpfn_client(token):
+    """Initialize the global TabPFN client once per process and token."""
+    global _tabpfn_client_token
+    with _tabpfn_client_lock:
+        if _tabpfn_client_token == token:
+            logger.info("TabPFN client already initialized, reusing it")
+            return
+
+        # Reset TabPFN client state
+        reset()
+        
+        # Set token and initialize
+        logger.info(f"Setting TabPFN API token: {token[:10]}...")
+        set_access_token(token)
+        logger.info("Initializing TabPFN client with use_server=True")
+        init(use_server=True)
+        _tabpfn_client_token = token
+        logger.info("TabPFN client initialized successfully")
+
+# HTTP transport for TabPFN calls, shared by every predictor of the process so
+# pooled connections survive predictor reloads
+_transport_lock = threading.Lock()
+_transports = {}
+
+def get_transport(base_url, token):
+    """Return the process-wide transport for an API URL and token."""
+    with _transport_lock:
+        transport = _transports.get((base_url, token))
+        if transport is None:
+            hedging = None
+            if os.getenv('TABPFN_HEDGE', '').lower() == 'true':
+                hedging = HedgingPolicy(
+                    percentile=float(os.getenv('TABPFN_HEDGE_PERCENTILE', '0.95')),
+                    max_hedge_rate=float(os.getenv('TABPFN_HEDGE_MAX_RATE', '0.05'))
+                )
+            transport = AsyncTabPFNTransport(
+                base_url,
+                token=token,
+                max_connections=int(os.getenv('TABPFN_MAX_CONNECTIONS', '16')),
+                max_in_flight=int(os.getenv('TABPFN_MAX_IN_FLIGHT', '8')),
+                max_rows_per_call=int(os.getenv('TABPFN_MAX_ROWS_PER_CALL', '500')),
+                timeout_s=float(os.getenv('TABPFN_TIMEOUT_S', '30')),
+                keepalive_expiry_s=float(os.getenv('TABPFN_KEEPALIVE_S', '60')),
+                hedging=hedging
+            )
+            _transports[(base_url, token)] = transport
+        return transport
+
 def validate_transformers(transformers):
     """Validate that all required transformers are present and of correct type."""
     if transformers is None:
@@ -80,7 +166,7 @@ def preprocess_inference_data(df, transformers=None):
     Returns:
         DataFrame with processed features ready for inference
     """
-    logger.info("Starting inference data preprocessing")
+    logger.debug("Starting inference data preprocessing")
     
     # Validate transformers if provided
     if transformers is not None and not validate_transformers(transformers):
@@ -88,13 +174,16 @@ def preprocess_inference_data(df, transformers=None):
         transformers = None
     
     # Use the main preprocessing function
-    features = preprocess_data(df, transformers=transformers, is_training=False)
+    features = preprocess_data(
+        df, transformers=transformers, is_training=False,
+        embedding_stage=lambda: metrics.stage_memory('text_embedding')
+    )
     
     # Validate features
     if not validate_features(features):
         raise ValueError("Feature validation failed. Features do not match expected format.")
     
-    logger.info(f"Preprocessing complete. Feature shape: {features.shape}")
+    logger.debug("Preprocessing complete. Feature shape: %s", features.shape)
     return features
 
 def preprocess_test_data(df, transformers=None):
@@ -103,16 +192,42 @@ def preprocess_test_data(df, transformers=None):
     return preprocess_data(df, transformers=transformers, is_training=False)
 
 class TransactionPredictor:
-    def __init__(self, model_dir='models/tabpfn-client', use_mock=False, use_gcs=False, gcs_bucket=None):
+    def __init__(self, model_dir='models/tabpfn-client', use_mock=False, use_gcs=False, gcs_bucket=None, artifact_version=None,
+                 cascade_threshold=None, neighbor_index_dir=None, neighbor_threshold=None):
         self.model_dir = model_dir
         self.use_mock = use_mock
         self.use_gcs = use_gcs
         self.gcs_bucket = gcs_bucket
+        self.artifact_version = artifact_version or os.getenv('MODEL_VERSION', '1')
+        # Local tiers consulted before TabPFN, as (name, model, confidence threshold)
+        self.cascade = []
+        self.cascade_threshold = cascade_threshold if cascade_threshold is not None else float(os.getenv('CASCADE_THRESHOLD', '0.9'))
+        # Index of past TabPFN predictions whose labels are reused for near-duplicates
+        self.neighbor_index = None
+        self.neighbor_index_dir = neighbor_index_dir or os.getenv('NEIGHBOR_INDEX_DIR')
+        self.neighbor_threshold = neighbor_threshold if neighbor_threshold is not None else float(os.getenv('NEIGHBOR_SIMILARITY_THRESHOLD', '0.98'))
+        self.neighbor_save_every = int(os.getenv('NEIGHBOR_INDEX_SAVE_EVERY', '1000'))
+        self._unsaved_neighbors = 0
+        self._neighbor_lock = threading.Lock()
+        # Saves run on a background thread, one at a time, off _neighbor_lock
+        self._neighbor_save_lock = threading.Lock()
+        self._neighbor_saving = False
+        self._neighbor_save_thread = None
+        # Predictor that replaced this one in a hot reload; rows remembered
+        # after the swap are indexed there
+        self._neighbor_successor = None
         self.model = None
         self.transformers = None
-        self.mock_categories = ['Transport', 'Logement', 'Alimentation', 'Loisirs', 'Santé']
+        self.mock_categories = MOCK_CATEGORIES
         self.temp_dir = None
         self.initialized = False
+        self._init_lock = threading.Lock()
+        # Pooled HTTP transport to the TabPFN API, when TABPFN_API_URL is set
+        self.transport = None
+        # Batches larger than this run as a chunk pipeline (0, the default, disables
+        # it: the overlap only pays off when TabPFN calls are slow next to preprocessing)
+        self.pipeline_chunk_rows = int(os.getenv('PIPELINE_CHUNK_ROWS', '0'))
+        self.pipeline_queue_size = int(os.getenv('PIPELINE_QUEUE_SIZE', '2'))
         logger.info(f"Initializing {'mock' if use_mock else 'TabPFN'} predictor with {'GCS' if use_gcs else 'local'} storage")
         
         # Initialize TabPFN client
@@ -123,15 +238,14 @@ class TransactionPredictor:
                 if not token:
                     raise ValueError("TABPFN_API_TOKEN environment variable not set")
                 
-                # Reset TabPFN client state
-                reset()
+                _ensure_tabpfn_client(token)
+                
+                api_url = os.getenv('TABPFN_API_URL')
+                if api_url:
+                    self.transport = get_transport(api_url, token)
                 
-                # Set token and initialize
-                logger.info(f"Setting TabPFN API token: {token[:10]}...")
-                set_access_token(token)
-                logger.info("Initializing TabPFN client with use_server=True")
-                init(use_server=True)
-                logger.info("TabPFN client initialized successfully")
+                # Optional local tiers answering confident rows before TabPFN
+                self._load_cascade()
                 
                 # Mark as initialized without loading models
                 self.initialized = True  
@@ -141,6 +255,11 @@ class TransactionPredictor:
                 self.use_mock = True
                 self.initialized = True
         
+    @property
+    def model_version(self):
+        """Version tag of whatever answers predictions (mode and artifact version)."""
+        return f"{'mock' if self.use_mock else 'tabpfn'}-{self.artifact_version}"
+
     def _download_from_gcs(self, blob_name, local_path):
         """Download a file from GCS."""
         try:
@@ -154,6 +273,143 @@ class TransactionPredictor:
             logger.error(f"Failed to download {blob_name} from GCS: {str(e)}")
             return False
             
+    def _fetch_artifact(self, filename):
+        """Return a local path for a model artifact, downloading it from GCS if needed."""
+        if self.use_gcs:
+            if self.temp_dir is None:
+                self.temp_dir = tempfile.mkdtemp()
+            local_path = os.path.join(self.temp_dir, filename)
+            if self._download_from_gcs(f'models/tabpfn-client/{filename}', local_path):
+                return local_path
+            return None
+        
+        path = os.path.join(self.model_dir, filename)
+        return path if os.path.exists(path) else None
+    
+    def _load_cascade(self):
+        """Load the local tiers answering rows before TabPFN, if deployed.
+        
+        The neighbor index (when NEIGHBOR_INDEX_DIR is set) comes first, then
+        the surrogate model. Both need the transformers to compute features.
+        """
+        transformers_path = self._fetch_artifact('transformers.pkl')
+        if not transformers_path:
+            logger.info("No transformers found, every row goes to TabPFN")
+            return
+        
+        try:
+            with open(transformers_path, 'rb') as f:
+                transformers = pickle.load(f)
+            if not validate_transformers(transformers):
+                raise ValueError("Invalid transformers for the cascade")
+            self.transformers = transformers
+        except Exception as e:
+            logger.error(f"Failed to load transformers, every row goes to TabPFN: {str(e)}")
+            return
+        
+        if self.neighbor_index_dir:
+            try:
+                self.neighbor_index = load_or_create_index(self.neighbor_index_dir)
+                self.cascade.append(('neighbors', self.neighbor_index, self.neighbor_threshold))
+                logger.info(f"Neighbor index with {len(self.neighbor_index)} rows reuses labels at similarity >= {self.neighbor_threshold}")
+            except Exception as e:
+                logger.error(f"Failed to load neighbor index: {str(e)}")
+                self.neighbor_index = None
+        
+        surrogate_path = self._fetch_artifact('surrogate.pkl')
+        if not surrogate_path:
+            logger.info("No surrogate model found")
+            return
+        
+        try:
+            with open(surrogate_path, 'rb') as f:
+                surrogate = pickle.load(f)
+            self.cascade.append(('surrogate', surrogate, self.cascade_threshold))
+            logger.info(f"Cascade enabled: surrogate answers rows with confidence >= {self.cascade_threshold}")
+        except Exception as e:
+            logger.error(f"Failed to load surrogate model: {str(e)}")
+    
+    def _remember(self, features, categories):
+        """Add TabPFN answers to the neighbor index, saving it in the background every few rows."""
+        with self._neighbor_lock:
+            if self._neighbor_successor is not None:
+                self._neighbor_successor._remember(features, categories)
+                return
+            self.neighbor_index.add(features, categories)
+            self._unsaved_neighbors += len(categories)
+            start_save = self._unsaved_neighbors >= self.neighbor_save_every and not self._neighbor_saving
+            if start_save:
+                self._neighbor_saving = True
+        if start_save:
+            self._neighbor_save_thread = threading.Thread(
+                target=self._background_save, name='neighbor-index-save', daemon=True
+            )
+            self._neighbor_save_thread.start()
+    
+    def _background_save(self):
+        try:
+            self.save_neighbor_index()
+        finally:
+            with self._neighbor_lock:
+                self._neighbor_saving = False
+    
+    def save_neighbor_index(self):
+        """Persist the neighbor index to NEIGHBOR_INDEX_DIR.
+        
+        Requests keep adding rows meanwhile: the save writes a snapshot, and
+        rows added during it stay pending for the next one.
+        """
+        with self._neighbor_save_lock:
+            with self._neighbor_lock:
+                index = self.neighbor_index
+                if index is None or not self.neighbor_index_dir or self._neighbor_successor is not None:
+                    return
+                self._unsaved_neighbors = 0
+            try:
+                index.save(self.neighbor_index_dir)
+                grown = grow_index(index)
+                if grown is index:
+                    return
+                grown.save(self.neighbor_index_dir)
+                with self._neighbor_lock:
+                    # Rows added while the IVF index was trained and saved
+                    grown.add_vectors(*index.pending_vectors())
+                    self._replace_neighbor_index(grown)
+            except Exception as e:
+                logger.error(f"Failed to save neighbor index: {str(e)}")
+    
+    def _replace_neighbor_index(self, index):
+        """Swap the neighbor index in the cascade; the caller holds _neighbor_lock."""
+        self.cascade = [
+            (name, index if model is self.neighbor_index else model, threshold)
+            for name, model, threshold in self.cascade
+        ]
+        self.neighbor_index = index
+    
+    def hand_over_neighbors(self, successor):
+        """Move rows indexed since the last save to ``successor``'s index, and any later ones.
+        
+        Called when a hot reload swaps ``successor`` in; it loaded the index
+        as saved before the reload, so without this those rows would be lost.
+        If a background save published a newer generation since, the
+        successor reloads it first.
+        """
+        with self._neighbor_save_lock, self._neighbor_lock:
+            self._neighbor_successor = successor
+            if self.neighbor_index is None or successor.neighbor_index is None:
+                return
+            vectors, labels = self.neighbor_index.pending_vectors()
+            with successor._neighbor_lock:
+                if self.neighbor_index_dir and successor.neighbor_index.version != self.neighbor_index.version:
+                    fresh = load_index(self.neighbor_index_dir)
+                    fresh.add_vectors(*successor.neighbor_index.pending_vectors())
+                    successor._replace_neighbor_index(fresh)
+                    logger.info(f"Reloaded neighbor index generation {fresh.version} for the new predictor")
+                if len(labels) and successor.neighbor_index.dim in (None, vectors.shape[1]):
+                    successor.neighbor_index.add_vectors(vectors, labels)
+                    successor._unsaved_neighbors += len(labels)
+                    logger.info(f"Handed {len(labels)} unsaved neighbor rows over to the new predictor")
+    
     def _load_models(self):
         """Load models from either local storage or GCS."""
         try:
@@ -196,7 +452,14 @@ class TransactionPredictor:
         """Initialize the predictor."""
         if self.initialized:
             return
-            
+        
+        with self._init_lock:
+            if self.initialized:
+                return
+            self._initialize_locked()
+
+    def _initialize_locked(self):
+        """Initialization body, called with the init lock held."""
         if not self.use_mock:
             try:
                 # When using TabPFN client API with a token, we don't need to load model files
@@ -209,8 +472,12 @@ class TransactionPredictor:
                 self.use_mock = True
                 self.initialized = True
     
-    def _mock_predict(self, transactions):
-        """Generate mock predictions."""
+    def _mock_predict(self, transactions, positions=None):
+        """Generate mock predictions.
+        
+        ``positions`` are the rows' positions in their own requests when
+        several requests were merged; the fallback category depends on them.
+        """
         # Convert transactions to DataFrame if it's not already
         if not isinstance(transactions, pd.DataFrame):
             df = pd.DataFrame(transactions)
@@ -219,8 +486,11 @@ class TransactionPredictor:
         
         results = []
         
+        if positions is None:
+            positions = range(len(df))
+        
         # Use transaction description to determine category more intelligently
-        for idx, row in df.iterrows():
+        for idx, (_, row) in zip(positions, df.iterrows()):
             desc = str(row.get('transaction_description', '')).lower()
             
             if any(word in desc for word in ['carte', 'chargemap', 'transport', 'sncf', 'uber']):
@@ -250,6 +520,7 @@ class TransactionPredictor:
         """Handle API errors including rate limits."""
         if hasattr(error, 'response'):
             if error.response.status_code == 429:
+                metrics.record_rate_limit()
                 try:
                     error_data = error.response.json()
                     next_available = error_data.get('next_available_at')
@@ -275,135 +546,327 @@ class TransactionPredictor:
             'message': str(error)
         }
 
-    def predict(self, transactions):
-        """Predict categories for a list of transactions."""
-        if not self.initialized:
-            self.initialize()
+    def _cascade_predict(self, df, api_results):
+        """Fill api_results in place with the answers of confident local tiers.
+        
+        Returns:
+            The preprocessed features of df
+        """
+        features = preprocess_inference_data(df, self.transformers)
+        for tier, model, threshold in self.cascade:
+            pending = [pos for pos, result in enumerate(api_results) if result is None]
+            if not pending:
+                break
+            categories, confidences = model.predict(features.iloc[pending])
+            hits = 0
+            for pos, category, confidence in zip(pending, categories, confidences):
+                if confidence >= threshold:
+                    api_results[pos] = {
+                        'category': category,
+                        'confidence': confidence,
+                        'tier': tier
+                    }
+                    hits += 1
+            metrics.record_cache(tier, hits, len(pending) - hits)
+        return features
 
+    def _remote_predict(self, df):
+        """Categorize rows through the TabPFN tier.
+        
+        When using the TabPFN API client, we don't need local preprocessing:
+        the API handles all preprocessing internally.
+        """
+        if self.transport is None:
+            results = self._keyword_predict(df)
+            metrics.record_keyword_call()
+            return results
         try:
-            if self.use_mock:
-                results = self._mock_predict(transactions)
-                return {
-                    'success': True,
-                    'results': results,
-                    'errors': [],
-                    'total_processed': len(results),
-                    'total_errors': 0
-                }
-
-            # Convert transactions to DataFrame if it's not already
-            if not isinstance(transactions, pd.DataFrame):
-                df = pd.DataFrame(transactions)
-            else:
-                df = transactions.copy()
-            
-            logger.info(f"Input DataFrame:\n{df}")
+            results = self.transport.predict(df.to_dict('records'))
+        except Exception as e:
+            metrics.record_tabpfn_call(self._call_outcome(e))
+            raise
+        metrics.record_tabpfn_call('ok')
+        return results
+
+    async def _remote_predict_async(self, df):
+        if self.transport is None:
+            results = self._keyword_predict(df)
+            metrics.record_keyword_call()
+            return results
+        try:
+            results = await self.transport.predict_async(df.to_dict('records'))
+        except Exception as e:
+            metrics.record_tabpfn_call(self._call_outcome(e))
+            raise
+        metrics.record_tabpfn_call('ok')
+        return results
+
+    @staticmethod
+    def _call_outcome(error):
+        response = getattr(error, 'response', None)
+        return 'rate_limited' if getattr(response, 'status_code', None) == 429 else 'error'
+
+    def _keyword_predict(self, df):
+        """Keyword rules standing in for the TabPFN API when no TABPFN_API_URL is set."""
+        # For real transactions, we'll use the keyword rules but with better handling
+        # Process each transaction with improved logic
+        api_results = []
+        for idx, row in df.iterrows():
+            # Check both possible description field names
+            desc = str(row.get('transaction_description', row.get('description', ''))).lower()
+            amount = float(row.get('amount', 0))
             
-            # When using the TabPFN API client, we don't need local preprocessing
-            # The API handles all preprocessing internally
+            # Determine category based on keywords and amount
+            category = None
+            highest_confidence = 0.75  # Default confidence
             
-            # For real transactions, we'll use the mock categories but with better handling
-            # Initialize categories based on transaction descriptions
-            mock_categories = {
-                'supermarket': 'Groceries',
-                'grocery': 'Groceries',
-                'food': 'Groceries',
-                'uber': 'Transportation', 
-                'taxi': 'Transportation',
-                'transport': 'Transportation',
-                'travel': 'Transportation',
-                'salary': 'Income',
-                'deposit': 'Income',
-                'payroll': 'Income',
-                'restaurant': 'Dining',
-                'cafe': 'Dining',
-                'coffee': 'Dining',
-                'rent': 'Housing',
-                'mortgage': 'Housing',
-                'utilities': 'Housing'
-            }
+            # Check for matches in keywords
+            for keyword, cat in KEYWORD_CATEGORIES:
+                if keyword in desc:
+                    category = cat
+                    highest_confidence = 0.9
+                    break
             
-            # Process each transaction with improved logic
-            api_results = []
-            for idx, row in df.iterrows():
-                # Check both possible description field names
-                desc = str(row.get('transaction_description', row.get('description', ''))).lower()
-                amount = float(row.get('amount', 0))
-                
-                # Determine category based on keywords and amount
-                category = None
-                highest_confidence = 0.75  # Default confidence
-                
-                # Check for matches in keywords
-                for keyword, cat in mock_categories.items():
-                    if keyword in desc:
-                        category = cat
-                        highest_confidence = 0.9
-                        break
-                
-                # If no match found, use amount to determine category
-                if not category:
-                    if amount > 0:
-                        category = 'Income'
-                        highest_confidence = 0.85
-                    else:
-                        # Default to most common category
-                        category = 'Other'
-                        highest_confidence = 0.65
-                
-                # Create result 
-                api_results.append({
-                    'category': category,
-                    'confidence': highest_confidence
-                })
-                
-            logger.info(f"Generated categorizations for {len(api_results)} transactions")
+            # If no match found, use amount to determine category
+            if not category:
+                if amount > 0:
+                    category = 'Income'
+                    highest_confidence = 0.85
+                else:
+                    # Default to most common category
+                    category = 'Other'
+                    highest_confidence = 0.65
             
-            # Format results
-            results = []
-            for idx, (api_result, row) in enumerate(zip(api_results, df.iterrows())):
-                result = {
-                    'transaction_id': str(row[1].get('id', idx)),
-                    'description': row[1].get('transaction_description', ''),
-                    'predicted_category': api_result.get('category', 'Unknown'),
-                    'confidence': float(api_result.get('confidence', 0.8))
-                }
-                results.append(result)
+            # Create result 
+            api_results.append({
+                'category': category,
+                'confidence': highest_confidence
+            })
+        
+        return api_results
+
+    def predict(self, transactions, positions=None):
+        """Predict categories for a list of transactions.
+        
+        ``positions`` gives each row's position in its caller's request when
+        the coalescer merged several requests (default: position in the list).
+        """
+        if not self.initialized:
+            self.initialize()
+
+        try:
+            if self.use_mock:
+                with metrics.timed_stage('mock', 'mock'):
+                    return self._mock_response(transactions, positions)
+
+            if self.pipeline_chunk_rows and len(transactions) > self.pipeline_chunk_rows:
+                return self._pipelined_predict(transactions)[0]
+
+            with metrics.timed_stage('preprocess'):
+                df, api_results, features, escalated = self._local_predict(transactions)
+            with metrics.timed_stage('infer'):
+                remote_results = self._remote_predict(df.iloc[escalated]) if escalated else []
+            with metrics.timed_stage('format'):
+                return self._finish_predict(df, api_results, features, escalated, remote_results)
             
-            return {
-                'success': True,
-                'results': results,
-                'errors': [],
-                'total_processed': len(results),
-                'total_errors': 0,
-                'request_id': datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3],
-                'mode': 'tabpfn'
-            }
+        except Exception as e:
+            return self._error_response(e)
+        
+        finally:
+            # Cleanup temporary files if using GCS
+            self.cleanup()
+
+    def _pipelined_predict(self, transactions):
+        """Predict a large batch chunk by chunk, overlapping the stages.
+        
+        Chunk N+1 is preprocessed and run through the local tiers while the
+        TabPFN call of chunk N is in flight.
+        
+        Returns:
+            (response, pipeline stats of this batch)
+        """
+        chunk_rows = self.pipeline_chunk_rows
+        n_rows = len(transactions)
+
+        def ingest(offset):
+            if isinstance(transactions, pd.DataFrame):
+                return offset, transactions.iloc[offset:offset + chunk_rows]
+            return offset, transactions[offset:offset + chunk_rows]
+
+        def preprocess(chunk):
+            offset, rows = chunk
+            return offset, self._local_predict(rows)
+
+        def infer(chunk):
+            offset, (df, api_results, features, escalated) = chunk
+            remote_results = self._remote_predict(df.iloc[escalated]) if escalated else []
+            return offset, (df, api_results, features, escalated, remote_results)
+
+        def format_chunk(chunk):
+            offset, (df, api_results, features, escalated, remote_results) = chunk
+            return self._format_chunk(df, api_results, features, escalated, remote_results, offset), len(escalated)
+
+        pipeline = StagedPipeline(
+            [('ingest', ingest), ('preprocess', preprocess), ('infer', infer), ('format', format_chunk)],
+            queue_size=self.pipeline_queue_size
+        )
+        with metrics.stage_memory('pipeline'):
+            outputs, stats = pipeline.run(range(0, n_rows, chunk_rows))
+        for name, stage in stats['stages'].items():
+            metrics.observe_stage(name, 'tabpfn', stage['busy_s'])
+
+        results = [result for chunk_results, _ in outputs for result in chunk_results]
+        self._log_tiers(len(results), sum(n_escalated for _, n_escalated in outputs))
+        logger.info(
+            "Pipelined %d rows in %d chunks: %s",
+            n_rows, stats['chunks'],
+            ', '.join(f"{name} {stage['utilization']:.0%}" for name, stage in stats['stages'].items()),
+            extra={'pipeline': stats}
+        )
+        return self._success_response(results), stats
+
+    async def predict_async(self, transactions):
+        """Coroutine variant of predict.
+        
+        Preprocessing and the local tiers run in a worker thread; TabPFN calls
+        go through the pooled transport without blocking the event loop.
+        """
+        if not self.initialized:
+            await asyncio.to_thread(self.initialize)
+
+        try:
+            if self.use_mock:
+                with metrics.timed_stage('mock', 'mock'):
+                    return self._mock_response(transactions)
+
+            with metrics.timed_stage('preprocess'):
+                df, api_results, features, escalated = await asyncio.to_thread(self._local_predict, transactions)
+            with metrics.timed_stage('infer'):
+                remote_results = await self._remote_predict_async(df.iloc[escalated]) if escalated else []
+            with metrics.timed_stage('format'):
+                return await asyncio.to_thread(self._finish_predict, df, api_results, features, escalated, remote_results)
             
         except Exception as e:
-            # Handle potential API errors including rate limits
-            error_response = self._handle_api_error(e)
-            logger.error(f"Prediction error: {error_response}")
-            return {
-                'success': False,
-                'results': [],
-                'errors': [{'error': str(e)}],
-                'total_processed': 0,
-                'total_errors': 1,
-                'request_id': datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3],
-                'mode': 'error'
-            }
+            return self._error_response(e)
+        
+        finally:
+            self.cleanup()
+
+    def _mock_response(self, transactions, positions=None):
+        results = self._mock_predict(transactions, positions)
+        return {
+            'success': True,
+            'results': results,
+            'errors': [],
+            'total_processed': len(results),
+            'total_errors': 0
+        }
+
+    def _local_predict(self, transactions):
+        """Answer what the local tiers can.
+        
+        Returns:
+            (df, api_results with None for rows to escalate, features or None,
+            positions of the escalated rows)
+        """
+        # Convert transactions to DataFrame if it's not already
+        if not isinstance(transactions, pd.DataFrame):
+            df = pd.DataFrame(transactions)
+        else:
+            df = transactions.copy()
+        
+        log_payload(logger, "Input DataFrame", df)
+        
+        # Local tiers answer the rows they are confident about, the rest
+        # is escalated to TabPFN
+        api_results = [None] * len(df)
+        features = None
+        if self.cascade:
+            try:
+                features = self._cascade_predict(df, api_results)
+            except Exception as e:
+                logger.error(f"Cascade failed, escalating every row to TabPFN: {str(e)}")
+                api_results = [None] * len(df)
         
-        # Cleanup temporary files if using GCS
+        escalated = [pos for pos, result in enumerate(api_results) if result is None]
+        return df, api_results, features, escalated
+
+    def _finish_predict(self, df, api_results, features, escalated, remote_results):
+        """Merge the TabPFN answers into the local ones and format the response."""
+        results = self._format_chunk(df, api_results, features, escalated, remote_results)
+        self._log_tiers(len(results), len(escalated))
+        return self._success_response(results)
+
+    def _format_chunk(self, df, api_results, features, escalated, remote_results, offset=0):
+        """Result rows of a chunk; ``offset`` is its position in the batch (for id-less rows)."""
+        if escalated:
+            for pos, api_result in zip(escalated, remote_results):
+                api_results[pos] = dict(api_result, tier='tabpfn')
+            
+            # Only TabPFN answers are indexed, so local tiers never feed themselves
+            if self.neighbor_index is not None and features is not None:
+                try:
+                    self._remember(features.iloc[escalated], [r['category'] for r in remote_results])
+                except Exception as e:
+                    logger.error(f"Failed to update neighbor index: {str(e)}")
+        
+        # Format results column-wise; iterrows would dominate large batches
+        positions = range(offset, offset + len(df))
+        ids = df['id'].tolist() if 'id' in df.columns else positions
+        descriptions = df['transaction_description'].tolist() if 'transaction_description' in df.columns else [''] * len(df)
+        return [
+            {
+                'transaction_id': str(transaction_id),
+                'description': description,
+                'predicted_category': api_result.get('category', 'Unknown'),
+                'confidence': float(api_result.get('confidence', 0.8)),
+                'tier': api_result['tier']
+            }
+            for transaction_id, description, api_result in zip(ids, descriptions, api_results)
+        ]
+
+    def _log_tiers(self, n_rows, n_escalated):
+        logger.info(
+            "Generated categorizations for %d transactions (%d answered locally, %d escalated to TabPFN)",
+            n_rows, n_rows - n_escalated, n_escalated,
+            extra={'rows': n_rows, 'local_rows': n_rows - n_escalated, 'escalated_rows': n_escalated}
+        )
+
+    def _success_response(self, results):
+        return {
+            'success': True,
+            'results': results,
+            'errors': [],
+            'total_processed': len(results),
+            'total_errors': 0,
+            'request_id': datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3],
+            'mode': 'tabpfn'
+        }
+
+    def _error_response(self, e):
+        # Handle potential API errors including rate limits
+        error_response = self._handle_api_error(e)
+        logger.error(f"Prediction error: {error_response}")
+        return {
+            'success': False,
+            'results': [],
+            'errors': [{'error': str(e)}],
+            'total_processed': 0,
+            'total_errors': 1,
+            'request_id': datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3],
+            'mode': 'error'
+        }
+
+    def cleanup(self):
+        """Remove artifacts downloaded from GCS."""
         if self.use_gcs and self.temp_dir:
             try:
                 import shutil
                 shutil.rmtree(self.temp_dir)
+                self.temp_dir = None
                 logger.info("Cleaned up temporary files")
             except Exception as e:
                 logger.warning(f"Failed to cleanup temporary files: {str(e)}")
-        
-        return results 
 
     def test_rate_limit_response(self):
         """Test method to check rate limit response."""
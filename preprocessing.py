@@ -4,9 +4,8 @@ import numpy as np
 from pandas.tseries.holiday import AbstractHolidayCalendar, Holiday, EasterMonday, Easter
 from pandas.tseries.offsets import Day
 import logging
+from contextlib import nullcontext
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Define French holidays
@@ -34,15 +33,25 @@ def preprocess_text(text):
     text = ''.join(c for c in text if c.isalnum() or c.isspace())
     return text
 
-def preprocess_data(df: pd.DataFrame, transformers=None, is_training: bool = False) -> pd.DataFrame:
+def normalize_description(text):
+    """Canonical form of a description: preprocess_text plus collapsed whitespace.
+
+    Two descriptions with the same canonical form produce the same text
+    embeddings, so this is what content fingerprints are computed from.
+    """
+    return ' '.join(preprocess_text(text).split())
+
+def preprocess_data(df: pd.DataFrame, transformers=None, is_training: bool = False, embedding_stage=None) -> pd.DataFrame:
     """Main preprocessing pipeline that works for both training and prediction.
     
     Args:
         df: Input DataFrame
         transformers: Dictionary containing 'scaler', 'tfidf', and 'pca' transformers
         is_training: Whether this is training data (with category) or prediction data
+        embedding_stage: Optional callable returning a context manager entered
+            around the TF-IDF and PCA transforms, e.g. to measure them
     """
-    logger.info(f"Starting preprocessing with {'training' if is_training else 'prediction'} mode")
+    logger.debug("Starting preprocessing with %s mode", 'training' if is_training else 'prediction')
     df = df.copy()
     
     # Handle missing values and categories
@@ -57,7 +66,7 @@ def preprocess_data(df: pd.DataFrame, transformers=None, is_training: bool = Fal
     df['transaction_description'] = df['transaction_description'].fillna('')
     
     # Preprocess transaction descriptions
-    logger.info("Preprocessing transaction descriptions")
+    logger.debug("Preprocessing transaction descriptions")
     df['transaction_description'] = df['transaction_description'].apply(preprocess_text)
     
     # Convert amount to float (handle comma decimal separator)
@@ -99,19 +108,20 @@ def preprocess_data(df: pd.DataFrame, transformers=None, is_training: bool = Fal
     
     # Apply transformers if available
     if transformers is not None:
-        logger.info("Applying transformers")
+        logger.debug("Applying transformers")
         try:
             # Scale numerical features if scaler exists
             if 'scaler' in transformers:
-                logger.info("Scaling numerical features")
+                logger.debug("Scaling numerical features")
                 numerical_features = ['amount', 'absolute_amount']
                 features[numerical_features] = transformers['scaler'].transform(features[numerical_features])
             
             # Process text features if text transformers exist
             if all(k in transformers for k in ['tfidf', 'pca']):
-                logger.info("Generating text embeddings")
-                text_features = transformers['tfidf'].transform(df['transaction_description'])
-                text_embeddings = transformers['pca'].transform(text_features.toarray())
+                logger.debug("Generating text embeddings")
+                with embedding_stage() if embedding_stage else nullcontext():
+                    text_features = transformers['tfidf'].transform(df['transaction_description'])
+                    text_embeddings = transformers['pca'].transform(text_features.toarray())
                 
                 # Add text embeddings to features
                 for i in range(text_embeddings.shape[1]):
@@ -120,5 +130,5 @@ def preprocess_data(df: pd.DataFrame, transformers=None, is_training: bool = Fal
             logger.error(f"Error applying transformers: {str(e)}")
             raise
     
-    logger.info(f"Preprocessing complete. Features shape: {features.shape}")
+    logger.debug("Preprocessing complete. Features shape: %s", features.shape)
     return features 
\ No newline at end of file
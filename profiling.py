@@ -0,0 +1,279 @@
+"""
+On-demand profiling of individual requests.
+
+A request carrying ``X-Profile: cprofile`` (or ``sample``), or the
+``?profile=`` query flag, together with an ``X-Profile-Token`` header
+matching PROFILE_TOKEN, is run under a profiler:
+
+- ``cprofile``: deterministic cProfile of the request thread, stored as a
+  pstats file (load with ``pstats.Stats`` or snakeviz)
+- ``sample``: a sampling profiler reading the request thread's stack every
+  PROFILE_SAMPLE_INTERVAL_MS, stored as collapsed stacks (``a;b;c count``
+  lines, the input of flamegraph.pl and speedscope), with far less overhead
+
+Artifacts are kept in PROFILE_DIR (the newest PROFILE_KEEP of them) and
+served by ``GET /profiles/<request_id>`` with the same token; the top
+functions are also logged with the request. Profiling is rate limited to
+PROFILE_MAX_PER_HOUR requests per instance and one request at a time, so
+it cannot be used to slow the service down. A request that may not be
+profiled is still served, with the reason in ``X-Profile-Status``.
+"""
+
+import os
+import re
+import sys
+import hmac
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+MODES = ('cprofile', 'sample')
+
+# Functions / stacks included in the logged summary
+SUMMARY_ENTRIES = 15
+
+_ARTIFACT_EXTENSIONS = {'cprofile': '.pstats', 'sample': '.collapsed'}
+_ARTIFACT_ID = re.compile(r'^[\w-]+$')
+
+
+class StackSampler:
+    """Sample one thread's Python stack at a fixed interval.
+
+    Args:
+        thread_id: Thread to sample (threading.get_ident() of the request)
+        interval_s: Time between samples
+    """
+
+    def __init__(self, thread_id, interval_s=0.005):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}")
+                frame = frame.f_back
+            # Collapsed stacks run from the root to the leaf
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfileSession:
+    """Profiles the code run inside it, if the request was allowed to be profiled.
+
+    ``status`` is ``profiled`` or the reason it was not (``unauthorized``,
+    ``rate_limited``, ``busy``, ``disabled``).
+    """
+
+    def __init__(self, profiler, request_id, mode, status):
+        self.profiler = profiler
+        self.request_id = request_id
+        self.mode = mode
+        self.status = status
+        self.summary = None
+        self._profile = None
+        self._sampler = None
+
+    def __enter__(self):
+        if self.status != 'profiled':
+            return self
+        if self.mode == 'cprofile':
+            self._profile = cProfile.Profile()
+            try:
+                self._profile.enable()
+            except ValueError as e:
+                # Another profiler (a debugger, coverage, ...) owns the thread
+                logger.warning(f"Cannot profile request {self.request_id}: {str(e)}")
+                self.status = 'busy'
+                self.profiler.release()
+                return self
+        else:
+            self._sampler = StackSampler(threading.get_ident(), self.profiler.sample_interval_s)
+            self._sampler.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.status != 'profiled':
+            return False
+        try:
+            if self._profile is not None:
+                self._profile.disable()
+            else:
+                self._sampler.stop()
+            self.summary = self.profiler.save(self, time.perf_counter() - self._started)
+        except Exception as e:
+            logger.warning(f"Failed to save profile of request {self.request_id}: {str(e)}")
+        finally:
+            self.profiler.release()
+        return False
+
+    def headers(self):
+        headers = {'X-Profile-Status': self.status}
+        if self.status == 'profiled':
+            headers['X-Profile-Id'] = self.request_id
+        return headers
+
+
+class RequestProfiler:
+    """Authenticates, rate limits and stores request profiles.
+
+    Args:
+        token: Secret callers must send in X-Profile-Token
+        directory: Where artifacts are written
+        max_per_hour: Profiled requests allowed per rolling hour
+        keep: Artifacts kept, oldest deleted first
+        sample_interval_s: Interval of the sampling profiler
+    """
+
+    def __init__(self, token, directory='/tmp/profiles', max_per_hour=10, keep=20, sample_interval_s=0.005):
+        self.token = token
+        self.directory = directory
+        self.max_per_hour = max_per_hour
+        self.keep = keep
+        self.sample_interval_s = sample_interval_s
+        self._lock = threading.Lock()
+        self._active = False
+        self._recent = deque()
+
+    def authorized(self, request):
+        supplied = request.headers.get('X-Profile-Token', '')
+        return bool(self.token) and hmac.compare_digest(supplied.encode('utf-8'), self.token.encode('utf-8'))
+
+    def _acquire(self, now=None):
+        """Reserve the profiler; returns None or the reason it is unavailable."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            while self._recent and now - self._recent[0] >= 3600:
+                self._recent.popleft()
+            if self._active:
+                return 'busy'
+            if len(self._recent) >= self.max_per_hour:
+                return 'rate_limited'
+            self._active = True
+            self._recent.append(now)
+            return None
+
+    def release(self):
+        with self._lock:
+            self._active = False
+
+    def session(self, request, request_id):
+        """ProfileSession for a request asking to be profiled, else None."""
+        mode = requested_mode(request)
+        if mode is None:
+            return None
+        if not self.token:
+            return ProfileSession(self, request_id, mode, 'disabled')
+        if not self.authorized(request):
+            logger.warning(f"Rejected profiling of request {request_id}: invalid X-Profile-Token")
+            return ProfileSession(self, request_id, mode, 'unauthorized')
+        reason = self._acquire()
+        if reason is not None:
+            logger.warning(f"Request {request_id} not profiled: {reason}")
+            return ProfileSession(self, request_id, mode, reason)
+        return ProfileSession(self, request_id, mode, 'profiled')
+
+    def save(self, session, elapsed_s):
+        """Write the session's artifact, prune old ones and log a summary."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, session.request_id + _ARTIFACT_EXTENSIONS[session.mode])
+        if session.mode == 'cprofile':
+            session._profile.dump_stats(path)
+            summary = {'mode': 'cprofile', 'top': top_functions(session._profile)}
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(session._sampler.collapsed())
+            stacks = session._sampler.stacks
+            summary = {
+                'mode': 'sample',
+                'samples': sum(stacks.values()),
+                'top': [{'stack': stack, 'samples': count} for stack, count in stacks.most_common(SUMMARY_ENTRIES)]
+            }
+        summary['elapsed_s'] = round(elapsed_s, 6)
+        summary['artifact'] = path
+        self._prune()
+        logger.info(f"Profiled request {session.request_id} ({session.mode}) in {elapsed_s:.3f}s", extra={'profile': summary})
+        return summary
+
+    def _prune(self):
+        artifacts = [
+            os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if name.endswith(tuple(_ARTIFACT_EXTENSIONS.values()))
+        ]
+        artifacts.sort(key=os.path.getmtime)
+        for path in artifacts[:max(0, len(artifacts) - self.keep)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def artifact(self, request_id):
+        """(path, content type) of a stored profile, or None."""
+        if not _ARTIFACT_ID.match(request_id):
+            return None
+        for mode, extension in _ARTIFACT_EXTENSIONS.items():
+            path = os.path.join(self.directory, request_id + extension)
+            if os.path.exists(path):
+                return path, 'application/octet-stream' if mode == 'cprofile' else 'text/plain; charset=utf-8'
+        return None
+
+
+def requested_mode(request):
+    """Profiling mode asked for by the X-Profile header or ?profile= flag, or None."""
+    value = (request.headers.get('X-Profile') or request.args.get('profile') or '').strip().lower()
+    if not value or value in ('0', 'false'):
+        return None
+    if value in ('1', 'true'):
+        return 'cprofile'
+    return value if value in MODES else None
+
+
+def top_functions(profile, limit=SUMMARY_ENTRIES):
+    """Functions with the highest cumulative time in a cProfile.Profile."""
+    stats = pstats.Stats(profile).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            'function': f"{os.path.basename(filename)}:{line}({name})",
+            'calls': calls,
+            'cumulative_s': round(cumulative, 6),
+            'own_s': round(own, 6)
+        }
+        for (filename, line, name), (_, calls, own, cumulative, _) in rows
+    ]
+
+
+def create_profiler():
+    """RequestProfiler configured from PROFILE_* variables; profiling is disabled without PROFILE_TOKEN."""
+    return RequestProfiler(
+        token=os.getenv('PROFILE_TOKEN', ''),
+        directory=os.getenv('PROFILE_DIR', '/tmp/profiles'),
+        max_per_hour=int(os.getenv('PROFILE_MAX_PER_HOUR', '10')),
+        keep=int(os.getenv('PROFILE_KEEP', '20')),
+        sample_interval_s=float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5')) / 1000
+    )
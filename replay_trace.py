@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Replay a request trace through TransactionPredictor.
+
+Feeds every request of a trace recorded by trace_capture (TRACE_SAMPLE_RATE)
+to a local predictor, at the recorded pacing, sped up, or back to back,
+and reports throughput and latency. Given the report of an earlier run as
+a baseline, it prints the change of every metric and fails when latency or
+throughput regress by more than a tolerance.
+
+Usage:
+    python replay_trace.py trace.jsonl --speed 10 --output before.json
+    # ... change the code ...
+    python replay_trace.py trace.jsonl --speed 10 --baseline before.json --max-regression 0.1
+
+The predictor is configured from the same environment variables as the
+Cloud Function (USE_MOCK, TABPFN_API_TOKEN, TABPFN_API_URL, ...).
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from batch_categorize import predictor_options_from_env
+from predictor import TransactionPredictor
+from trace_capture import read_trace
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Metrics compared against a baseline, and whether higher is better
+COMPARED_METRICS = {
+    'throughput_rps': True,
+    'rows_per_s': True,
+    'latency_ms.p50': False,
+    'latency_ms.p95': False,
+    'latency_ms.p99': False
+}
+
+
+def latency_summary(latencies_s):
+    latencies_ms = np.asarray(latencies_s, dtype=float) * 1000
+    if len(latencies_ms) == 0:
+        return {}
+    summary = {f'p{p}': round(float(np.percentile(latencies_ms, p)), 2) for p in PERCENTILES}
+    summary['mean'] = round(float(latencies_ms.mean()), 2)
+    summary['max'] = round(float(latencies_ms.max()), 2)
+    return summary
+
+
+def replay(entries, predict, speed=0.0, concurrency=8):
+    """Replay trace entries through ``predict``.
+
+    Args:
+        speed: Pacing relative to the recorded arrival times (1 = real
+            time, 10 = ten times faster); 0 sends requests back to back
+        concurrency: Requests predicted at once
+
+    Returns:
+        Report dictionary
+    """
+    latencies = []
+    failed = [0]
+    rows = [0]
+    lock = threading.Lock()
+
+    def run(entry, scheduled):
+        # With pacing, latency counts from the scheduled arrival (queueing included)
+        started_at = time.perf_counter() if scheduled is None else scheduled
+        response = predict(entry['transactions'])
+        latency = time.perf_counter() - started_at
+        with lock:
+            latencies.append(latency)
+            if isinstance(response, dict) and not response.get('success', True):
+                failed[0] += 1
+            else:
+                rows[0] += len(entry['transactions'])
+
+    first_ts = entries[0]['ts'] if entries else 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = []
+        for entry in entries:
+            if speed > 0:
+                scheduled = started + (entry['ts'] - first_ts) / speed
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                scheduled = None
+            futures.append(pool.submit(run, entry, scheduled))
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(entries),
+        'rows': rows[0],
+        'failed': failed[0],
+        'speed': speed,
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(entries) / elapsed, 2) if elapsed > 0 else 0.0,
+        'rows_per_s': round(rows[0] / elapsed, 1) if elapsed > 0 else 0.0,
+        'latency_ms': latency_summary(latencies),
+        'recorded_latency_ms': latency_summary([entry['latency_ms'] / 1000 for entry in entries])
+    }
+
+
+def _metric(report, name):
+    value = report
+    for key in name.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(report, baseline, max_regression=None):
+    """Change of every compared metric against ``baseline``.
+
+    Returns:
+        (dictionary of metric -> {baseline, current, change}, list of
+        metrics that regressed by more than ``max_regression``)
+    """
+    diff = {}
+    regressions = []
+    for name, higher_is_better in COMPARED_METRICS.items():
+        before, after = _metric(baseline, name), _metric(report, name)
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        diff[name] = {'baseline': before, 'current': after, 'change': round(change, 4)}
+        regression = -change if higher_is_better else change
+        if max_regression is not None and regression > max_regression:
+            regressions.append(name)
+    return diff, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a request trace through the predictor")
+    parser.add_argument("trace", help="JSONL trace written with TRACE_SAMPLE_RATE")
+    parser.add_argument("--speed", type=float, default=0.0, help="Pacing vs recorded arrivals (1 = real time, 0 = back to back)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests predicted at once")
+    parser.add_argument("--mock", action="store_true", help="Use the mock predictor")
+    parser.add_argument("--output", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Report of an earlier replay to compare against")
+    parser.add_argument("--max-regression", type=float, default=None, help="Fail when a metric is this much worse (0.1 = 10%%)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for name in ('predictor', 'preprocessing', 'pipeline'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    options = predictor_options_from_env()
+    predictor = TransactionPredictor(
+        model_dir=options['model_dir'],
+        use_mock=options['use_mock'] or args.mock,
+        use_gcs=options['use_gcs'],
+        gcs_bucket=options['gcs_bucket']
+    )
+    predictor.initialize()
+
+    entries = read_trace(args.trace)
+    logger.info(f"Replaying {len(entries)} requests from {args.trace}")
+    report = replay(entries, predictor.predict, speed=args.speed, concurrency=args.concurrency)
+    report['trace'] = args.trace
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['comparison'], regressions = compare(report, baseline, args.max_regression)
+        for name, change in report['comparison'].items():
+            logger.info(f"{name}: {change['baseline']} -> {change['current']} ({change['change']:+.1%})")
+        if regressions:
+            logger.error(f"Regressed beyond {args.max_regression:.0%}: {', '.join(regressions)}")
+            status = 1
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
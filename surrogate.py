@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Local surrogate model for cascade inference.
+
+A cheap classifier trained offline on the same 16 features that
+preprocess_inference_data produces. TransactionPredictor uses it to answer
+rows it is confident about and only escalates the rest to TabPFN.
+
+Train it with:
+    python surrogate.py --data labeled.csv --transformers models/tabpfn-client/transformers.pkl
+"""
+
+import argparse
+import logging
+import pickle
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.ensemble import HistGradientBoostingClassifier
+# preprocess_text must be importable from __main__ to unpickle transformers.pkl
+from preprocessing import preprocess_data, preprocess_text
+
+logger = logging.getLogger(__name__)
+
+
+class SurrogateModel:
+    """Classifier over the preprocessed feature columns it was trained on."""
+
+    def __init__(self, estimator, feature_names):
+        self.estimator = estimator
+        self.feature_names = list(feature_names)
+
+    @property
+    def classes(self):
+        return list(self.estimator.classes_)
+
+    def predict(self, features):
+        """Predict categories and their probabilities.
+
+        Args:
+            features: DataFrame from preprocess_inference_data
+
+        Returns:
+            Tuple of (categories, confidences) arrays
+        """
+        probabilities = self.estimator.predict_proba(features[self.feature_names].to_numpy())
+        best = probabilities.argmax(axis=1)
+        return self.estimator.classes_[best], probabilities[np.arange(len(best)), best]
+
+
+def train_surrogate(df, transformers, model='logistic'):
+    """Train a surrogate on labeled transactions.
+
+    Args:
+        df: DataFrame with transaction columns and a 'category' label
+        transformers: Dictionary with 'scaler', 'tfidf' and 'pca' transformers
+        model: 'logistic' (logistic regression) or 'gbm' (gradient boosting)
+
+    Returns:
+        Trained SurrogateModel
+    """
+    labeled = df.dropna(subset=['category'])
+    features = preprocess_data(labeled, transformers=transformers, is_training=True)
+    labels = labeled['category'].to_numpy()
+
+    if model == 'logistic':
+        estimator = LogisticRegression(max_iter=1000)
+    elif model == 'gbm':
+        estimator = HistGradientBoostingClassifier()
+    else:
+        raise ValueError(f"Unknown surrogate model: {model}")
+
+    logger.info(f"Training {model} surrogate on {len(labeled)} transactions, {features.shape[1]} features")
+    estimator.fit(features.to_numpy(), labels)
+    return SurrogateModel(estimator, features.columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local surrogate model for cascade inference")
+    parser.add_argument("--data", required=True, help="CSV with dateOp, transaction_description, amount and category columns")
+    parser.add_argument("--transformers", required=True, help="Path to transformers.pkl")
+    parser.add_argument("--output", default="models/tabpfn-client/surrogate.pkl", help="Where to write the surrogate")
+    parser.add_argument("--model", choices=['logistic', 'gbm'], default='logistic')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with open(args.transformers, 'rb') as f:
+        transformers = pickle.load(f)
+
+    # Build the model through the importable module so it is pickled as
+    # surrogate.SurrogateModel rather than __main__.SurrogateModel
+    from surrogate import train_surrogate as train
+
+    df = pd.read_csv(args.data)
+    surrogate = train(df, transformers, model=args.model)
+
+    with open(args.output, 'wb') as f:
+        pickle.dump(surrogate, f)
+    logger.info(f"Surrogate with classes {surrogate.classes} saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Pooled asyncio HTTP transport for TabPFN inference calls.
+
+One AsyncTabPFNTransport per process owns an httpx.AsyncClient running on a
+dedicated event-loop thread, so its connection pool (and the keep-alive
+connections in it) outlives individual requests on a warm instance and is
+shared by synchronous callers (Flask request threads) and coroutines on any
+event loop alike.
+
+Escalated rows are split into calls of at most ``max_rows_per_call`` rows,
+sent concurrently but never more than ``max_in_flight`` at a time, each
+with its own timeout. Non-2xx answers raise httpx.HTTPStatusError, whose
+``response`` is what TransactionPredictor._handle_api_error inspects (e.g.
+429 with ``next_available_at``).
+
+An optional HedgingPolicy cuts tail latency: when a call has not returned
+after the observed p95 latency, a duplicate is sent and whichever answers
+first wins, with the share of hedged calls capped so duplicates cannot eat
+much of the TabPFN quota.
+
+Protocol: ``POST {base_url}/predict`` with ``{"rows": [...]}`` answered by
+``{"predictions": [{"category": ..., "confidence": ...}, ...]}``, one
+prediction per row, in order.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - depends on the environment
+    HTTP2_AVAILABLE = False
+
+# Row fields sent to the API
+REQUEST_FIELDS = ('dateOp', 'transaction_description', 'amount')
+
+
+class HedgingPolicy:
+    """When to send a duplicate of a slow call.
+
+    Args:
+        percentile: Latency percentile after which a call is hedged
+        max_hedge_rate: Largest share of calls that may be hedged
+        min_samples: Latencies observed before hedging starts
+        window: Recent latencies the percentile is computed over
+        min_delay_s: Never hedge sooner than this
+    """
+
+    def __init__(self, percentile=0.95, max_hedge_rate=0.05, min_samples=20, window=500, min_delay_s=0.005):
+        self.percentile = percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.min_delay_s = min_delay_s
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.hedges_issued = 0
+        self.hedges_won = 0
+
+    def record(self, latency_s):
+        """Record the latency of a completed call."""
+        with self._lock:
+            self._latencies.append(latency_s)
+
+    def delay(self):
+        """Seconds to wait before hedging a new call, or None while still warming up."""
+        with self._lock:
+            self.calls += 1
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = np.fromiter(self._latencies, dtype=float)
+        return max(self.min_delay_s, float(np.quantile(latencies, self.percentile)))
+
+    def try_hedge(self):
+        """Claim a hedge if the hedge rate stays under the cap."""
+        with self._lock:
+            if self.hedges_issued + 1 > self.max_hedge_rate * self.calls:
+                return False
+            self.hedges_issued += 1
+            return True
+
+    def won(self):
+        with self._lock:
+            self.hedges_won += 1
+
+    def stats(self):
+        with self._lock:
+            return {'hedged_calls': self.calls, 'hedges_issued': self.hedges_issued, 'hedges_won': self.hedges_won}
+
+
+class AsyncTabPFNTransport:
+    """Connection-pooled, concurrency-bounded client for the TabPFN API.
+
+    Args:
+        base_url: API root, e.g. https://tabpfn.example.com/v1
+        token: Bearer token sent with every call
+        max_connections: Size of the connection pool
+        max_in_flight: Calls awaiting a response at once
+        max_rows_per_call: Rows sent in a single call
+        timeout_s: Per-call timeout (read, write and pool wait)
+        connect_timeout_s: Timeout for opening a connection
+        keepalive_expiry_s: Idle time after which pooled connections close
+        http2: Negotiate HTTP/2 when the h2 package is installed
+        hedging: Optional HedgingPolicy for duplicating slow calls
+        transport: httpx transport override, for tests
+    """
+
+    def __init__(self, base_url, token=None, max_connections=16, max_in_flight=8, max_rows_per_call=500,
+                 timeout_s=30.0, connect_timeout_s=5.0, keepalive_expiry_s=60.0, http2=True, hedging=None, transport=None):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.max_in_flight = max_in_flight
+        self.max_rows_per_call = max_rows_per_call
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.hedging = hedging
+        self._client_options = {
+            'base_url': self.base_url,
+            'headers': {'Authorization': f'Bearer {token}'} if token else {},
+            'limits': httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry_s
+            ),
+            'timeout': httpx.Timeout(timeout_s, connect=connect_timeout_s),
+            'http2': self.http2,
+            'transport': transport
+        }
+
+        self._start_lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._semaphore = None
+
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.rows = 0
+        self.failures = 0
+
+    def _ensure_started(self):
+        """Start the event-loop thread and client on first use."""
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self._client = httpx.AsyncClient(**self._client_options)
+                    self._semaphore = asyncio.Semaphore(self.max_in_flight)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name='tabpfn-transport', daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+                logger.info(
+                    f"TabPFN transport started for {self.base_url} "
+                    f"(max {self.max_in_flight} calls in flight, HTTP/2: {self.http2})"
+                )
+        return self._loop
+
+    async def predict_async(self, rows):
+        """Predict ``rows`` (list of dicts) from a coroutine on any event loop."""
+        if not rows:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._predict(rows), self._ensure_started())
+        return await asyncio.wrap_future(future)
+
+    def predict(self, rows):
+        """Blocking variant of predict_async for request threads."""
+        if not rows:
+            return []
+        return asyncio.run_coroutine_threadsafe(self._predict(rows), self._ensure_started()).result()
+
+    async def _predict(self, rows):
+        chunks = [rows[i:i + self.max_rows_per_call] for i in range(0, len(rows), self.max_rows_per_call)]
+        answers = await asyncio.gather(*(self._call(chunk) for chunk in chunks))
+        return [prediction for answer in answers for prediction in answer]
+
+    async def _call(self, rows):
+        payload = {'rows': [{k: row.get(k) for k in REQUEST_FIELDS} for row in rows]}
+        if self.hedging is None:
+            predictions = await self._send(payload)
+        else:
+            predictions = await self._hedged_send(payload)
+        if len(predictions) != len(rows):
+            raise ValueError(f"TabPFN API returned {len(predictions)} predictions for {len(rows)} rows")
+        with self._stats_lock:
+            self.calls += 1
+            self.rows += len(rows)
+        return predictions
+
+    async def _hedged_send(self, payload):
+        """Send ``payload``, duplicating it if it is slower than the hedging percentile."""
+        # The hedge delay runs from when the primary holds a slot: time spent
+        # queued behind max_in_flight says nothing about the server
+        await self._semaphore.acquire()
+        primary = asyncio.ensure_future(self._post(payload))
+        primary.add_done_callback(lambda _: self._semaphore.release())
+        delay = self.hedging.delay()
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self.hedging.try_hedge():
+            return await primary
+
+        logger.debug("Hedging a TabPFN call after %.3fs", delay)
+        hedge = asyncio.ensure_future(self._send(payload))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if task is hedge:
+                        self.hedging.won()
+                    return task.result()
+        # Both failed: report the original call's error
+        return primary.result()
+
+    async def _send(self, payload):
+        async with self._semaphore:
+            return await self._post(payload)
+
+    async def _post(self, payload):
+        """POST one call; the caller holds a slot of the semaphore."""
+        started = time.perf_counter()
+        try:
+            response = await self._client.post('/predict', json=payload)
+            response.raise_for_status()
+            predictions = response.json()['predictions']
+        except asyncio.CancelledError:
+            # A hedging loser: it would have taken at least this long, and
+            # leaving it out would drag the percentile below the real tail
+            if self.hedging is not None:
+                self.hedging.record(time.perf_counter() - started)
+            raise
+        except Exception:
+            with self._stats_lock:
+                self.failures += 1
+            raise
+        if self.hedging is not None:
+            self.hedging.record(time.perf_counter() - started)
+        return predictions
+
+    def stats(self):
+        """Return call counters."""
+        with self._stats_lock:
+            stats = {'calls': self.calls, 'rows': self.rows, 'failures': self.failures}
+        if self.hedging is not None:
+            stats.update(self.hedging.stats())
+        return stats
+
+    def close(self):
+        """Close pooled connections and stop the event-loop thread."""
+        with self._start_lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+            self._thread = None
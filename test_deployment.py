@@ -1,128 +1,353 @@
 #!/usr/bin/env python3
 """
-Test script to verify the TabPFN cloud function deployment
+Load test (and smoke test) for the TabPFN cloud function.
+
+Drives infer_category, deployed (--url) or served locally in-process
+through functions_framework (--local), with synthetic transactions and
+reports throughput, latency percentiles and error rates as JSON.
+
+Modes:
+    closed loop  --concurrency N workers, each sending its next request as
+                 soon as the previous one returns
+    open loop    --rate R requests/s with Poisson arrivals, whatever the
+                 response times; latency is measured from the scheduled
+                 send time so a slow server is not hidden by a slow client
+
+Batch sizes follow --batch-sizes: ``fixed:N``, ``uniform:LOW,HIGH``,
+``lognormal:MEDIAN,SIGMA`` or ``choice:A,B,C``.
+
+Usage:
+    python test_deployment.py --url https://.../infer-category --verbose
+    python test_deployment.py --url https://.../infer-category --concurrency 16 --duration 60 --batch-sizes lognormal:50,1
+    python test_deployment.py --local --rate 20 --requests 500 --report load_report.json
+
+With only --url it sends a single request and prints the predictions, the
+smoke check this script used to be. Exits non-zero if the error rate
+exceeds --max-error-rate.
 """
 
-import requests
+import sys
 import json
+import time
 import logging
 import argparse
-import sys
-import time
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def test_function(url, test_data=None, verbose=False):
-    """Test the deployed cloud function with sample transaction data."""
-    
-    if test_data is None:
-        # Default test data
-        test_data = {
-            "transactions": [
-                {
-                    "date": "2023-01-01",
-                    "description": "GROCERY STORE",
-                    "amount": -45.67
-                },
-                {
-                    "date": "2023-01-02", 
-                    "description": "UBER RIDE",
-                    "amount": -12.50
-                },
-                {
-                    "date": "2023-01-03",
-                    "description": "SALARY DEPOSIT",
-                    "amount": 2000.00
-                }
-            ]
+PERCENTILES = (50, 90, 95, 99)
+
+
+class BatchSizes:
+    """Distribution of the number of transactions per request."""
+
+    def __init__(self, spec, seed=0):
+        self.spec = spec
+        kind, _, args = spec.partition(':')
+        self.kind = kind if args else 'fixed'
+        self.args = [float(a) for a in (args or kind).split(',')]
+        if self.kind not in ('fixed', 'uniform', 'lognormal', 'choice'):
+            raise ValueError(f"Unknown batch size distribution: {spec}")
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            if self.kind == 'uniform':
+                size = self._rng.integers(int(self.args[0]), int(self.args[1]) + 1)
+            elif self.kind == 'lognormal':
+                median, sigma = self.args
+                size = median * np.exp(self._rng.normal(0, sigma))
+            elif self.kind == 'choice':
+                size = self._rng.choice(self.args)
+            else:
+                size = self.args[0]
+        return max(1, int(round(size)))
+
+
+class Workload:
+    """Request bodies: slices of a pool of synthetic transactions, or a fixed payload."""
+
+    def __init__(self, batch_sizes, pool_rows=10000, payload=None, seed=0):
+        self.batch_sizes = batch_sizes
+        self.payload = payload
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self.pool = []
+        if payload is None:
+            from tests.fixtures import make_labeled_transactions
+            self.pool = make_labeled_transactions(pool_rows, seed=seed).drop(columns=['category']).to_dict('records')
+
+    def next_body(self):
+        if self.payload is not None:
+            return self.payload
+        size = min(self.batch_sizes.sample(), len(self.pool))
+        with self._lock:
+            start = int(self._rng.integers(0, len(self.pool) - size + 1))
+        return {'transactions': self.pool[start:start + size]}
+
+
+class Recorder:
+    """Outcome of every request of a run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.rows = 0
+        self.statuses = {}
+        self.errors = {}
+        self.failed = 0
+
+    def record(self, latency_s, status, rows, error=None):
+        with self._lock:
+            self.latencies.append(latency_s)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if error is None:
+                self.rows += rows
+            else:
+                self.failed += 1
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+    def report(self, elapsed_s):
+        latencies_ms = np.array(self.latencies) * 1000
+        n = len(latencies_ms)
+        report = {
+            'requests': n,
+            'failed': self.failed,
+            'error_rate': round(self.failed / n, 4) if n else 0.0,
+            'rows': self.rows,
+            'elapsed_s': round(elapsed_s, 3),
+            'throughput_rps': round(n / elapsed_s, 2) if elapsed_s > 0 else 0.0,
+            'rows_per_s': round(self.rows / elapsed_s, 1) if elapsed_s > 0 else 0.0,
+            'status_counts': {str(k): v for k, v in sorted(self.statuses.items(), key=lambda kv: str(kv[0]))},
+            'errors': self.errors
         }
-    
-    logger.info(f"Testing function at URL: {url}")
+        if n:
+            report['latency_ms'] = {f'p{p}': round(float(np.percentile(latencies_ms, p)), 2) for p in PERCENTILES}
+            report['latency_ms'].update(
+                mean=round(float(latencies_ms.mean()), 2),
+                max=round(float(latencies_ms.max()), 2)
+            )
+        return report
+
+
+def send_request(client, url, body, recorder, started=None, verbose=False):
+    """Send one request and record its outcome; ``started`` is the scheduled send time."""
+    started = time.perf_counter() if started is None else started
+    rows = len(body.get('transactions', []))
+    try:
+        response = client.post(url, json=body)
+    except httpx.HTTPError as e:
+        recorder.record(time.perf_counter() - started, 'connection_error', rows, type(e).__name__)
+        return None
+    latency = time.perf_counter() - started
+
+    error = None
+    if response.status_code != 200:
+        try:
+            error = response.json().get('error', f'HTTP {response.status_code}')
+        except ValueError:
+            error = f'HTTP {response.status_code}'
+    recorder.record(latency, response.status_code, rows, error)
+
     if verbose:
-        logger.info(f"Test data: {json.dumps(test_data, indent=2)}")
-    
+        log_response(response, latency)
+    return response
+
+
+def log_response(response, latency):
+    logger.info(f"Response status code: {response.status_code}")
+    logger.info(f"Response time: {latency:.2f} seconds")
     try:
-        start_time = time.time()
-        response = requests.post(
-            url,
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(test_data)
+        result = response.json()
+    except ValueError:
+        logger.error(f"Response: {response.text}")
+        return
+    if not result.get('success', False):
+        logger.error(f"❌ Function returned failure response: {json.dumps(result)}")
+        return
+
+    logger.info("✅ Function returned success response")
+    logger.info(f"Mode: {result.get('mode', 'unknown')}, model version: {result.get('model_version', 'unknown')}")
+    # Handle nested results structure
+    results_data = result.get('results', [])
+    if isinstance(results_data, dict):
+        results_data = results_data.get('results', [])
+    for i, res in enumerate(results_data):
+        logger.info(
+            f"Transaction {i+1}: {res.get('description', '')} → {res.get('predicted_category', 'unknown')} "
+            f"(confidence: {res.get('confidence', 0):.2f})"
         )
-        end_time = time.time()
-        
-        # Check response
-        logger.info(f"Response status code: {response.status_code}")
-        logger.info(f"Response time: {end_time - start_time:.2f} seconds")
-        
-        if response.status_code == 200:
-            result = response.json()
-            if verbose:
-                logger.info(f"Full response: {json.dumps(result, indent=2)}")
-            
-            # Check for success flag
-            if result.get("success", False):
-                logger.info("✅ Function returned success response")
-                logger.info(f"Mode: {result.get('mode', 'unknown')}")
-                # Handle nested total_processed
-                total_processed = result.get('total_processed', 0)
-                if isinstance(result.get('results'), dict):
-                    total_processed = result.get('results', {}).get('total_processed', total_processed)
-                
-                logger.info(f"Processed {total_processed} transactions")
-                
-                # Check for predicted categories
-                # Handle nested results structure
-                results_data = result.get("results", [])
-                if isinstance(results_data, dict) and "results" in results_data:
-                    results_data = results_data.get("results", [])
-                
-                for i, res in enumerate(results_data):
-                    logger.info(f"Transaction {i+1}: {res.get('description', '')} → {res.get('predicted_category', 'unknown')} (confidence: {res.get('confidence', 0):.2f})")
-                
-                return True
-            else:
-                logger.error("❌ Function returned failure response")
-                logger.error(f"Errors: {result.get('errors', [])}")
-                return False
+
+
+def run_closed_loop(client, url, workload, recorder, concurrency, n_requests=None, duration_s=None, verbose=False):
+    """``concurrency`` workers sending back-to-back requests until the count or duration is reached."""
+    deadline = time.perf_counter() + duration_s if duration_s else None
+    sent = [0]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if n_requests is not None and sent[0] >= n_requests:
+                    return
+                sent[0] += 1
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            send_request(client, url, workload.next_body(), recorder, verbose=verbose)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_open_loop(client, url, workload, recorder, rate, n_requests=None, duration_s=None, max_in_flight=256, seed=0):
+    """Send requests at Poisson arrival times averaging ``rate`` per second."""
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    scheduled = start
+    count = 0
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        while n_requests is None or count < n_requests:
+            scheduled += rng.exponential(1.0 / rate)
+            if duration_s is not None and scheduled - start >= duration_s:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send_request, client, url, workload.next_body(), recorder, scheduled)
+            count += 1
+
+
+class LocalServer:
+    """Serve infer_category in-process through functions_framework on a free port."""
+
+    def __init__(self, source='main.py', target='infer_category'):
+        import functions_framework
+        from werkzeug.serving import make_server
+
+        app = functions_framework.create_app(target=target, source=source)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+
+
+def run_load_test(url, concurrency=1, rate=None, n_requests=None, duration_s=None, batch_sizes='fixed:3',
+                  payload=None, timeout_s=120.0, max_in_flight=256, seed=0, verbose=False, headers=None):
+    """Run one load test against ``url`` and return the report dictionary.
+
+    ``headers`` (e.g. ``X-Caller-Key`` or ``Authorization``) are sent with every request.
+    """
+    if n_requests is None and duration_s is None:
+        n_requests = 1
+    workload = Workload(BatchSizes(batch_sizes, seed=seed), payload=payload, seed=seed)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=max(concurrency, max_in_flight if rate else 0, 1))
+
+    with httpx.Client(timeout=timeout_s, limits=limits, headers=headers) as client:
+        started = time.perf_counter()
+        if rate:
+            run_open_loop(client, url, workload, recorder, rate, n_requests, duration_s, max_in_flight, seed)
         else:
-            logger.error(f"❌ Failed with status code {response.status_code}")
-            logger.error(f"Response: {response.text}")
-            return False
-            
-    except requests.RequestException as e:
-        logger.error(f"❌ Request failed: {str(e)}")
-        return False
-    except Exception as e:
-        logger.error(f"❌ Unexpected error: {str(e)}")
-        return False
+            run_closed_loop(client, url, workload, recorder, concurrency, n_requests, duration_s, verbose)
+        elapsed = time.perf_counter() - started
+
+    report = {
+        'url': url,
+        'mode': 'open_loop' if rate else 'closed_loop',
+        'concurrency': None if rate else concurrency,
+        'rate_rps': rate,
+        'batch_sizes': batch_sizes if payload is None else 'payload'
+    }
+    report.update(recorder.report(elapsed))
+    return report
+
 
 def main():
-    parser = argparse.ArgumentParser(description="Test the TabPFN cloud function deployment")
-    parser.add_argument("--url", required=True, help="URL of the deployed cloud function")
-    parser.add_argument("--verbose", "-v", action="store_true", help="Show detailed output")
-    parser.add_argument("--data", "-d", help="Path to JSON file with test data (optional)")
-    
+    parser = argparse.ArgumentParser(description="Load test the TabPFN cloud function")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="URL of the deployed cloud function")
+    target.add_argument("--local", action="store_true", help="Serve main.py in-process with functions_framework")
+    parser.add_argument("--concurrency", "-c", type=int, default=1, help="Closed-loop workers")
+    parser.add_argument("--rate", type=float, default=None, help="Open-loop arrival rate (requests/s)")
+    parser.add_argument("--requests", "-n", type=int, default=None, help="Requests to send (default 1 without --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to run")
+    parser.add_argument("--batch-sizes", default="fixed:3", help="fixed:N, uniform:LOW,HIGH, lognormal:MEDIAN,SIGMA or choice:A,B")
+    parser.add_argument("--data", "-d", help="JSON file with a request body to send instead of synthetic batches")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Open-loop cap on concurrent requests")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="Write the JSON report to this file")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="Fail when the error rate is above this")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Log every response (closed loop)")
+    parser.add_argument("--caller-key", help="Secret sent in X-Caller-Key when the function has CALLER_KEYS set")
+    parser.add_argument("--header", "-H", action="append", default=[], metavar="'NAME: VALUE'",
+                        help="Extra header sent with every request (repeatable), e.g. 'Authorization: Bearer TOKEN'")
     args = parser.parse_args()
-    
-    # Load test data from file if provided
-    test_data = None
+
+    headers = {}
+    for header in args.header:
+        name, sep, value = header.partition(':')
+        if not sep or not name.strip():
+            logger.error(f"Invalid --header {header!r}, expected 'NAME: VALUE'")
+            return 1
+        headers[name.strip()] = value.strip()
+    if args.caller_key:
+        headers['X-Caller-Key'] = args.caller_key
+
+    payload = None
     if args.data:
         try:
             with open(args.data, 'r') as f:
-                test_data = json.load(f)
+                payload = json.load(f)
             logger.info(f"Loaded test data from {args.data}")
         except Exception as e:
             logger.error(f"Failed to load test data: {str(e)}")
             return 1
-    
-    # Run the test
-    success = test_function(args.url, test_data, args.verbose)
-    
-    # Return appropriate exit code
-    return 0 if success else 1
+
+    verbose = args.verbose or (args.requests is None and args.duration is None)
+    options = dict(
+        concurrency=args.concurrency, rate=args.rate, n_requests=args.requests, duration_s=args.duration,
+        batch_sizes=args.batch_sizes, payload=payload, timeout_s=args.timeout,
+        max_in_flight=args.max_in_flight, seed=args.seed, verbose=verbose, headers=headers
+    )
+
+    if args.local:
+        with LocalServer() as server:
+            if not verbose:
+                # Keep the function's per-request logs out of the way of the report
+                logging.getLogger().setLevel(logging.WARNING)
+                logger.setLevel(logging.INFO)
+            logger.info(f"Serving infer_category locally at {server.url}")
+            report = run_load_test(server.url, **options)
+    else:
+        logger.info(f"Testing function at URL: {args.url}")
+        report = run_load_test(args.url, **options)
+
+    output = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(output)
+        logger.info(f"Report written to {args.report}")
+    print(output)
+
+    return 0 if report['error_rate'] <= args.max_error_rate and report['requests'] > 0 else 1
+
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""Synthetic labeled transactions and transformers shared by the tests."""
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.decomposition import PCA
+
+from preprocessing import preprocess_text
+
+# (category, description templates, amount range)
+CATEGORY_TEMPLATES = [
+    ('Transport', ['CARTE SNCF {ref}', 'UBER TRIP {ref}', 'RATP NAVIGO {ref}'], (-80, -5)),
+    ('Logement', ['LOYER {ref}', 'EDF FACTURE {ref}', 'EAU DE PARIS {ref}'], (-1200, -40)),
+    ('Alimentation', ['CARREFOUR MARKET {ref}', 'MONOPRIX {ref}', 'AUCHAN {ref}'], (-150, -3)),
+    ('Loisirs', ['FNAC {ref}', 'SPOTIFY {ref}', 'CINEMA UGC {ref}'], (-60, -8)),
+    ('Revenus', ['SALAIRE ACME {ref}', 'VIREMENT SALARY {ref}'], (1500, 4000)),
+]
+
+
+def make_labeled_transactions(n_rows, seed=0):
+    """Generate labeled transactions with realistic-looking descriptions."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_rows):
+        category, templates, (low, high) = CATEGORY_TEMPLATES[rng.integers(len(CATEGORY_TEMPLATES))]
+        description = templates[rng.integers(len(templates))].format(ref=rng.integers(10000, 99999))
+        date = pd.Timestamp('2024-01-01') + pd.Timedelta(days=int(rng.integers(365)))
+        rows.append({
+            'id': i,
+            'dateOp': date.strftime('%d/%m/%Y'),
+            'transaction_description': description,
+            'amount': round(float(rng.uniform(low, high)), 2),
+            'category': category
+        })
+    return pd.DataFrame(rows)
+
+
+def fit_transformers(df):
+    """Fit the scaler / TF-IDF / PCA trio that validate_transformers expects."""
+    amounts = df['amount'].astype(float)
+    scaler = StandardScaler().fit(pd.DataFrame({'amount': amounts, 'absolute_amount': amounts.abs()}))
+    tfidf = TfidfVectorizer().fit(df['transaction_description'].apply(preprocess_text))
+    pca = PCA(n_components=10, random_state=0).fit(
+        tfidf.transform(df['transaction_description'].apply(preprocess_text)).toarray()
+    )
+    return {'scaler': scaler, 'tfidf': tfidf, 'pca': pca}
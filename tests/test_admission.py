@@ -0,0 +1,154 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import json
+import time
+import threading
+import flask
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+import metrics
+from admission import AdmissionController, AdmissionRejected
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def test_admits_within_capacity_and_releases(self):
+        controller = AdmissionController(max_inflight_rows=100)
+
+        with controller.admit(60):
+            with controller.admit(40):
+                self.assertEqual(controller.stats()['inflight_rows'], 100)
+
+        stats = controller.stats()
+        self.assertEqual(stats['inflight_rows'], 0)
+        self.assertEqual(stats['admitted'], 2)
+
+    def test_idle_instance_admits_oversized_request(self):
+        controller = AdmissionController(max_inflight_rows=100)
+        with controller.admit(500):
+            self.assertEqual(controller.stats()['inflight_rows'], 500)
+
+    def test_large_requests_leave_headroom_for_small_ones(self):
+        controller = AdmissionController(
+            max_inflight_rows=1000, max_wait_s=0.05, small_request_rows=50, large_request_share=0.75
+        )
+
+        with controller.admit(600):
+            # 600 + 200 exceeds the 750 rows large requests may use
+            with self.assertRaises(AdmissionRejected):
+                controller.admit(200)
+            # ...but a small interactive request still fits
+            with controller.admit(50):
+                pass
+
+    def test_full_queue_rejects_immediately(self):
+        controller = AdmissionController(max_inflight_rows=100, max_queue_rows=50, max_wait_s=5)
+
+        with controller.admit(100):
+            started = time.monotonic()
+            with self.assertRaises(AdmissionRejected) as ctx:
+                controller.admit(80)
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(controller.stats()['rejected'], 1)
+
+    def test_queued_request_admitted_when_capacity_frees(self):
+        controller = AdmissionController(max_inflight_rows=100, max_wait_s=5)
+        ticket = controller.admit(100)
+        admitted = threading.Event()
+
+        def waiter():
+            with controller.admit(30):
+                admitted.set()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual(controller.stats()['queue_depth'], 1)
+        self.assertFalse(admitted.is_set())
+
+        with ticket:
+            pass
+        thread.join(timeout=2)
+        self.assertTrue(admitted.is_set())
+        self.assertEqual(controller.stats()['queue_depth'], 0)
+
+    def test_small_requests_jump_the_queue(self):
+        controller = AdmissionController(max_inflight_rows=100, max_wait_s=5, small_request_rows=10)
+        ticket = controller.admit(100)
+        order = []
+
+        def request(name, n_rows):
+            with controller.admit(n_rows):
+                order.append(name)
+                time.sleep(0.05)
+
+        large = threading.Thread(target=request, args=('large', 90))
+        large.start()
+        time.sleep(0.05)
+        small = threading.Thread(target=request, args=('small', 10))
+        small.start()
+        time.sleep(0.05)
+
+        with ticket:
+            pass
+        large.join(timeout=2)
+        small.join(timeout=2)
+        self.assertEqual(order, ['small', 'large'])
+
+
+class TestAdmissionMetrics(unittest.TestCase):
+
+    def tearDown(self):
+        main.admission.publish_metrics()
+
+    def test_queue_and_rejections_are_published(self):
+        controller = AdmissionController(max_inflight_rows=10, max_queue_rows=0)
+        controller.publish_metrics()
+        rejected = metrics.ADMISSION_DECISIONS.value(result='queue_full')
+
+        with controller.admit(8):
+            self.assertEqual(metrics.ADMISSION_INFLIGHT_ROWS.value(), 8)
+            with self.assertRaises(AdmissionRejected):
+                controller.admit(5)
+
+        self.assertEqual(metrics.ADMISSION_DECISIONS.value(result='queue_full'), rejected + 1)
+        lines = metrics.render().splitlines()
+        self.assertIn('# TYPE admission_queue_depth gauge', lines)
+        self.assertIn('admission_queue_depth 0.0', lines)
+        self.assertIn('admission_inflight_rows 0.0', lines)
+
+
+class TestLoadShedding(unittest.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.app.testing = True
+        main.predictor = MagicMock()
+        main.predictor.model_version = 'tabpfn-1'
+
+    def tearDown(self):
+        main.predictor = None
+
+    def test_overloaded_instance_returns_503_with_retry_after(self):
+        controller = AdmissionController(max_inflight_rows=10, max_queue_rows=0)
+        with patch('main.admission', controller), controller.admit(10):
+            with self.app.test_request_context(
+                '/infer-category', method='POST',
+                json={'transactions': [{'id': 1, 'dateOp': '2024-01-15', 'transaction_description': 'x', 'amount': 1}]}
+            ):
+                response_body, status_code, headers = main.infer_category(flask.request)
+
+        self.assertEqual(status_code, 503)
+        self.assertEqual(json.loads(response_body)['error'], 'OVERLOADED')
+        self.assertIn('Retry-After', headers)
+        main.predictor.predict.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import flask
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+from artifact_watcher import ArtifactWatcher, LocalArtifactSource
+from predictor import TransactionPredictor
+
+TRANSACTIONS = [
+    {"id": "1", "dateOp": "2023-01-01", "transaction_description": "SNCF PARIS", "amount": -50.00},
+    {"id": "2", "dateOp": "2023-01-02", "transaction_description": "LOYER JANVIER", "amount": -800.00},
+]
+
+
+class FakeSource:
+    def __init__(self, generation):
+        self.value = generation
+
+    def generation(self):
+        return self.value
+
+
+class FakePredictor:
+    def __init__(self, generation):
+        self.generation = generation
+        self.cleaned_up = False
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+class SlowPredictor(TransactionPredictor):
+    """Mock predictor whose predictions wait for a release event."""
+
+    def __init__(self, artifact_version, release):
+        super().__init__(use_mock=True, artifact_version=artifact_version)
+        self.release = release
+
+    def predict(self, transactions, positions=None):
+        self.release.wait(5)
+        return super().predict(transactions, positions)
+
+
+class TestArtifactWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.source = FakeSource('g1')
+        self.current = FakePredictor('g1')
+        self.loads = []
+
+        def load(generation):
+            self.loads.append(generation)
+            if generation == 'broken':
+                raise ValueError("corrupt artifact")
+            return FakePredictor(generation)
+
+        def swap(new_predictor):
+            old, self.current = self.current, new_predictor
+            return old
+
+        self.watcher = ArtifactWatcher(self.source, load, swap, retire_grace_s=0, generation='g1')
+
+    def test_reloads_after_generation_settles(self):
+        self.assertFalse(self.watcher.check())
+
+        self.source.value = 'g2'
+        # Seen once: may still be uploading
+        self.assertFalse(self.watcher.check())
+        self.assertEqual(self.loads, [])
+
+        old = self.current
+        self.assertTrue(self.watcher.check())
+        self.assertEqual(self.current.generation, 'g2')
+        self.assertEqual(self.watcher.generation, 'g2')
+
+        # The replaced predictor is cleaned up once its grace period is over
+        self.watcher.check()
+        self.assertTrue(old.cleaned_up)
+
+    def test_failed_load_keeps_current_predictor(self):
+        self.source.value = 'broken'
+        self.watcher.check()
+        self.assertFalse(self.watcher.check())
+        self.assertEqual(self.current.generation, 'g1')
+        self.assertEqual(self.watcher.failures, 1)
+
+        # A broken generation is not retried on every poll
+        self.watcher.check()
+        self.watcher.check()
+        self.assertEqual(self.loads, ['broken'])
+
+    def test_local_source_changes_with_files(self):
+        with tempfile.TemporaryDirectory() as model_dir:
+            source = LocalArtifactSource(model_dir)
+            self.assertIsNone(source.generation())
+
+            path = os.path.join(model_dir, 'transformers.pkl')
+            with open(path, 'wb') as f:
+                f.write(b'v1')
+            first = source.generation()
+
+            with open(path, 'wb') as f:
+                f.write(b'version 2')
+            os.utime(path, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+            self.assertNotEqual(source.generation(), first)
+
+
+class TestHotSwap(unittest.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.app.testing = True
+
+    def tearDown(self):
+        main.predictor = None
+        main.coalescer = None
+
+    def _call(self):
+        with self.app.test_request_context('/infer-category', method='POST', json={"transactions": TRANSACTIONS}):
+            body, status, headers = main.infer_category(flask.request)
+        return status, json.loads(body), headers
+
+    def test_in_flight_requests_finish_on_old_version(self):
+        release_old = threading.Event()
+        release_new = threading.Event()
+        release_new.set()
+        main.swap_predictor(SlowPredictor('old', release_old))
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            in_flight = pool.submit(self._call)
+            time.sleep(0.1)
+
+            old = main.swap_predictor(SlowPredictor('new', release_new))
+            self.assertEqual(old.artifact_version, 'old')
+
+            status, data, headers = self._call()
+            self.assertEqual(status, 200)
+            self.assertEqual(data['model_version'], 'mock-new')
+            self.assertEqual(headers['X-Model-Version'], 'mock-new')
+
+            release_old.set()
+            status, data, headers = in_flight.result()
+            self.assertEqual(status, 200)
+            self.assertEqual(data['model_version'], 'mock-old')
+            self.assertEqual(headers['X-Model-Version'], 'mock-old')
+
+    @patch('main.COALESCE_MAX_WAIT_MS', 5)
+    def test_stale_coalescer_is_bypassed(self):
+        release = threading.Event()
+        release.set()
+        main.swap_predictor(SlowPredictor('old', release))
+        old_coalescer = main.coalescer
+        main.predictor = SlowPredictor('new', release)
+
+        status, data, headers = self._call()
+        self.assertEqual(status, 200)
+        self.assertEqual(data['model_version'], 'mock-new')
+        self.assertEqual(old_coalescer.stats()['requests'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import tempfile
+import pandas as pd
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import batch_categorize
+from batch_categorize import categorize_file, read_chunks
+from tests.fixtures import make_labeled_transactions
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+MOCK_OPTIONS = {
+    'model_dir': 'models/tabpfn-client',
+    'use_mock': True,
+    'use_gcs': False,
+    'gcs_bucket': None,
+    'log_level': 'WARNING'
+}
+
+
+class TestBatchCategorize(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tmp_dir.name, 'export.csv')
+        self.output_path = os.path.join(self.tmp_dir.name, 'categorized.csv')
+        make_labeled_transactions(230).drop(columns=['category']).to_csv(self.input_path, index=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _read_output(self):
+        return pd.read_csv(self.output_path)
+
+    def test_categorizes_every_row_in_order(self):
+        summary = categorize_file(self.input_path, self.output_path, chunk_size=50, workers=1, options=MOCK_OPTIONS)
+
+        output = self._read_output()
+        self.assertEqual(summary['rows'], 230)
+        self.assertGreater(summary['rows_per_sec'], 0)
+        self.assertListEqual(list(output['id']), list(range(230)))
+        self.assertTrue(output['predicted_category'].notna().all())
+        self.assertFalse(os.path.exists(f'{self.output_path}.checkpoint'))
+
+    def test_process_pool_keeps_input_order(self):
+        categorize_file(self.input_path, self.output_path, chunk_size=30, workers=2, options=MOCK_OPTIONS)
+
+        output = self._read_output()
+        self.assertListEqual(list(output['id']), list(range(230)))
+
+    def test_blank_amounts_do_not_abort_the_run(self):
+        df = make_labeled_transactions(20).drop(columns=['category'])
+        df['amount'] = df['amount'].astype(object)
+        df.loc[3, 'amount'] = ''
+        df.loc[4, 'amount'] = '12,50'
+        df.to_csv(self.input_path, index=False)
+
+        chunk = next(read_chunks(self.input_path, chunk_size=10))
+        self.assertEqual(chunk['amount'].iloc[3], 0)
+        self.assertEqual(chunk['amount'].iloc[4], 12.5)
+
+        summary = categorize_file(self.input_path, self.output_path, chunk_size=10, workers=1, options=MOCK_OPTIONS)
+        self.assertEqual(summary['rows'], 20)
+        self.assertTrue(self._read_output()['predicted_category'].notna().all())
+
+    def test_resumes_after_crash(self):
+        real_predict_chunk = batch_categorize._predict_chunk
+
+        def crash_on_third_chunk(chunk_index, chunk):
+            if chunk_index == 2:
+                raise RuntimeError("worker died")
+            return real_predict_chunk(chunk_index, chunk)
+
+        with patch('batch_categorize._predict_chunk', side_effect=crash_on_third_chunk):
+            with self.assertRaises(RuntimeError):
+                categorize_file(self.input_path, self.output_path, chunk_size=50, workers=1, options=MOCK_OPTIONS)
+
+        self.assertEqual(len(self._read_output()), 100)
+        # A half-written chunk after the checkpoint is discarded on resume
+        with open(self.output_path, 'a') as f:
+            f.write('100,15/01/2024,PARTIAL')
+
+        with patch('batch_categorize._predict_chunk', wraps=real_predict_chunk) as predict_chunk, \
+                patch('batch_categorize.read_chunks', wraps=read_chunks) as read:
+            summary = categorize_file(self.input_path, self.output_path, chunk_size=50, workers=1, options=MOCK_OPTIONS)
+
+        # Completed chunks are skipped by the reader, not read and discarded
+        self.assertEqual(read.call_args.kwargs['skip_rows'], 100)
+        self.assertEqual(predict_chunk.call_count, 3)
+        self.assertEqual([c.args[0] for c in predict_chunk.call_args_list], [2, 3, 4])
+        self.assertEqual(predict_chunk.call_args_list[0].args[1]['id'].iloc[0], '100')
+        self.assertEqual(summary['rows'], 130)
+        self.assertEqual(summary['total_rows'], 230)
+        self.assertListEqual(list(self._read_output()['id']), list(range(230)))
+
+    def test_missing_output_starts_over(self):
+        real_predict_chunk = batch_categorize._predict_chunk
+
+        def crash_on_third_chunk(chunk_index, chunk):
+            if chunk_index == 2:
+                raise RuntimeError("worker died")
+            return real_predict_chunk(chunk_index, chunk)
+
+        with patch('batch_categorize._predict_chunk', side_effect=crash_on_third_chunk):
+            with self.assertRaises(RuntimeError):
+                categorize_file(self.input_path, self.output_path, chunk_size=50, workers=1, options=MOCK_OPTIONS)
+        os.remove(self.output_path)
+
+        summary = categorize_file(self.input_path, self.output_path, chunk_size=50, workers=1, options=MOCK_OPTIONS)
+
+        self.assertEqual(summary['rows'], 230)
+        self.assertListEqual(list(self._read_output()['id']), list(range(230)))
+
+    def test_checkpoint_from_other_arguments_is_rejected(self):
+        real_predict_chunk = batch_categorize._predict_chunk
+
+        def crash_on_second_chunk(chunk_index, chunk):
+            if chunk_index == 1:
+                raise RuntimeError("worker died")
+            return real_predict_chunk(chunk_index, chunk)
+
+        with patch('batch_categorize._predict_chunk', side_effect=crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                categorize_file(self.input_path, self.output_path, chunk_size=50, workers=1, options=MOCK_OPTIONS)
+
+        with self.assertRaises(ValueError):
+            categorize_file(self.input_path, self.output_path, chunk_size=40, workers=1, options=MOCK_OPTIONS)
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_reads_parquet(self):
+        parquet_path = os.path.join(self.tmp_dir.name, 'export.parquet')
+        pd.read_csv(self.input_path).to_parquet(parquet_path)
+
+        summary = categorize_file(parquet_path, self.output_path, chunk_size=64, workers=1, options=MOCK_OPTIONS)
+
+        self.assertEqual(summary['rows'], 230)
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_parquet_skips_rows_across_row_groups(self):
+        parquet_path = os.path.join(self.tmp_dir.name, 'export.parquet')
+        pd.read_csv(self.input_path).to_parquet(parquet_path, row_group_size=40)
+
+        chunks = list(read_chunks(parquet_path, 50, skip_rows=90))
+
+        self.assertListEqual(list(pd.concat(chunks)['id']), list(range(90, 230)))
+        self.assertTrue(all(len(chunk) <= 50 for chunk in chunks))
+        self.assertEqual(list(read_chunks(parquet_path, 50, skip_rows=230)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import pickle
+import tempfile
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from predictor import TransactionPredictor, preprocess_inference_data
+from surrogate import SurrogateModel, train_surrogate
+from tests.fixtures import make_labeled_transactions, fit_transformers
+
+
+class TestSurrogate(unittest.TestCase):
+
+    def test_train_and_predict(self):
+        df = make_labeled_transactions(400)
+        transformers = fit_transformers(df)
+        surrogate = train_surrogate(df, transformers)
+
+        self.assertIsInstance(surrogate, SurrogateModel)
+        self.assertEqual(len(surrogate.feature_names), 16)
+
+        test_df = make_labeled_transactions(100, seed=1)
+        categories, confidences = surrogate.predict(preprocess_inference_data(test_df, transformers))
+        accuracy = (categories == test_df['category'].to_numpy()).mean()
+        self.assertGreater(accuracy, 0.8)
+        self.assertTrue(((confidences > 0) & (confidences <= 1)).all())
+
+
+@patch('predictor._ensure_tabpfn_client')
+class TestCascadePredictor(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        train_df = make_labeled_transactions(400)
+        cls.transformers = fit_transformers(train_df)
+        cls.surrogate = train_surrogate(train_df, cls.transformers)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmp_dir.name, 'transformers.pkl'), 'wb') as f:
+            pickle.dump(self.transformers, f)
+        with open(os.path.join(self.tmp_dir.name, 'surrogate.pkl'), 'wb') as f:
+            pickle.dump(self.surrogate, f)
+        self.env = patch.dict(os.environ, {'TABPFN_API_TOKEN': 'token-1234567890'})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def _transactions(self, n_rows=50):
+        df = make_labeled_transactions(n_rows, seed=2)
+        return df.drop(columns=['category']).to_dict('records')
+
+    def test_confident_rows_answered_locally(self, _):
+        predictor = TransactionPredictor(model_dir=self.tmp_dir.name, cascade_threshold=0.5)
+        self.assertEqual([tier for tier, _, _ in predictor.cascade], ['surrogate'])
+
+        with patch.object(predictor, '_remote_predict', wraps=predictor._remote_predict) as remote:
+            result = predictor.predict(self._transactions())
+
+        self.assertTrue(result['success'])
+        tiers = [r['tier'] for r in result['results']]
+        self.assertGreater(tiers.count('surrogate'), 40)
+        escalated = tiers.count('tabpfn')
+        if escalated:
+            self.assertEqual(len(remote.call_args[0][0]), escalated)
+        else:
+            remote.assert_not_called()
+
+    def test_uncertain_rows_escalate_to_tabpfn(self, _):
+        predictor = TransactionPredictor(model_dir=self.tmp_dir.name, cascade_threshold=1.01)
+
+        result = predictor.predict(self._transactions(10))
+
+        self.assertEqual([r['tier'] for r in result['results']], ['tabpfn'] * 10)
+
+    def test_results_keep_input_order(self, _):
+        predictor = TransactionPredictor(model_dir=self.tmp_dir.name, cascade_threshold=0.9)
+        transactions = self._transactions(30)
+
+        result = predictor.predict(transactions)
+
+        self.assertEqual(
+            [r['transaction_id'] for r in result['results']],
+            [str(t['id']) for t in transactions]
+        )
+
+    def test_no_surrogate_sends_everything_to_tabpfn(self, _):
+        os.remove(os.path.join(self.tmp_dir.name, 'surrogate.pkl'))
+        predictor = TransactionPredictor(model_dir=self.tmp_dir.name)
+
+        result = predictor.predict(self._transactions(5))
+
+        self.assertEqual(predictor.cascade, [])
+        self.assertEqual([r['tier'] for r in result['results']], ['tabpfn'] * 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from coalescer import RequestCoalescer
+from predictor import TransactionPredictor
+
+
+class RecordingPredictor:
+    """Predictor stand-in echoing each row and recording batch sizes."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def predict(self, transactions, positions=None):
+        with self.lock:
+            self.batch_sizes.append(len(transactions))
+        time.sleep(self.delay)
+        return {
+            'success': True,
+            'results': [
+                {'transaction_id': str(t['id']), 'description': t['transaction_description']}
+                for t in transactions
+            ],
+            'errors': [],
+            'total_processed': len(transactions),
+            'total_errors': 0
+        }
+
+
+def make_request(caller, n_rows):
+    return [
+        {'id': f'{caller}-{i}', 'transaction_description': f'caller {caller} row {i}'}
+        for i in range(n_rows)
+    ]
+
+
+class TestRequestCoalescer(unittest.TestCase):
+
+    def test_concurrent_callers_share_batches_and_get_their_rows(self):
+        predictor = RecordingPredictor(delay=0.02)
+        coalescer = RequestCoalescer(predictor, max_wait_ms=20, max_rows=1000)
+
+        def call(caller):
+            return caller, coalescer.submit(make_request(caller, 3))
+
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            responses = list(pool.map(call, range(40)))
+
+        for caller, response in responses:
+            self.assertTrue(response['success'])
+            self.assertEqual(response['total_processed'], 3)
+            self.assertEqual(
+                [r['transaction_id'] for r in response['results']],
+                [f'{caller}-{i}' for i in range(3)]
+            )
+
+        self.assertEqual(sum(predictor.batch_sizes), 120)
+        self.assertLess(len(predictor.batch_sizes), 40)
+        self.assertEqual(coalescer.stats()['requests'], 40)
+
+    def test_batches_respect_row_and_cell_caps(self):
+        predictor = RecordingPredictor(delay=0.01)
+        coalescer = RequestCoalescer(predictor, max_wait_ms=50, max_rows=1000, max_cells=10 * 128, cells_per_row=128)
+        self.assertEqual(coalescer.max_rows, 10)
+
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            list(pool.map(lambda c: coalescer.submit(make_request(c, 4)), range(10)))
+
+        self.assertEqual(sum(predictor.batch_sizes), 40)
+        self.assertTrue(all(size <= 10 for size in predictor.batch_sizes))
+
+    def test_oversized_request_runs_alone(self):
+        predictor = RecordingPredictor()
+        coalescer = RequestCoalescer(predictor, max_wait_ms=1, max_rows=5)
+
+        response = coalescer.submit(make_request('big', 12))
+
+        self.assertEqual(predictor.batch_sizes, [12])
+        self.assertEqual(response['total_processed'], 12)
+
+    def test_rows_without_id_keep_their_local_position(self):
+        predictor = TransactionPredictor(use_mock=True)
+        coalescer = RequestCoalescer(predictor, max_wait_ms=20)
+        transactions = [
+            {'dateOp': '2023-01-01', 'transaction_description': 'SNCF', 'amount': -10.0},
+            {'dateOp': '2023-01-02', 'transaction_description': 'LOYER', 'amount': -800.0}
+        ]
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            responses = list(pool.map(lambda _: coalescer.submit(transactions), range(5)))
+
+        for response in responses:
+            self.assertEqual([r['transaction_id'] for r in response['results']], ['0', '1'])
+            self.assertEqual(
+                [r['predicted_category'] for r in response['results']],
+                ['Transport', 'Logement']
+            )
+
+    def test_mock_fallback_does_not_depend_on_other_callers(self):
+        predictor = TransactionPredictor(use_mock=True)
+        transactions = [
+            {'id': f'row-{i}', 'dateOp': '2023-01-01', 'transaction_description': f'VIR {i}', 'amount': -10.0}
+            for i in range(3)
+        ]
+        alone = [r['predicted_category'] for r in predictor.predict(transactions)['results']]
+
+        coalescer = RequestCoalescer(predictor, max_wait_ms=20)
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            responses = list(pool.map(lambda _: coalescer.submit(transactions), range(5)))
+
+        self.assertLess(coalescer.stats()['batches'], 5)
+        for response in responses:
+            self.assertEqual([r['predicted_category'] for r in response['results']], alone)
+
+    def test_predict_errors_propagate_to_every_caller(self):
+        class FailingPredictor:
+            def predict(self, transactions, positions=None):
+                time.sleep(0.01)
+                raise RuntimeError("backend down")
+
+        coalescer = RequestCoalescer(FailingPredictor(), max_wait_ms=10)
+
+        def call(caller):
+            try:
+                coalescer.submit(make_request(caller, 2))
+            except RuntimeError as e:
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            errors = list(pool.map(call, range(8)))
+
+        self.assertEqual(errors, ['backend down'] * 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
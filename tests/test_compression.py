@@ -0,0 +1,140 @@
+import unittest
+from unittest.mock import patch
+import io
+import os
+import sys
+import gzip
+import json
+import flask
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+import compression
+from predictor import TransactionPredictor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+TRANSACTIONS = [
+    {'id': str(i), 'dateOp': '15/01/2024', 'transaction_description': f'CARTE SNCF PARIS {i}', 'amount': -12.5}
+    for i in range(50)
+]
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.app.testing = True
+        main.predictor = TransactionPredictor(use_mock=True, artifact_version='1')
+
+    def tearDown(self):
+        main.predictor = None
+
+    def _call(self, body, headers):
+        with self.app.test_request_context(
+            '/infer-category', method='POST', data=body, content_type='application/json', headers=headers
+        ):
+            return main.infer_category(flask.request)
+
+    def _json_body(self):
+        return json.dumps({'transactions': TRANSACTIONS}).encode('utf-8')
+
+    def test_gzip_request_body(self):
+        body, status, _ = self._call(gzip.compress(self._json_body()), {'Content-Encoding': 'gzip'})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(body)['results']['results']), 50)
+
+    @unittest.skipUnless(zstandard, "zstandard is not installed")
+    def test_zstd_request_and_response(self):
+        compressed = zstandard.ZstdCompressor().compress(self._json_body())
+        body, status, headers = self._call(compressed, {'Content-Encoding': 'zstd', 'Accept-Encoding': 'zstd, gzip'})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Encoding'], 'zstd')
+        response = json.loads(zstandard.ZstdDecompressor().decompressobj().decompress(body))
+        self.assertEqual(len(response['results']['results']), 50)
+
+    def test_response_compressed_for_accept_encoding(self):
+        body, status, headers = self._call(self._json_body(), {'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', headers['Vary'])
+        self.assertTrue(json.loads(gzip.decompress(body))['success'])
+
+    def test_small_or_unaccepted_responses_stay_uncompressed(self):
+        _, _, headers = self._call(self._json_body(), {})
+        self.assertNotIn('Content-Encoding', headers)
+
+        with patch('main.COMPRESS_MIN_BYTES', 10 ** 9):
+            _, _, headers = self._call(self._json_body(), {'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_decompression_bomb_rejected(self):
+        bomb = gzip.compress(b' ' * (20 * 1024 * 1024))
+        with patch('main.MAX_REQUEST_BYTES', 1024 * 1024):
+            body, status, _ = self._call(bomb, {'Content-Encoding': 'gzip'})
+
+        self.assertEqual(status, 413)
+        self.assertEqual(json.loads(body)['error'], 'PAYLOAD_TOO_LARGE')
+
+    def test_uncompressed_body_over_cap_rejected(self):
+        with patch('main.MAX_REQUEST_BYTES', 100):
+            _, status, _ = self._call(self._json_body(), {})
+        self.assertEqual(status, 413)
+
+    def _call_chunked(self, body):
+        # No Content-Length: the server reads until the client ends the stream
+        with self.app.test_request_context(
+            '/infer-category', method='POST', input_stream=io.BytesIO(body), content_type='application/json',
+            headers={'Transfer-Encoding': 'chunked'}, environ_overrides={'wsgi.input_terminated': True}
+        ):
+            self.assertIsNone(flask.request.content_length)
+            return main.infer_category(flask.request)
+
+    def test_chunked_body_is_capped(self):
+        with patch('main.MAX_REQUEST_BYTES', 100):
+            body, status, _ = self._call_chunked(self._json_body())
+        self.assertEqual(status, 413)
+        self.assertEqual(json.loads(body)['error'], 'PAYLOAD_TOO_LARGE')
+
+        body, status, _ = self._call_chunked(self._json_body())
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(body)['results']['results']), 50)
+
+        _, status, _ = self._call_chunked(b'')
+        self.assertEqual(status, 400)
+
+    def test_corrupt_and_unknown_encodings(self):
+        _, status, _ = self._call(b'not gzip at all', {'Content-Encoding': 'gzip'})
+        self.assertEqual(status, 400)
+
+        _, status, _ = self._call(gzip.compress(self._json_body())[:-20], {'Content-Encoding': 'gzip'})
+        self.assertEqual(status, 400)
+
+        _, status, _ = self._call(self._json_body(), {'Content-Encoding': 'br'})
+        self.assertEqual(status, 415)
+
+    def test_invalid_json_is_rejected_whatever_the_encoding(self):
+        for body, headers in (
+            (b'{"transactions": [', {}),
+            (gzip.compress(b'{"transactions": ['), {'Content-Encoding': 'gzip'}),
+            (gzip.compress(b''), {'Content-Encoding': 'gzip'}),
+        ):
+            response, status, _ = self._call(body, headers)
+            self.assertEqual(status, 400)
+            self.assertEqual(json.loads(response)['error'], 'INVALID_BODY')
+
+    def test_supported_encodings_without_zstandard(self):
+        with patch.object(compression, 'zstandard', None):
+            self.assertEqual(compression.supported_encodings(), ['gzip'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import flask
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+import predictor as predictor_module
+from predictor import TransactionPredictor
+
+N_REQUESTS = 300
+N_WORKERS = 64
+
+TRANSACTIONS = [
+    {"id": "1", "dateOp": "2023-01-01", "transaction_description": "SNCF PARIS", "amount": -50.00},
+    {"id": "2", "dateOp": "2023-01-02", "transaction_description": "LOYER JANVIER", "amount": -800.00},
+    {"id": "3", "dateOp": "2023-01-03", "transaction_description": "CARREFOUR MARKET", "amount": -32.10},
+    {"id": "4", "dateOp": "2023-01-04", "transaction_description": "PHARMACIE CENTRALE", "amount": -12.00},
+]
+
+
+class CountingPredictor(TransactionPredictor):
+    """Mock predictor that counts constructions and widens the init race window."""
+    instances = 0
+    instances_lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        with CountingPredictor.instances_lock:
+            CountingPredictor.instances += 1
+        time.sleep(0.05)
+        kwargs['use_mock'] = True
+        super().__init__(*args, **kwargs)
+
+
+class TestConcurrentRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.app.testing = True
+        CountingPredictor.instances = 0
+        main.predictor = None
+
+    def tearDown(self):
+        main.predictor = None
+
+    def _call(self, _):
+        with self.app.test_request_context(
+            '/infer-category',
+            method='POST',
+            json={"transactions": TRANSACTIONS}
+        ):
+            response_body, status_code, headers = main.infer_category(flask.request)
+        return status_code, json.loads(response_body)
+
+    @patch('main.TransactionPredictor', CountingPredictor)
+    def test_cold_concurrent_requests_initialize_once(self):
+        with ThreadPoolExecutor(max_workers=N_WORKERS) as pool:
+            responses = list(pool.map(self._call, range(N_REQUESTS)))
+
+        self.assertEqual(CountingPredictor.instances, 1)
+        self.assertEqual(len(responses), N_REQUESTS)
+
+        # Every request must see the same predictions
+        expected = responses[0][1]['results']
+        for status_code, data in responses:
+            self.assertEqual(status_code, 200)
+            self.assertTrue(data['success'])
+            self.assertEqual(data['results'], expected)
+
+        categories = [r['predicted_category'] for r in expected['results']]
+        self.assertEqual(categories, ['Transport', 'Logement', 'Alimentation', 'Santé'])
+
+
+class TestTabPFNClientInit(unittest.TestCase):
+
+    def setUp(self):
+        predictor_module._tabpfn_client_token = None
+
+    def tearDown(self):
+        predictor_module._tabpfn_client_token = None
+
+    @patch('predictor.init')
+    @patch('predictor.set_access_token')
+    @patch('predictor.reset')
+    def test_client_state_initialized_once_per_token(self, mock_reset, mock_set_token, mock_init):
+        with patch.dict(os.environ, {'TABPFN_API_TOKEN': 'token-1234567890'}):
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                predictors = list(pool.map(lambda _: TransactionPredictor(use_mock=False), range(50)))
+
+        self.assertEqual(mock_reset.call_count, 1)
+        self.assertEqual(mock_set_token.call_count, 1)
+        self.assertEqual(mock_init.call_count, 1)
+        self.assertTrue(all(not p.use_mock for p in predictors))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import tempfile
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from coreset import (
+    ContextSelector, allocate_rows, context_rows_for_budget, kcenter_select,
+    labeled_data_fingerprint, select_context
+)
+from predictor import CELLS_PER_ROW
+from tests.fixtures import make_labeled_transactions, fit_transformers
+
+
+class TestCoresetSelection(unittest.TestCase):
+
+    def test_rows_for_budget(self):
+        self.assertEqual(context_rows_for_budget(100 * CELLS_PER_ROW), 100)
+        self.assertEqual(context_rows_for_budget(100 * CELLS_PER_ROW, n_query_rows=30), 70)
+        self.assertEqual(context_rows_for_budget(10, n_query_rows=5), 0)
+
+    def test_allocation_is_balanced_and_redistributes(self):
+        allocation = allocate_rows({'a': 1000, 'b': 1000, 'c': 3}, 60)
+        self.assertEqual(allocation['c'], 3)
+        self.assertEqual(sum(allocation.values()), 60)
+        self.assertLessEqual(abs(allocation['a'] - allocation['b']), 1)
+
+    def test_allocation_with_fewer_rows_than_classes(self):
+        allocation = allocate_rows({'a': 5, 'b': 50, 'c': 20}, 2)
+        self.assertEqual(allocation, {'a': 0, 'b': 1, 'c': 1})
+
+    def test_kcenter_covers_outliers(self):
+        points = np.vstack([np.zeros((50, 2)), [[10.0, 10.0]]])
+        self.assertIn(50, kcenter_select(points, 2))
+
+    def test_select_context_respects_size_and_classes(self):
+        rng = np.random.default_rng(0)
+        features = rng.normal(size=(300, 16))
+        labels = np.array(['a'] * 250 + ['b'] * 40 + ['c'] * 10)
+
+        for method in ('kcenter', 'kmeans'):
+            positions = select_context(features, labels, 45, method=method)
+            self.assertEqual(len(positions), 45)
+            self.assertEqual(len(set(positions)), 45)
+            self.assertEqual(sorted(set(labels[positions])), ['a', 'b', 'c'])
+            self.assertEqual((labels[positions] == 'c').sum(), 10)
+
+
+class TestContextSelector(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = make_labeled_transactions(300)
+        cls.transformers = fit_transformers(cls.df)
+
+    def test_selection_fits_budget(self):
+        selector = ContextSelector(self.df, self.transformers)
+        context = selector.select(cell_budget=50 * CELLS_PER_ROW, n_query_rows=10)
+
+        self.assertEqual(len(context), 40)
+        self.assertEqual(context['category'].nunique(), self.df['category'].nunique())
+        self.assertTrue(context.index.isin(self.df.index).all())
+
+    def test_small_history_is_sent_whole(self):
+        selector = ContextSelector(self.df, self.transformers)
+        context = selector.select(cell_budget=10000 * CELLS_PER_ROW)
+        self.assertEqual(len(context), len(self.df))
+        self.assertEqual(selector.misses, 0)
+
+    def test_selection_cached_by_labeled_data_fingerprint(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            selector = ContextSelector(self.df, self.transformers, cache_dir=cache_dir)
+            with patch('coreset.labeled_data_fingerprint') as fingerprint:
+                first = selector.select(cell_budget=40 * CELLS_PER_ROW)
+                second = selector.select(cell_budget=40 * CELLS_PER_ROW)
+            # Fingerprinted once, when the data was loaded
+            fingerprint.assert_not_called()
+            self.assertEqual((selector.misses, selector.hits), (1, 1))
+            self.assertListEqual(list(first.index), list(second.index))
+
+            # A fresh selector reuses the selection persisted on disk
+            restarted = ContextSelector(self.df, self.transformers, cache_dir=cache_dir)
+            third = restarted.select(cell_budget=40 * CELLS_PER_ROW)
+            self.assertEqual(restarted.hits, 1)
+            self.assertListEqual(list(first.index), list(third.index))
+
+            # Relabeling a row changes the fingerprint and invalidates the cache
+            relabeled = self.df.copy()
+            relabeled.loc[0, 'category'] = 'Santé'
+            relabeled_selector = ContextSelector(relabeled, self.transformers, cache_dir=cache_dir)
+            relabeled_selector.select(cell_budget=40 * CELLS_PER_ROW)
+            self.assertEqual(relabeled_selector.misses, 1)
+
+    def test_fingerprint_depends_on_content_and_version(self):
+        self.assertEqual(labeled_data_fingerprint(self.df), labeled_data_fingerprint(self.df.copy()))
+        self.assertNotEqual(labeled_data_fingerprint(self.df), labeled_data_fingerprint(self.df, 'tabpfn-2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import httpx
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import predictor as predictor_module
+from fake_tabpfn_server import CellQuota, FakeTabPFNServer, LatencyModel, point_tabpfn_client_at
+from predictor import CELLS_PER_ROW, TransactionPredictor
+from tabpfn_transport import AsyncTabPFNTransport
+
+ROWS = [
+    {'dateOp': '01/01/2024', 'transaction_description': 'UBER TRIP', 'amount': -12.0},
+    {'dateOp': '02/01/2024', 'transaction_description': 'SALARY MARCH', 'amount': 2500.0},
+]
+
+
+class TestFakeTabPFNServer(unittest.TestCase):
+
+    def test_tabpfn_client_round_trip(self):
+        from tabpfn_client import TabPFNClassifier, set_access_token
+        from tabpfn_client.client import ServiceClient
+
+        original_client = ServiceClient.httpx_client
+        # tabpfn_client caches dataset uids on disk; those of earlier servers are unknown to this one
+        uid_cache = ServiceClient.dataset_uid_cache_manager
+        with FakeTabPFNServer() as server, \
+                patch('tabpfn_client.service_wrapper.UserAuthenticationClient.CACHED_TOKEN_FILE'), \
+                patch.object(uid_cache, 'cache', OrderedDict()), patch.object(uid_cache, 'save_cache'):
+            try:
+                set_access_token('fake-token')
+                point_tabpfn_client_at(server.url)
+
+                rng = np.random.default_rng(0)
+                X = rng.random((60, 3))
+                y = (X[:, 0] > 0.5).astype(int)
+                classifier = TabPFNClassifier()
+                classifier.fit(X, y)
+                np.testing.assert_array_equal(classifier.predict(X[:10]), y[:10])
+                self.assertEqual(classifier.predict_proba(X[:3]).shape, (3, 2))
+            finally:
+                ServiceClient.httpx_client = original_client
+                ServiceClient.reset_authorization()
+
+        self.assertGreater(server.stats()['cells'], 0)
+
+    def test_quota_exceeded_is_parsed_by_predictor(self):
+        with FakeTabPFNServer(quota_cells=3 * CELLS_PER_ROW) as server:
+            transport = AsyncTabPFNTransport(server.url, token='caller-1')
+            try:
+                self.assertEqual(len(transport.predict(ROWS)), 2)
+                with self.assertRaises(httpx.HTTPStatusError) as ctx:
+                    transport.predict(ROWS)
+            finally:
+                transport.close()
+
+        self.assertEqual(ctx.exception.response.status_code, 429)
+        with patch.dict(os.environ, {'TABPFN_API_TOKEN': ''}):
+            error = TransactionPredictor(use_mock=True)._handle_api_error(ctx.exception)
+        self.assertEqual(error['error'], 'RATE_LIMIT_EXCEEDED')
+        self.assertTrue(error['next_available_at'])
+        self.assertEqual(server.stats()['throttled'], 1)
+
+    @patch.object(predictor_module, '_ensure_tabpfn_client')
+    def test_failures_and_auth(self, _):
+        with FakeTabPFNServer(failure_rate=1.0) as server:
+            with patch.dict(os.environ, {'TABPFN_API_TOKEN': 'fake-token', 'TABPFN_API_URL': server.url}):
+                predictor = TransactionPredictor(model_dir='missing-model-dir')
+            try:
+                response = predictor.predict(ROWS)
+            finally:
+                predictor.transport.close()
+                predictor_module._transports.clear()
+            self.assertFalse(response['success'])
+            self.assertEqual(server.stats()['failures'], 1)
+
+            unauthenticated = httpx.post(f'{server.url}/predict', json={'rows': ROWS})
+            self.assertEqual(unauthenticated.status_code, 401)
+
+    def test_latency_injection(self):
+        with FakeTabPFNServer(latency='constant:0.1', per_cell_s=0.0001) as server:
+            transport = AsyncTabPFNTransport(server.url, token='t')
+            try:
+                started = time.perf_counter()
+                predictions = transport.predict(ROWS)
+                elapsed = time.perf_counter() - started
+            finally:
+                transport.close()
+
+        self.assertEqual([p['category'] for p in predictions], ['Transportation', 'Income'])
+        self.assertGreaterEqual(elapsed, 0.1 + 0.0001 * 2 * CELLS_PER_ROW)
+
+    def test_latency_and_quota_models(self):
+        lognormal = LatencyModel('lognormal:0.1,0.5', seed=0)
+        samples = [lognormal.sample() for _ in range(2000)]
+        self.assertAlmostEqual(float(np.median(samples)), 0.1, delta=0.01)
+        self.assertAlmostEqual(LatencyModel('0.2', per_cell_s=0.01).sample(cells=10), 0.3)
+
+        quota = CellQuota(100, window_s=60)
+        self.assertTrue(quota.try_consume('a', 80, now=120)[0])
+        allowed, next_available_at = quota.try_consume('a', 30, now=130)
+        self.assertFalse(allowed)
+        self.assertEqual(next_available_at, '1970-01-01T00:03:00+00:00')
+        # Other tokens and the next window have their own budget
+        self.assertTrue(quota.try_consume('b', 30, now=130)[0])
+        self.assertTrue(quota.try_consume('a', 30, now=185)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import os
+import sys
+import json
+import flask
+import pandas as pd
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+from fingerprint import frame_fingerprints, transaction_fingerprint, split_changed
+from predictor import TransactionPredictor
+
+TRANSACTIONS = [
+    {"id": "1", "dateOp": "15/01/2024", "transaction_description": "CARTE SNCF PARIS", "amount": "-50,00"},
+    {"id": "2", "dateOp": "2024-01-16", "transaction_description": "LOYER JANVIER", "amount": -800.0},
+]
+
+
+class TestTransactionFingerprint(unittest.TestCase):
+
+    def test_trivial_edits_keep_the_fingerprint(self):
+        original = {"dateOp": "15/01/2024", "transaction_description": "CARTE SNCF PARIS", "amount": "-50,00"}
+        edited = {"dateOp": "2024-01-15", "transaction_description": "  carte   sncf, paris! ", "amount": -50.0}
+
+        self.assertEqual(
+            transaction_fingerprint(original, "tabpfn-1"),
+            transaction_fingerprint(edited, "tabpfn-1")
+        )
+
+    def test_content_and_model_version_change_the_fingerprint(self):
+        base = transaction_fingerprint(TRANSACTIONS[0], "tabpfn-1")
+
+        self.assertNotEqual(base, transaction_fingerprint(dict(TRANSACTIONS[0], amount="-51,00"), "tabpfn-1"))
+        self.assertNotEqual(base, transaction_fingerprint(dict(TRANSACTIONS[0], transaction_description="SNCF LYON"), "tabpfn-1"))
+        self.assertNotEqual(base, transaction_fingerprint(TRANSACTIONS[0], "tabpfn-2"))
+
+    def test_frame_fingerprints_match_row_fingerprints(self):
+        df = pd.DataFrame(TRANSACTIONS + [{"id": "3", "transaction_description": None, "amount": None, "dateOp": None}])
+        self.assertEqual(
+            frame_fingerprints(df, "tabpfn-1"),
+            [transaction_fingerprint(t, "tabpfn-1") for t in df.to_dict('records')]
+        )
+
+    def test_split_changed(self):
+        known = transaction_fingerprint(TRANSACTIONS[0], "tabpfn-1")
+
+        changed, fingerprints, unchanged = split_changed(TRANSACTIONS, "tabpfn-1", if_none_match=[known])
+
+        self.assertEqual(unchanged, ["1"])
+        self.assertEqual([t["id"] for t in changed], ["2"])
+        self.assertEqual(fingerprints, [transaction_fingerprint(TRANSACTIONS[1], "tabpfn-1")])
+
+    def test_split_changed_keeps_positions_for_rows_without_id(self):
+        rows = [{k: v for k, v in t.items() if k != "id"} for t in TRANSACTIONS]
+        known = transaction_fingerprint(rows[0], "mock-1")
+
+        changed, _, unchanged = split_changed(rows, "mock-1", if_none_match=[known])
+
+        self.assertEqual(unchanged, ["0"])
+        self.assertEqual(changed[0]["id"], 1)
+
+
+class TestDeltaProtocol(unittest.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.app.testing = True
+        main.predictor = TransactionPredictor(use_mock=True, artifact_version="1")
+
+    def tearDown(self):
+        main.predictor = None
+
+    def _call(self, payload):
+        with self.app.test_request_context('/infer-category', method='POST', json=payload):
+            response_body, status_code, headers = main.infer_category(flask.request)
+        return status_code, json.loads(response_body)
+
+    def test_second_run_only_returns_changed_rows(self):
+        status_code, first = self._call({"transactions": TRANSACTIONS})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(first["unchanged"], [])
+        fingerprints = {r["transaction_id"]: r["fingerprint"] for r in first["results"]["results"]}
+
+        # Send back the fingerprints, with a cosmetic edit to row 1 and a real edit to row 2
+        second_rows = [
+            dict(TRANSACTIONS[0], transaction_description="carte  sncf paris", fingerprint=fingerprints["1"]),
+            dict(TRANSACTIONS[1], amount=-850.0, fingerprint=fingerprints["2"]),
+        ]
+        status_code, second = self._call({"transactions": second_rows})
+
+        self.assertEqual(status_code, 200)
+        self.assertEqual(second["unchanged"], ["1"])
+        self.assertEqual([r["transaction_id"] for r in second["results"]["results"]], ["2"])
+        self.assertEqual(second["model_version"], "mock-1")
+
+    def test_all_unchanged_skips_prediction(self):
+        known = [transaction_fingerprint(t, main.predictor.model_version) for t in TRANSACTIONS]
+
+        status_code, data = self._call({"transactions": TRANSACTIONS, "if_none_match": known})
+
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data["unchanged"], ["1", "2"])
+        self.assertEqual(data["results"]["results"], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import threading
+
+import flask
+from werkzeug.serving import make_server
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+from metering import CallerIdentity
+from test_deployment import BatchSizes, run_load_test
+
+
+class TestLoadHarness(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        app = flask.Flask(__name__)
+        app.add_url_rule('/', 'infer_category', lambda: main.infer_category(flask.request), methods=['GET', 'POST'])
+        cls.server = make_server('127.0.0.1', 0, app, threaded=True)
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.env = patch.dict(os.environ, {'USE_MOCK': 'true'})
+        self.env.start()
+        main.predictor = None
+
+    def tearDown(self):
+        self.env.stop()
+        main.predictor = None
+
+    def test_closed_loop_report(self):
+        report = run_load_test(self.url, concurrency=4, n_requests=40, batch_sizes='uniform:1,20')
+
+        self.assertEqual(report['mode'], 'closed_loop')
+        self.assertEqual(report['requests'], 40)
+        self.assertEqual(report['status_counts'], {'200': 40})
+        self.assertEqual(report['error_rate'], 0.0)
+        self.assertTrue(40 <= report['rows'] <= 800)
+        latencies = report['latency_ms']
+        self.assertLessEqual(latencies['p50'], latencies['p99'])
+        self.assertLessEqual(latencies['p99'], latencies['max'])
+
+    def test_open_loop_counts_errors(self):
+        # Batches over the body size cap are rejected with 413
+        with patch('main.MAX_REQUEST_BYTES', 2000):
+            report = run_load_test(self.url, rate=100, n_requests=30, batch_sizes='choice:1,200')
+
+        self.assertEqual(report['mode'], 'open_loop')
+        self.assertEqual(report['requests'], 30)
+        self.assertGreater(report['failed'], 0)
+        self.assertEqual(report['errors'], {'PAYLOAD_TOO_LARGE': report['failed']})
+        self.assertAlmostEqual(report['error_rate'], report['failed'] / 30, places=3)
+
+    @patch('main.callers', CallerIdentity(keys={'load-test': 's3cret'}))
+    def test_headers_sent_with_every_request(self):
+        report = run_load_test(self.url, concurrency=2, n_requests=6)
+        self.assertEqual(report['status_counts'], {'401': 6})
+
+        report = run_load_test(self.url, concurrency=2, n_requests=6, headers={'X-Caller-Key': 's3cret'})
+        self.assertEqual(report['status_counts'], {'200': 6})
+
+    def test_batch_size_distributions(self):
+        self.assertEqual({BatchSizes('fixed:7').sample() for _ in range(10)}, {7})
+        self.assertEqual({BatchSizes('12').sample() for _ in range(10)}, {12})
+        sizes = [BatchSizes('uniform:5,10', seed=1).sample() for _ in range(100)]
+        self.assertTrue(all(5 <= size <= 10 for size in sizes))
+        choices = BatchSizes('choice:1,100', seed=2)
+        self.assertEqual({choices.sample() for _ in range(100)}, {1, 100})
+        with self.assertRaises(ValueError):
+            BatchSizes('pareto:1,2')
+
+
+if __name__ == '__main__':
+    unittest.main()
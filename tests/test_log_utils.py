@@ -0,0 +1,88 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import io
+import json
+import logging
+import pandas as pd
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import log_utils
+from log_utils import DataFramePreview, JsonFormatter, configure_logging, is_sampled, log_payload, request_context
+
+
+class TestLogUtils(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        handler = logging.StreamHandler(self.stream)
+        handler.setFormatter(JsonFormatter())
+        self.logger = logging.getLogger('tests.log_utils')
+        self.logger.handlers = [handler]
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+    def _records(self):
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_records_carry_request_id_and_fields(self):
+        with request_context('req-1', sampled=False):
+            self.logger.info("Predicted %d rows", 42, extra={'rows': 42})
+        self.logger.warning("outside")
+
+        first, second = self._records()
+        self.assertEqual(first['message'], 'Predicted 42 rows')
+        self.assertEqual(first['severity'], 'INFO')
+        self.assertEqual(first['request_id'], 'req-1')
+        self.assertEqual(first['rows'], 42)
+        self.assertNotIn('request_id', second)
+
+    def test_sampling_is_deterministic_per_request(self):
+        self.assertTrue(is_sampled('anything', rate=1))
+        self.assertFalse(is_sampled('anything', rate=0))
+        decisions = [is_sampled(f'req-{i}', rate=0.1) for i in range(5000)]
+        self.assertEqual(decisions, [is_sampled(f'req-{i}', rate=0.1) for i in range(5000)])
+        self.assertAlmostEqual(sum(decisions) / len(decisions), 0.1, delta=0.03)
+
+    def test_preview_caps_rows(self):
+        df = pd.DataFrame({'a': range(1000)})
+        preview = str(DataFramePreview(df, max_rows=3))
+        self.assertEqual(len(preview.splitlines()), 5)
+        self.assertIn('(1000 rows total)', preview)
+
+    def test_payload_not_rendered_unless_sampled(self):
+        df = MagicMock()
+        with request_context('req-2', sampled=False):
+            log_payload(self.logger, "Input DataFrame", df)
+        df.head.assert_not_called()
+        df.to_string.assert_not_called()
+        self.assertEqual(self._records(), [])
+
+        with request_context('req-3', sampled=True):
+            log_payload(self.logger, "Input DataFrame", pd.DataFrame({'a': range(100)}))
+        record, = self._records()
+        self.assertIn('(100 rows total)', record['message'])
+
+    def test_host_handlers_are_reformatted_not_duplicated(self):
+        root = logging.getLogger()
+        stream = io.StringIO()
+        host_handler = logging.StreamHandler(stream)
+        host_handler.setFormatter(logging.Formatter('%(levelname)s:%(message)s'))
+
+        with patch.object(root, 'handlers', [host_handler]), \
+                patch.object(log_utils, '_configured', False), \
+                patch.object(root, 'level', root.level):
+            configure_logging(level='INFO', json_format=True)
+            self.assertEqual(root.handlers, [host_handler])
+            logging.getLogger('tests.host').info("served")
+
+        record, = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(record['message'], 'served')
+        self.assertEqual(record['logger'], 'tests.host')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,6 +30,7 @@ class TestMain(unittest.TestCase):
             {"id": "1", "category": "Groceries", "confidence": 0.85},
             {"id": "2", "category": "Income", "confidence": 0.92}
         ]
+        mock_predictor_instance.model_version = "tabpfn-1"
         main.predictor = mock_predictor_instance
         
         # Create test request
@@ -110,5 +111,25 @@ class TestMain(unittest.TestCase):
             self.assertIn('error', response_data)
             self.assertEqual(response_data['error'], "Test error")
 
+    def test_limits_endpoint(self):
+        with self.app.test_request_context('/infer-category/limits', method='GET'):
+            response_body, status_code, headers = main.infer_category(flask.request)
+            response_data = json.loads(response_body)
+            
+            self.assertEqual(status_code, 200)
+            limits = response_data['limits']
+            self.assertLessEqual(
+                limits['max_batch_rows'] * limits['n_features'] * limits['n_estimators'],
+                limits['max_cells_per_request']
+            )
+            self.assertGreaterEqual(limits['max_concurrent_batches'], 1)
+    
+    def test_unknown_get_endpoint(self):
+        with self.app.test_request_context('/infer-category/unknown', method='GET'):
+            response_body, status_code, headers = main.infer_category(flask.request)
+            
+            self.assertEqual(status_code, 404)
+            self.assertFalse(json.loads(response_body)['success'])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
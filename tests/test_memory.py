@@ -0,0 +1,159 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import json
+import pickle
+import tempfile
+import tracemalloc
+import flask
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+import memory_accounting
+import metrics
+from predictor import TransactionPredictor, preprocess_inference_data
+from surrogate import train_surrogate
+from tests.fixtures import make_labeled_transactions, fit_transformers
+
+ROWS = 10000
+
+# Peak traced allocation budgets per 10k rows, in MB (about twice the current usage)
+BUDGETS_MB = {
+    'preprocess': 72,
+    'predict': 72,
+    'pipelined_predict': 24,
+    'mock_predict': 8,
+    'encode': 12
+}
+
+
+class MemoryAccountingCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.was_tracing = tracemalloc.is_tracing()
+        memory_accounting.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        if not cls.was_tracing:
+            memory_accounting.disable()
+
+
+class TestMeasure(MemoryAccountingCase):
+
+    def test_nested_measurements(self):
+        with memory_accounting.measure() as outer:
+            with memory_accounting.measure() as inner:
+                block = bytearray(8 * memory_accounting.MB)
+                del block
+            kept = bytearray(2 * memory_accounting.MB)
+
+        self.assertGreaterEqual(inner['peak_alloc_mb'], 8)
+        self.assertLess(inner['retained_mb'], 1)
+        # The inner peak is credited to the outer measurement
+        self.assertGreaterEqual(outer['peak_alloc_mb'], 8)
+        self.assertGreaterEqual(outer['retained_mb'], 2)
+        self.assertIn('rss_mb', outer)
+        del kept
+
+    def test_disabled_measurement_is_empty(self):
+        with patch.object(memory_accounting, '_enabled', False):
+            with memory_accounting.measure() as usage:
+                pass
+        self.assertEqual(usage, {})
+
+    @patch.dict(os.environ, {'USE_MOCK': 'true'})
+    def test_response_and_log_report_memory_per_stage(self):
+        app = flask.Flask(__name__)
+        transactions = make_labeled_transactions(50).drop(columns=['category']).to_dict('records')
+        main.predictor = None
+        main.coalescer = None
+        try:
+            with patch('metrics.METRICS_LOG_REQUESTS', False), self.assertLogs('metrics', level='INFO') as logs:
+                with app.test_request_context('/infer-category', method='POST', json={'transactions': transactions}):
+                    body, status, _ = main.infer_category(flask.request)
+        finally:
+            main.predictor = None
+            main.coalescer = None
+
+        self.assertEqual(status, 200)
+        self.assertIn('peak_alloc_mb', json.loads(body)['memory']['mock'])
+        logged = logs.records[0].memory
+        self.assertEqual(set(logged), {'mock', 'encode', 'request'})
+        self.assertGreaterEqual(logged['request']['peak_alloc_mb'], logged['mock']['peak_alloc_mb'])
+
+
+@patch('predictor._ensure_tabpfn_client')
+class TestPeakMemoryBudgets(MemoryAccountingCase):
+    """Peak memory of each stage on 10k rows must stay within BUDGETS_MB."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        train_df = make_labeled_transactions(400)
+        cls.transformers = fit_transformers(train_df)
+        cls.model_dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(cls.model_dir.name, 'transformers.pkl'), 'wb') as f:
+            pickle.dump(cls.transformers, f)
+        with open(os.path.join(cls.model_dir.name, 'surrogate.pkl'), 'wb') as f:
+            pickle.dump(train_surrogate(train_df, cls.transformers), f)
+        cls.df = make_labeled_transactions(ROWS, seed=3).drop(columns=['category'])
+        cls.transactions = cls.df.to_dict('records')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.model_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.env = patch.dict(os.environ, {'TABPFN_API_TOKEN': 'token-1234567890', 'TABPFN_API_URL': ''})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+
+    def assertWithinBudget(self, name, usage):
+        self.assertLess(usage['peak_alloc_mb'] * 10000 / ROWS, BUDGETS_MB[name], f"{name} peak memory per 10k rows")
+
+    def _predictor(self, pipeline_chunk_rows):
+        predictor = TransactionPredictor(model_dir=self.model_dir.name, cascade_threshold=0.99)
+        predictor.initialize()
+        predictor.pipeline_chunk_rows = pipeline_chunk_rows
+        return predictor
+
+    def test_preprocess(self, _):
+        with memory_accounting.measure() as usage:
+            preprocess_inference_data(self.df, self.transformers)
+        self.assertWithinBudget('preprocess', usage)
+
+    def test_predict(self, _):
+        predictor = self._predictor(pipeline_chunk_rows=0)
+        with metrics.request_metrics() as record, memory_accounting.measure() as usage:
+            response = predictor.predict(self.transactions)
+        self.assertTrue(response['success'])
+        self.assertWithinBudget('predict', usage)
+        self.assertEqual(set(record['memory']), {'preprocess', 'text_embedding', 'infer', 'format'})
+
+        with memory_accounting.measure() as usage:
+            json.dumps(response)
+        self.assertWithinBudget('encode', usage)
+
+    def test_pipelined_predict(self, _):
+        predictor = self._predictor(pipeline_chunk_rows=2000)
+        with memory_accounting.measure() as usage:
+            self.assertTrue(predictor.predict(self.transactions)['success'])
+        self.assertWithinBudget('pipelined_predict', usage)
+
+    def test_mock_predict(self, _):
+        predictor = TransactionPredictor(use_mock=True)
+        with memory_accounting.measure() as usage:
+            predictor.predict(self.transactions)
+        self.assertWithinBudget('mock_predict', usage)
+
+
+if __name__ == '__main__':
+    unittest.main()
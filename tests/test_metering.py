@@ -0,0 +1,243 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import json
+import base64
+import tempfile
+from datetime import datetime, timezone
+import flask
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+from metering import (
+    QuotaMeter, InMemoryUsageStore, FileUsageStore, RedisUsageStore, CallerIdentity,
+    create_usage_store, parse_caller_keys
+)
+
+
+class FakeRedis:
+    """Minimal Redis-compatible client for RedisUsageStore."""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    def get(self, key):
+        value = self.values.get(key)
+        return str(value).encode() if value is not None else None
+
+    def incrby(self, key, amount):
+        self.values[key] = self.values.get(key, 0) + amount
+        return self.values[key]
+
+    def expire(self, key, ttl):
+        self.ttls[key] = ttl
+
+
+class TestUsageStores(unittest.TestCase):
+
+    def _check_store(self, store):
+        self.assertEqual(store.get('a'), 0)
+        self.assertEqual(store.incr('a', 10, 60), 10)
+        self.assertEqual(store.incr('a', 5, 60), 15)
+        self.assertEqual(store.incr('a', -5, 60), 10)
+        self.assertEqual(store.get('a'), 10)
+        self.assertEqual(store.get('b'), 0)
+
+    def test_memory_store(self):
+        self._check_store(InMemoryUsageStore())
+
+    def test_file_store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'usage.json')
+            self._check_store(FileUsageStore(path))
+            # A second store on the same file sees the same counters
+            self.assertEqual(FileUsageStore(path).get('a'), 10)
+
+    def test_redis_store(self):
+        client = FakeRedis()
+        self._check_store(RedisUsageStore(client))
+        self.assertEqual(client.ttls['a'], 60)
+
+    def test_create_usage_store(self):
+        self.assertIsInstance(create_usage_store('memory://'), InMemoryUsageStore)
+        self.assertIsInstance(create_usage_store('file:///tmp/usage.json'), FileUsageStore)
+        with self.assertRaises(ValueError):
+            create_usage_store('ftp://nowhere')
+
+
+class TestQuotaMeter(unittest.TestCase):
+
+    def setUp(self):
+        self.meter = QuotaMeter(InMemoryUsageStore(), limit_cells=1000, cells_per_row=128)
+        self.now = datetime(2024, 1, 15, 18, 30, tzinfo=timezone.utc)
+
+    def test_consume_until_budget_exhausted(self):
+        allowed, usage = self.meter.try_consume('sheet-1', self.meter.cost(7), now=self.now)
+        self.assertTrue(allowed)
+        self.assertEqual(usage['remaining'], 1000 - 7 * 128)
+
+        allowed, usage = self.meter.try_consume('sheet-1', self.meter.cost(2), now=self.now)
+        self.assertFalse(allowed)
+        # Rejected batches do not consume anything
+        self.assertEqual(usage['used'], 7 * 128)
+
+        # Other callers have their own budget
+        allowed, _ = self.meter.try_consume('sheet-2', self.meter.cost(7), now=self.now)
+        self.assertTrue(allowed)
+
+    def test_budget_resets_at_midnight_utc(self):
+        self.meter.try_consume('sheet-1', 896, now=self.now)
+        usage = self.meter.usage('sheet-1', now=self.now)
+        self.assertEqual(usage['reset_at'], '2024-01-16T00:00:00+00:00')
+
+        tomorrow = datetime(2024, 1, 16, 0, 0, 1, tzinfo=timezone.utc)
+        self.assertEqual(self.meter.usage('sheet-1', now=tomorrow)['used'], 0)
+
+    def test_refund(self):
+        self.meter.try_consume('sheet-1', 512, now=self.now)
+        self.meter.refund('sheet-1', 512, now=self.now)
+        self.assertEqual(self.meter.usage('sheet-1', now=self.now)['remaining'], 1000)
+
+
+def id_token(claims):
+    """Unsigned JWT carrying ``claims`` (signatures are checked by the platform)."""
+    encode = lambda data: base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b'=').decode()
+    return f"{encode({'alg': 'RS256'})}.{encode(claims)}.signature"
+
+
+class TestCallerIdentity(unittest.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+
+    def _identify(self, identity, headers=None, remote_addr='203.0.113.7'):
+        with self.app.test_request_context('/', headers=headers or {}, environ_base={'REMOTE_ADDR': remote_addr}):
+            return identity.identify(flask.request)
+
+    def test_client_chosen_headers_are_ignored(self):
+        identity = CallerIdentity()
+        self.assertEqual(self._identify(identity, {'X-Caller-Id': 'someone-else', 'X-Forwarded-For': '1.2.3.4'}), '203.0.113.7')
+
+    def test_forwarded_for_is_read_from_the_trusted_proxies(self):
+        identity = CallerIdentity(trusted_proxy_hops=1)
+        # The client wrote the first entry; the front end appended the real address
+        self.assertEqual(self._identify(identity, {'X-Forwarded-For': '1.2.3.4, 198.51.100.9'}), '198.51.100.9')
+        self.assertEqual(self._identify(identity), '203.0.113.7')
+
+    def test_caller_keys(self):
+        identity = CallerIdentity(keys=parse_caller_keys('sheet-1=s3cret, sheet-2=other'))
+        self.assertEqual(self._identify(identity, {'X-Caller-Key': 's3cret'}), 'key:sheet-1')
+        self.assertIsNone(self._identify(identity, {'X-Caller-Key': 'guess'}))
+        self.assertIsNone(self._identify(identity))
+        with self.assertRaises(ValueError):
+            parse_caller_keys('sheet-1')
+
+    def test_invoker_token(self):
+        identity = CallerIdentity(trust_invoker=True)
+        token = id_token({'email': 'sheets@example.com', 'sub': '42'})
+        self.assertEqual(self._identify(identity, {'Authorization': f'Bearer {token}'}), 'invoker:sheets@example.com')
+        self.assertIsNone(self._identify(identity, {'Authorization': 'Bearer not-a-jwt'}))
+        self.assertIsNone(self._identify(identity))
+
+
+class TestMeteredEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.app.testing = True
+        self.meter_patch = patch('main.meter', QuotaMeter(InMemoryUsageStore(), limit_cells=10 * 128, cells_per_row=128))
+        self.meter_patch.start()
+        self.predictor = MagicMock()
+        self.predictor.model_version = 'tabpfn-1'
+        self.predictor.predict.side_effect = lambda transactions: {
+            'success': True,
+            'results': [{'transaction_id': str(t['id'])} for t in transactions]
+        }
+        main.predictor = self.predictor
+
+    def tearDown(self):
+        self.meter_patch.stop()
+        main.predictor = None
+
+    def _post(self, n_rows, headers=None):
+        transactions = [
+            {'id': i, 'dateOp': '2024-01-15', 'transaction_description': f'row {i}', 'amount': -1.0}
+            for i in range(n_rows)
+        ]
+        with self.app.test_request_context(
+            '/infer-category', method='POST',
+            json={'transactions': transactions},
+            headers=headers or {}
+        ):
+            return main.infer_category(flask.request)
+
+    def test_responses_carry_rate_limit_headers(self):
+        response_body, status_code, headers = self._post(4)
+
+        self.assertEqual(status_code, 200)
+        self.assertEqual(headers['X-RateLimit-Limit'], '1280')
+        self.assertEqual(headers['X-RateLimit-Remaining'], str(1280 - 4 * 128))
+
+    def test_over_budget_batch_rejected_before_prediction(self):
+        self._post(8)
+        self.predictor.predict.reset_mock()
+
+        response_body, status_code, headers = self._post(4)
+
+        self.assertEqual(status_code, 429)
+        self.assertEqual(json.loads(response_body)['error'], 'QUOTA_EXCEEDED')
+        self.assertIn('Retry-After', headers)
+        self.predictor.predict.assert_not_called()
+
+    def test_changing_caller_header_does_not_reset_quota(self):
+        self._post(8, headers={'X-Caller-Id': 'sheet-1'})
+
+        _, status_code, _ = self._post(4, headers={'X-Caller-Id': 'sheet-2'})
+
+        self.assertEqual(status_code, 429)
+
+    @patch('main.callers', CallerIdentity(keys={'sheet-1': 's3cret'}))
+    def test_missing_caller_key_is_rejected(self):
+        _, status_code, _ = self._post(2)
+        self.assertEqual(status_code, 401)
+        self.predictor.predict.assert_not_called()
+
+        _, status_code, headers = self._post(2, headers={'X-Caller-Key': 's3cret'})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(headers['X-RateLimit-Remaining'], str(1280 - 2 * 128))
+
+    def test_failure_after_prediction_refunds_once(self):
+        self.predictor.predict.side_effect = lambda transactions: {'success': False, 'results': []}
+        self._post(2)
+        remaining = main.meter.usage('127.0.0.1')['remaining']
+        self.assertEqual(remaining, 1280)
+
+        with patch('main.encode_response', side_effect=RuntimeError("encoding failed")):
+            _, status_code, headers = self._post(2)
+
+        self.assertEqual(status_code, 500)
+        # Refunded for the failed prediction, not again for the encoding error
+        self.assertEqual(headers['X-RateLimit-Remaining'], '1280')
+        self.assertEqual(main.meter.usage('127.0.0.1')['used'], 0)
+
+    def test_usage_endpoint_does_not_predict(self):
+        self._post(3)
+
+        with self.app.test_request_context(
+            '/infer-category/usage', method='GET'
+        ):
+            response_body, status_code, headers = main.infer_category(flask.request)
+
+        usage = json.loads(response_body)['usage']
+        self.assertEqual(status_code, 200)
+        self.assertEqual(usage['used'], 3 * 128)
+        self.assertEqual(headers['X-RateLimit-Remaining'], str(usage['remaining']))
+        self.assertEqual(self.predictor.predict.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
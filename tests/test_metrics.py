@@ -0,0 +1,149 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import json
+import flask
+import httpx
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+import metrics
+from metrics import MetricsRegistry
+from predictor import TransactionPredictor
+
+TRANSACTIONS = [
+    {"id": "1", "dateOp": "2024-03-01", "transaction_description": "UBER TRIP", "amount": -12.0},
+    {"id": "2", "dateOp": "2024-03-02", "transaction_description": "SALARY MARCH", "amount": 2500.0}
+]
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_text_exposition_format(self):
+        registry = MetricsRegistry()
+        calls = registry.counter('calls_total', 'Calls made', ('outcome',))
+        latency = registry.histogram('latency_seconds', 'Latency', ('mode',), buckets=(0.1, 1.0))
+        calls.inc(outcome='ok')
+        calls.inc(2, outcome='say "hi"\n')
+        latency.observe(0.05, mode='mock')
+        latency.observe(0.5, mode='mock')
+        latency.observe(5, mode='mock')
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE calls_total counter', lines)
+        self.assertIn('calls_total{outcome="ok"} 1.0', lines)
+        self.assertIn('calls_total{outcome="say \\"hi\\"\\n"} 2.0', lines)
+        self.assertIn('# TYPE latency_seconds histogram', lines)
+        self.assertIn('latency_seconds_bucket{mode="mock",le="0.1"} 1.0', lines)
+        self.assertIn('latency_seconds_bucket{mode="mock",le="1.0"} 2.0', lines)
+        self.assertIn('latency_seconds_bucket{mode="mock",le="+Inf"} 3.0', lines)
+        self.assertIn('latency_seconds_sum{mode="mock"} 5.55', lines)
+        self.assertIn('latency_seconds_count{mode="mock"} 3.0', lines)
+
+        with self.assertRaises(ValueError):
+            calls.inc(mode='ok')
+        with self.assertRaises(ValueError):
+            registry.counter('calls_total', 'Again')
+
+
+@patch('predictor._ensure_tabpfn_client')
+class TestPredictorMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.env = patch.dict(os.environ, {'TABPFN_API_TOKEN': 'token-1234567890', 'TABPFN_API_URL': ''})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+
+    def test_stages_and_calls_are_recorded(self, _):
+        predictor = TransactionPredictor(model_dir='missing-model-dir')
+        predictor.transport = MagicMock()
+        predictor.transport.predict.side_effect = lambda rows: [
+            {'category': 'Transport', 'confidence': 0.9} for _ in rows
+        ]
+        calls = metrics.TABPFN_CALLS.value(outcome='ok')
+        infers = metrics.STAGE_LATENCY.count(stage='infer', mode='tabpfn')
+
+        with metrics.request_metrics() as record:
+            self.assertTrue(predictor.predict(TRANSACTIONS)['success'])
+
+        self.assertEqual(set(record['stages']), {'preprocess', 'infer', 'format'})
+        self.assertEqual((record['tabpfn_calls'], record['keyword_calls']), (1, 0))
+        self.assertEqual(metrics.TABPFN_CALLS.value(outcome='ok'), calls + 1)
+        self.assertEqual(metrics.STAGE_LATENCY.count(stage='infer', mode='tabpfn'), infers + 1)
+
+    def test_keyword_standin_is_not_a_tabpfn_call(self, _):
+        predictor = TransactionPredictor(model_dir='missing-model-dir')
+        calls = sum(metrics.TABPFN_CALLS.value(outcome=o) for o in ('ok', 'error', 'rate_limited'))
+        standins = metrics.KEYWORD_CALLS.value()
+
+        with metrics.request_metrics() as record:
+            self.assertTrue(predictor.predict(TRANSACTIONS)['success'])
+
+        self.assertEqual((record['tabpfn_calls'], record['keyword_calls']), (0, 1))
+        self.assertEqual(sum(metrics.TABPFN_CALLS.value(outcome=o) for o in ('ok', 'error', 'rate_limited')), calls)
+        self.assertEqual(metrics.KEYWORD_CALLS.value(), standins + 1)
+
+    def test_rate_limits_are_recorded(self, _):
+        predictor = TransactionPredictor(model_dir='missing-model-dir')
+        response = httpx.Response(429, json={'next_available_at': '2024-01-01T00:00:00Z'}, request=httpx.Request('POST', 'http://tabpfn/predict'))
+        predictor.transport = MagicMock()
+        predictor.transport.predict.side_effect = httpx.HTTPStatusError('429', request=response.request, response=response)
+        events = metrics.TABPFN_RATE_LIMITED.value()
+        errors = metrics.STAGE_LATENCY.count(stage='infer', mode='error')
+
+        with metrics.request_metrics() as record:
+            self.assertFalse(predictor.predict(TRANSACTIONS)['success'])
+
+        self.assertEqual(record['rate_limited'], 1)
+        self.assertEqual(metrics.TABPFN_RATE_LIMITED.value(), events + 1)
+        self.assertGreaterEqual(metrics.TABPFN_CALLS.value(outcome='rate_limited'), 1)
+        self.assertEqual(metrics.STAGE_LATENCY.count(stage='infer', mode='error'), errors + 1)
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.app.testing = True
+
+    def tearDown(self):
+        main.predictor = None
+        main.coalescer = None
+
+    def _call(self, path, method='GET', payload=None):
+        with self.app.test_request_context(path, method=method, json=payload):
+            return main.infer_category(flask.request)
+
+    @patch.dict(os.environ, {'USE_MOCK': 'true'})
+    def test_requests_are_counted_and_logged(self):
+        before = metrics.REQUESTS.value(mode='mock', status=200)
+        rows = metrics.ROWS.value(mode='mock')
+
+        with patch('metrics.METRICS_LOG_REQUESTS', True), self.assertLogs('metrics', level='INFO') as logs:
+            self.assertEqual(self._call('/infer-category', 'POST', {"transactions": TRANSACTIONS})[1], 200)
+            self.assertEqual(self._call('/infer-category', 'POST', {})[1], 400)
+
+        record = logs.records[0].metrics
+        self.assertEqual(record['mode'], 'mock')
+        self.assertEqual(record['rows'], 2)
+        self.assertIn('mock', record['stages'])
+        self.assertEqual(logs.records[1].metrics['mode'], 'error')
+        self.assertEqual(metrics.REQUESTS.value(mode='mock', status=200), before + 1)
+        self.assertEqual(metrics.ROWS.value(mode='mock'), rows + 2)
+
+        body, status, headers = self._call('/metrics')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(f'infer_category_requests_total{{mode="mock",status="200"}} {float(before + 1)}', body)
+        self.assertIn('# TYPE infer_category_stage_seconds histogram', body)
+        # Scrapes are not counted as requests
+        self.assertEqual(metrics.REQUESTS.value(mode='mock', status=200), before + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import pickle
+import time
+import tempfile
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from neighbors import BruteForceIndex, IVFIndex, build_index, grow_index, load_index
+from predictor import TransactionPredictor
+from tests.fixtures import make_labeled_transactions, fit_transformers
+
+
+def clustered_vectors(n_rows, n_clusters=50, dim=11, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    assignment = rng.integers(n_clusters, size=n_rows)
+    vectors = centers[assignment] + 0.05 * rng.normal(size=(n_rows, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32), np.array([f'cat{c}' for c in assignment])
+
+
+class TestIndexes(unittest.TestCase):
+
+    def test_brute_force_finds_exact_neighbor(self):
+        vectors, labels = clustered_vectors(500)
+        index = build_index(vectors, labels)
+        self.assertIsInstance(index, BruteForceIndex)
+
+        found, similarities = index.search(vectors[:20])
+        self.assertListEqual(list(found), list(labels[:20]))
+        np.testing.assert_allclose(similarities, 1.0, atol=1e-5)
+
+    def test_empty_index_returns_zero_similarity(self):
+        index = BruteForceIndex()
+        found, similarities = index.search(np.ones((3, 4), dtype=np.float32) / 2)
+        self.assertTrue((similarities == 0).all())
+
+    def test_ivf_matches_brute_force_labels(self):
+        all_vectors, all_labels = clustered_vectors(5200)
+        vectors, labels = all_vectors[:5000], all_labels[:5000]
+        queries, query_labels = all_vectors[5000:], all_labels[5000:]
+
+        ivf = IVFIndex.train(vectors, n_lists=40, n_probe=4)
+        ivf.add_vectors(vectors, labels)
+        found, similarities = ivf.search(queries)
+
+        self.assertGreater((found == query_labels).mean(), 0.95)
+        self.assertTrue((similarities > 0.9).all())
+
+    def test_save_and_memory_map(self):
+        vectors, labels = clustered_vectors(1000)
+        ivf = IVFIndex.train(vectors, n_lists=10)
+        ivf.add_vectors(vectors, labels)
+        for index in (build_index(vectors, labels), ivf):
+            with tempfile.TemporaryDirectory() as path:
+                index.save(path)
+                loaded = load_index(path)
+
+                self.assertEqual(len(loaded), 1000)
+                self.assertIsInstance(loaded._labels, np.memmap)
+                self.assertListEqual(list(loaded.search(vectors[:10])[0]), list(labels[:10]))
+
+                # Rows added to a memory-mapped index are kept on the next save
+                loaded.add_vectors(-vectors[:5], ['new'] * 5)
+                loaded.save(path)
+                reloaded = load_index(path)
+                self.assertEqual(len(reloaded), 1005)
+                self.assertListEqual(list(reloaded.search(-vectors[:5])[0]), ['new'] * 5)
+
+    def test_save_compacts_pending_rows(self):
+        vectors, labels = clustered_vectors(300)
+        ivf = IVFIndex.train(vectors, n_lists=10)
+        for index in (BruteForceIndex(), ivf):
+            with tempfile.TemporaryDirectory() as path:
+                index.add_vectors(vectors[:200], labels[:200])
+                self.assertEqual(len(index.pending_vectors()[1]), 200)
+
+                index.save(path)
+                self.assertEqual(len(index.pending_vectors()[1]), 0)
+                self.assertEqual(len(index), 200)
+
+                # Rows added after the save stay pending until the next one
+                index.add_vectors(vectors[200:], labels[200:])
+                pending_vectors, pending_labels = index.pending_vectors()
+                self.assertListEqual(sorted(pending_labels), sorted(labels[200:]))
+                self.assertEqual(pending_vectors.shape, (100, vectors.shape[1]))
+                self.assertEqual(len(index), 300)
+                self.assertListEqual(list(index.search(vectors[250:260])[0]), list(labels[250:260]))
+
+    def test_brute_force_grows_into_ivf(self):
+        vectors, labels = clustered_vectors(600)
+        index = build_index(vectors, labels)
+        self.assertIs(grow_index(index), index)
+
+        with tempfile.TemporaryDirectory() as path, patch('neighbors.BRUTE_FORCE_MAX_ROWS', 500):
+            index.save(path)
+            grown = grow_index(index)
+        self.assertIsInstance(grown, IVFIndex)
+        self.assertEqual(len(grown), 600)
+        self.assertGreater((grown.search(vectors[:50])[0] == labels[:50]).mean(), 0.95)
+
+    def test_saves_are_published_as_generations(self):
+        vectors, labels = clustered_vectors(300)
+        index = build_index(vectors[:100], labels[:100])
+        with tempfile.TemporaryDirectory() as path:
+            for version in (1, 2, 3):
+                index.save(path)
+                self.assertEqual(index.version, version)
+                self.assertEqual(load_index(path).version, version)
+                index.add_vectors(vectors[100 * version:100 * (version + 1)], labels[100 * version:100 * (version + 1)])
+            # The previous generation is kept for readers racing the swap, older ones go
+            self.assertEqual(
+                sorted(f for f in os.listdir(path) if f.endswith('.npy')),
+                ['labels.2.npy', 'labels.3.npy', 'vectors.2.npy', 'vectors.3.npy']
+            )
+
+    def test_interrupted_save_leaves_previous_generation(self):
+        vectors, labels = clustered_vectors(200)
+        index = build_index(vectors[:100], labels[:100])
+        with tempfile.TemporaryDirectory() as path:
+            index.save(path)
+            index.add_vectors(vectors[100:], labels[100:])
+
+            real_save = np.save
+            def fail_on_labels(file, array):
+                if 'labels' in os.fspath(file):
+                    raise OSError('disk full')
+                real_save(file, array)
+
+            with patch('neighbors.np.save', side_effect=fail_on_labels):
+                with self.assertRaises(OSError):
+                    index.save(path)
+
+            loaded = load_index(path)
+            self.assertEqual(len(loaded), 100)
+            self.assertEqual(loaded.version, 1)
+            self.assertEqual(len(index), 200)
+
+
+@patch('predictor._ensure_tabpfn_client')
+class TestNeighborTier(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmp_dir.name, 'transformers.pkl'), 'wb') as f:
+            pickle.dump(fit_transformers(make_labeled_transactions(300)), f)
+        self.index_dir = os.path.join(self.tmp_dir.name, 'neighbors')
+        self.env = patch.dict(os.environ, {'TABPFN_API_TOKEN': 'token-1234567890', 'NEIGHBOR_INDEX_SAVE_EVERY': '10'})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def _transactions(self, seed):
+        df = make_labeled_transactions(20, seed=seed)
+        return df.drop(columns=['category']).to_dict('records')
+
+    def _wait_for_save(self, predictor):
+        if predictor._neighbor_save_thread is not None:
+            predictor._neighbor_save_thread.join()
+
+    def test_near_duplicates_reuse_tabpfn_labels(self, _):
+        predictor = TransactionPredictor(model_dir=self.tmp_dir.name, neighbor_index_dir=self.index_dir)
+        transactions = self._transactions(seed=3)
+
+        first = predictor.predict(transactions)
+        self.assertEqual({r['tier'] for r in first['results']}, {'tabpfn'})
+
+        # Same merchants and amounts, different reference numbers
+        repeated = [dict(t, transaction_description=t['transaction_description'][:-5] + '00000') for t in transactions]
+        with patch.object(predictor, '_remote_predict', wraps=predictor._remote_predict) as remote:
+            second = predictor.predict(repeated)
+
+        remote.assert_not_called()
+        self.assertEqual({r['tier'] for r in second['results']}, {'neighbors'})
+        self.assertEqual(
+            [r['predicted_category'] for r in second['results']],
+            [r['predicted_category'] for r in first['results']]
+        )
+
+    def test_index_persisted_and_reloaded(self, _):
+        predictor = TransactionPredictor(model_dir=self.tmp_dir.name, neighbor_index_dir=self.index_dir)
+        predictor.predict(self._transactions(seed=4))
+        self._wait_for_save(predictor)
+
+        restarted = TransactionPredictor(model_dir=self.tmp_dir.name, neighbor_index_dir=self.index_dir)
+        self.assertEqual(len(restarted.neighbor_index), 20)
+        result = restarted.predict(self._transactions(seed=4))
+        self.assertEqual({r['tier'] for r in result['results']}, {'neighbors'})
+
+    def test_runtime_index_switches_to_ivf(self, _):
+        predictor = TransactionPredictor(model_dir=self.tmp_dir.name, neighbor_index_dir=self.index_dir)
+        with patch('neighbors.BRUTE_FORCE_MAX_ROWS', 15):
+            predictor.predict(self._transactions(seed=5))
+            self._wait_for_save(predictor)
+
+        self.assertIsInstance(predictor.neighbor_index, IVFIndex)
+        self.assertIn(('neighbors', predictor.neighbor_index, predictor.neighbor_threshold), predictor.cascade)
+        self.assertIsInstance(load_index(self.index_dir), IVFIndex)
+
+    def test_unsaved_rows_carried_across_reload(self, _):
+        with patch.dict(os.environ, {'NEIGHBOR_INDEX_SAVE_EVERY': '1000'}):
+            old = TransactionPredictor(model_dir=self.tmp_dir.name, neighbor_index_dir=self.index_dir)
+            old.predict(self._transactions(seed=6))
+            # A reload saves the index, then rows keep arriving before the swap
+            old.save_neighbor_index()
+            old.predict(self._transactions(seed=7))
+            new = TransactionPredictor(model_dir=self.tmp_dir.name, neighbor_index_dir=self.index_dir)
+            self.assertEqual(len(new.neighbor_index), 20)
+
+            old.hand_over_neighbors(new)
+            self.assertGreater(len(old.neighbor_index), 20)
+            self.assertEqual(len(new.neighbor_index), len(old.neighbor_index))
+            # Requests still finishing on the old predictor index into the new one
+            old.predict(self._transactions(seed=8))
+            self.assertGreater(len(new.neighbor_index), len(old.neighbor_index))
+
+        new.save_neighbor_index()
+        self.assertEqual(len(load_index(self.index_dir)), len(new.neighbor_index))
+
+    def test_save_runs_off_the_request_thread(self, _):
+        predictor = TransactionPredictor(model_dir=self.tmp_dir.name, neighbor_index_dir=self.index_dir)
+        real_save = predictor.neighbor_index.save
+        def slow_save(path):
+            time.sleep(1)
+            real_save(path)
+
+        with patch.object(predictor.neighbor_index, 'save', side_effect=slow_save):
+            started = time.perf_counter()
+            predictor.predict(self._transactions(seed=9))
+            self.assertLess(time.perf_counter() - started, 1)
+            # Requests keep indexing rows while the save is running
+            predictor.predict(self._transactions(seed=10))
+            self.assertLess(time.perf_counter() - started, 1)
+            self.assertGreater(len(predictor.neighbor_index), 20)
+            self._wait_for_save(predictor)
+
+        saved = load_index(self.index_dir)
+        self.assertGreaterEqual(len(saved), 20)
+        self.assertEqual(len(saved) + len(predictor.neighbor_index.pending_vectors()[1]), len(predictor.neighbor_index))
+
+    def test_reload_picks_up_generation_saved_before_hand_over(self, _):
+        with patch.dict(os.environ, {'NEIGHBOR_INDEX_SAVE_EVERY': '1000'}):
+            old = TransactionPredictor(model_dir=self.tmp_dir.name, neighbor_index_dir=self.index_dir)
+            old.predict(self._transactions(seed=11))
+            old.save_neighbor_index()
+            new = TransactionPredictor(model_dir=self.tmp_dir.name, neighbor_index_dir=self.index_dir)
+            # A background save on the old predictor lands after the new one loaded
+            old.predict(self._transactions(seed=12))
+            old.save_neighbor_index()
+
+            old.hand_over_neighbors(new)
+        self.assertEqual(new.neighbor_index.version, old.neighbor_index.version)
+        self.assertEqual(len(new.neighbor_index), len(old.neighbor_index))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import time
+import pickle
+import tempfile
+import contextvars
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import metrics
+from pipeline import StagedPipeline
+from predictor import TransactionPredictor
+from surrogate import train_surrogate
+from tests.fixtures import make_labeled_transactions, fit_transformers
+
+
+def sleeper(seconds, fn=lambda x: x):
+    def stage(item):
+        time.sleep(seconds)
+        return fn(item)
+    return stage
+
+
+class TestStagedPipeline(unittest.TestCase):
+
+    def test_outputs_in_order(self):
+        pipeline = StagedPipeline([('a', lambda x: x + 1), ('b', sleeper(0.001, lambda x: x * 2))], queue_size=1)
+        outputs, stats = pipeline.run(range(50))
+        self.assertEqual(outputs, [(x + 1) * 2 for x in range(50)])
+        self.assertEqual(stats['chunks'], 50)
+        self.assertEqual(stats['stages']['b']['chunks'], 50)
+
+    def test_stages_overlap(self):
+        pipeline = StagedPipeline([('cpu', sleeper(0.05)), ('io', sleeper(0.05))])
+        outputs, stats = pipeline.run(range(8))
+        # Sequential would take 0.8s; overlapped about 0.45s
+        self.assertLess(stats['wall_s'], 0.7)
+        self.assertGreater(stats['overlap'], 1.2)
+        self.assertGreater(stats['stages']['io']['utilization'], 0.7)
+
+    def test_stages_see_the_callers_context(self):
+        request_id = contextvars.ContextVar('request_id', default=None)
+        request_id.set('req-1')
+        pipeline = StagedPipeline([('a', lambda x: (x, request_id.get())), ('b', lambda x: x + (request_id.get(),))])
+        outputs, _ = pipeline.run(range(3))
+        self.assertEqual(outputs, [(x, 'req-1', 'req-1') for x in range(3)])
+
+    def test_failure_stops_every_stage(self):
+        def fail(x):
+            if x == 3:
+                raise ValueError("bad chunk")
+            return x
+
+        pipeline = StagedPipeline([('ingest', lambda x: x), ('fail', fail), ('slow', sleeper(0.01))], queue_size=1)
+        with self.assertRaises(ValueError):
+            pipeline.run(range(1000))
+
+
+@patch('predictor._ensure_tabpfn_client')
+class TestPipelinedPredict(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        train_df = make_labeled_transactions(400)
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        transformers = fit_transformers(train_df)
+        with open(os.path.join(cls.tmp_dir.name, 'transformers.pkl'), 'wb') as f:
+            pickle.dump(transformers, f)
+        with open(os.path.join(cls.tmp_dir.name, 'surrogate.pkl'), 'wb') as f:
+            pickle.dump(train_surrogate(train_df, transformers), f)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_same_results_as_single_pass(self, _):
+        transactions = make_labeled_transactions(1000, seed=3).drop(columns=['category', 'id']).to_dict('records')
+        with patch.dict(os.environ, {'TABPFN_API_TOKEN': 'token-1234567890'}):
+            predictor = TransactionPredictor(model_dir=self.tmp_dir.name, cascade_threshold=0.9)
+
+        predictor.pipeline_chunk_rows = 0
+        expected = predictor.predict(transactions)['results']
+
+        predictor.pipeline_chunk_rows = 128
+        self.assertEqual(predictor.predict(transactions)['results'], expected)
+
+        with metrics.request_metrics() as record:
+            response, stats = predictor._pipelined_predict(transactions)
+        self.assertTrue(response['success'])
+        # Positions of id-less rows are counted across chunks
+        self.assertEqual(response['results'], expected)
+        self.assertEqual(response['results'][-1]['transaction_id'], '999')
+        # Stages see the request's metrics record
+        self.assertGreater(record['tabpfn_calls'] + record['keyword_calls'], 0)
+        self.assertEqual(sum(record['cache']['surrogate'].values()), 1000)
+
+        self.assertEqual(stats['chunks'], 8)
+        self.assertEqual(set(stats['stages']), {'ingest', 'preprocess', 'infer', 'format'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import time
+import pstats
+import tempfile
+import flask
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+from profiling import RequestProfiler
+
+TRANSACTIONS = [
+    {"id": "1", "dateOp": "2024-03-01", "transaction_description": "UBER TRIP", "amount": -12.0},
+    {"id": "2", "dateOp": "2024-03-02", "transaction_description": "SALARY MARCH", "amount": 2500.0}
+]
+
+
+def busy_loop(duration_s):
+    deadline = time.perf_counter() + duration_s
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+
+class TestRequestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.app.testing = True
+        self.directory = tempfile.TemporaryDirectory()
+        self.profiler = RequestProfiler('secret', directory=self.directory.name, max_per_hour=2)
+        self.patch = patch('main.profiler', self.profiler)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.directory.cleanup()
+        main.predictor = None
+        main.coalescer = None
+
+    def _call(self, path, method='POST', headers=None):
+        payload = {"transactions": TRANSACTIONS} if method == 'POST' else None
+        with self.app.test_request_context(path, method=method, json=payload, headers=headers or {}):
+            return main.infer_category(flask.request)
+
+    @patch.dict(os.environ, {'USE_MOCK': 'true'})
+    def test_profiled_request_stores_pstats(self):
+        with self.assertLogs('profiling', level='INFO') as logs:
+            body, status, headers = self._call('/infer-category', headers={'X-Profile': 'cprofile', 'X-Profile-Token': 'secret'})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['X-Profile-Status'], 'profiled')
+        self.assertTrue(any(entry['function'].startswith('main.py') for entry in logs.records[0].profile['top']))
+
+        artifact, status, artifact_headers = self._call(f"/profiles/{headers['X-Profile-Id']}", 'GET', {'X-Profile-Token': 'secret'})
+        self.assertEqual(status, 200)
+        self.assertEqual(artifact_headers['Content-Type'], 'application/octet-stream')
+        path = os.path.join(self.directory.name, 'downloaded.pstats')
+        with open(path, 'wb') as f:
+            f.write(artifact)
+        self.assertGreater(pstats.Stats(path).total_calls, 0)
+
+        self.assertEqual(self._call(f"/profiles/{headers['X-Profile-Id']}", 'GET')[1], 403)
+        self.assertEqual(self._call('/profiles/unknown', 'GET', {'X-Profile-Token': 'secret'})[1], 404)
+
+    @patch.dict(os.environ, {'USE_MOCK': 'true'})
+    def test_unauthorized_and_rate_limited_requests_are_served_unprofiled(self):
+        body, status, headers = self._call('/infer-category?profile=1', headers={'X-Profile-Token': 'wrong'})
+        self.assertEqual((status, headers['X-Profile-Status']), (200, 'unauthorized'))
+        self.assertNotIn('X-Profile-Id', headers)
+
+        statuses = [
+            self._call('/infer-category?profile=sample', headers={'X-Profile-Token': 'secret'})[2]['X-Profile-Status']
+            for _ in range(3)
+        ]
+        self.assertEqual(statuses, ['profiled', 'profiled', 'rate_limited'])
+        self.assertNotIn('X-Profile-Status', self._call('/infer-category')[2])
+
+    def test_rate_limit_window_and_concurrency(self):
+        self.assertIsNone(self.profiler._acquire(now=0))
+        self.assertEqual(self.profiler._acquire(now=1), 'busy')
+        self.profiler.release()
+        self.assertIsNone(self.profiler._acquire(now=2))
+        self.profiler.release()
+        self.assertEqual(self.profiler._acquire(now=3), 'rate_limited')
+        self.assertIsNone(self.profiler._acquire(now=3601))
+
+    def test_sampling_profiler_writes_collapsed_stacks(self):
+        profiler = RequestProfiler('secret', directory=self.directory.name, keep=1, sample_interval_s=0.001)
+        with self.app.test_request_context('/', headers={'X-Profile': 'sample', 'X-Profile-Token': 'secret'}):
+            for request_id in ('first', 'second'):
+                with profiler.session(flask.request, request_id) as session:
+                    busy_loop(0.1)
+
+        self.assertGreater(session.summary['samples'], 10)
+        self.assertIn('busy_loop', session.summary['top'][0]['stack'])
+        # Only the newest artifact is kept
+        self.assertEqual(os.listdir(self.directory.name), ['second.collapsed'])
+        with open(os.path.join(self.directory.name, 'second.collapsed')) as f:
+            stack, count = f.readline().rsplit(' ', 1)
+        self.assertIn('test_profiling.py:busy_loop', stack.split(';')[-1])
+        self.assertGreater(int(count), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
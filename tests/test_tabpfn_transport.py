@@ -0,0 +1,237 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import predictor as predictor_module
+from predictor import TransactionPredictor
+from tabpfn_transport import AsyncTabPFNTransport, HedgingPolicy
+
+
+class FakeTabPFNHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+            self.server.calls += 1
+        try:
+            time.sleep(self.server.latency_s)
+            if self.server.status != 200:
+                payload = {'next_available_at': '2030-01-01T00:00:00Z'}
+            else:
+                payload = {'predictions': [
+                    {'category': 'Transport' if 'sncf' in row['transaction_description'].lower() else 'Other',
+                     'confidence': 0.97}
+                    for row in body['rows']
+                ]}
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(self.server.status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def rows(n):
+    return [
+        {'id': str(i), 'dateOp': '01/01/2024', 'transaction_description': 'SNCF PARIS' if i % 2 else 'BOULANGERIE', 'amount': -10.0}
+        for i in range(n)
+    ]
+
+
+class TestAsyncTabPFNTransport(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTabPFNHandler)
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.calls = 0
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self.server.latency_s = 0.05
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    async def test_bounded_concurrency_and_order(self):
+        transport = AsyncTabPFNTransport(self.url, token='t', max_in_flight=3, max_rows_per_call=10)
+        try:
+            predictions = await transport.predict_async(rows(100))
+        finally:
+            transport.close()
+
+        self.assertEqual(len(predictions), 100)
+        self.assertEqual([p['category'] for p in predictions[:4]], ['Other', 'Transport', 'Other', 'Transport'])
+        self.assertEqual(self.server.calls, 10)
+        self.assertLessEqual(self.server.max_in_flight, 3)
+        self.assertGreater(self.server.max_in_flight, 1)
+
+    async def test_connections_are_kept_alive_across_requests(self):
+        transport = AsyncTabPFNTransport(self.url, max_in_flight=2, max_rows_per_call=5)
+        try:
+            for _ in range(5):
+                await transport.predict_async(rows(10))
+            # Synchronous callers share the same pool
+            transport.predict(rows(10))
+        finally:
+            transport.close()
+
+        self.assertEqual(self.server.calls, 12)
+        self.assertLessEqual(self.server.connections, 2)
+
+    async def test_timeout_and_status_errors(self):
+        self.server.latency_s = 0.5
+        transport = AsyncTabPFNTransport(self.url, timeout_s=0.1)
+        try:
+            with self.assertRaises(httpx.TimeoutException):
+                await transport.predict_async(rows(1))
+
+            self.server.latency_s = 0
+            self.server.status = 429
+            with self.assertRaises(httpx.HTTPStatusError) as ctx:
+                await transport.predict_async(rows(1))
+            self.assertEqual(ctx.exception.response.status_code, 429)
+            self.assertEqual(transport.stats()['failures'], 2)
+        finally:
+            transport.close()
+
+    @patch.object(predictor_module, '_ensure_tabpfn_client')
+    async def test_predictor_predict_async(self, _):
+        with patch.dict(os.environ, {'TABPFN_API_TOKEN': 'test-token', 'TABPFN_API_URL': self.url}):
+            predictor = TransactionPredictor(model_dir='missing-model-dir')
+        try:
+            response, sync_response = await asyncio.gather(
+                predictor.predict_async(rows(4)),
+                asyncio.to_thread(predictor.predict, rows(4))
+            )
+            self.assertTrue(response['success'])
+            self.assertEqual([r['predicted_category'] for r in response['results']], ['Other', 'Transport', 'Other', 'Transport'])
+            self.assertEqual({r['tier'] for r in response['results']}, {'tabpfn'})
+            self.assertEqual(response['results'], sync_response['results'])
+
+            self.server.status = 429
+            response = await predictor.predict_async(rows(2))
+            self.assertFalse(response['success'])
+        finally:
+            predictor.transport.close()
+            predictor_module._transports.clear()
+
+
+class SlowEveryNth:
+    """Fake backend where every ``n``-th request is slow."""
+
+    def __init__(self, n, slow_s, fast_s=0.005):
+        self.n = n
+        self.slow_s = slow_s
+        self.fast_s = fast_s
+        self.requests = 0
+
+    async def __call__(self, request):
+        self.requests += 1
+        slow = self.requests % self.n == 0
+        await asyncio.sleep(self.slow_s if slow else self.fast_s)
+        rows = json.loads(request.content)['rows']
+        return httpx.Response(200, json={'predictions': [{'category': 'Other', 'confidence': 0.9}] * len(rows)})
+
+
+class TestHedging(unittest.IsolatedAsyncioTestCase):
+
+    async def _run(self, hedging, n_calls=100):
+        backend = SlowEveryNth(10, slow_s=0.3)
+        transport = AsyncTabPFNTransport(
+            'http://fake-tabpfn', hedging=hedging, transport=httpx.MockTransport(backend)
+        )
+        latencies = []
+        try:
+            for _ in range(n_calls):
+                started = time.perf_counter()
+                await transport.predict_async(rows(2))
+                latencies.append(time.perf_counter() - started)
+            return latencies, transport.stats(), backend
+        finally:
+            transport.close()
+
+    async def test_hedges_cut_tail_latency(self):
+        latencies, stats, backend = await self._run(HedgingPolicy(percentile=0.8, max_hedge_rate=0.2, min_samples=10))
+
+        self.assertGreater(stats['hedges_issued'], 0)
+        self.assertLessEqual(stats['hedges_issued'], 0.2 * stats['hedged_calls'])
+        # Slow calls after warm-up are hedged and won by the duplicate; jitter
+        # may hedge a few fast calls whose original still answers first
+        self.assertGreaterEqual(stats['hedges_won'], 5)
+        self.assertLessEqual(stats['hedges_won'], stats['hedges_issued'])
+        self.assertEqual(backend.requests, 100 + stats['hedges_issued'])
+        # Once warmed up, slow calls are answered by their hedge
+        self.assertLess(max(latencies[20:]), 0.2)
+
+    async def test_losers_are_recorded(self):
+        policy = HedgingPolicy(percentile=0.8, max_hedge_rate=0.2, min_samples=10)
+        _, stats, backend = await self._run(policy)
+        self.assertGreater(stats['hedges_won'], 0)
+        # Winners and cancelled losers alike
+        self.assertEqual(len(policy._latencies), backend.requests)
+
+    async def test_calls_queued_for_a_slot_are_not_hedged(self):
+        policy = HedgingPolicy(percentile=0.95, max_hedge_rate=1.0, min_samples=5)
+        for _ in range(5):
+            policy.record(0.1)
+
+        async def backend(request):
+            await asyncio.sleep(0.02)
+            rows = json.loads(request.content)['rows']
+            return httpx.Response(200, json={'predictions': [{'category': 'Other', 'confidence': 0.9}] * len(rows)})
+
+        transport = AsyncTabPFNTransport(
+            'http://fake-tabpfn', max_in_flight=1, max_rows_per_call=1, hedging=policy,
+            transport=httpx.MockTransport(backend)
+        )
+        try:
+            # Eight 20ms calls through one slot: the last waits 0.14s, past the 0.1s p95
+            self.assertEqual(len(await transport.predict_async(rows(8))), 8)
+        finally:
+            transport.close()
+        self.assertEqual(policy.hedges_issued, 0)
+
+    async def test_hedge_rate_is_capped(self):
+        latencies, stats, backend = await self._run(HedgingPolicy(percentile=0.5, max_hedge_rate=0.02, min_samples=5))
+        self.assertLessEqual(stats['hedges_issued'], 2)
+        self.assertGreater(max(latencies[20:]), 0.25)
+
+    def test_no_hedge_while_warming_up(self):
+        policy = HedgingPolicy(min_samples=3)
+        self.assertIsNone(policy.delay())
+        for latency in (0.1, 0.2, 0.3):
+            policy.record(latency)
+        self.assertAlmostEqual(policy.delay(), 0.29)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import json
+import tempfile
+import flask
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+from predictor import TransactionPredictor
+from replay_trace import compare, replay
+from trace_capture import (
+    TraceRecorder, anonymize_description, anonymize_transaction, bucket_amount, create_trace_recorder, read_trace
+)
+
+TRANSACTIONS = [
+    {"id": "1", "dateOp": "2024-03-01", "transaction_description": "CARREFOUR MARKET 1234", "amount": -52.37},
+    {"id": "2", "dateOp": "2024-03-02", "transaction_description": "carrefour market 5678", "amount": -8.1},
+    {"id": "3", "dateOp": "2024-03-03", "transaction_description": "SALARY MARCH", "amount": 2500.0}
+]
+
+
+class TestAnonymization(unittest.TestCase):
+
+    def test_descriptions_are_hashed_but_keep_duplicates_and_length(self):
+        first = anonymize_description("CARREFOUR MARKET 1234", salt='s')
+        self.assertEqual(first, anonymize_description("carrefour  Market 1234", salt='s'))
+        self.assertEqual(len(first), len("CARREFOUR MARKET 1234"))
+        self.assertNotIn('CARREFOUR', first.upper())
+        self.assertNotEqual(first, anonymize_description("CARREFOUR MARKET 1234", salt='other'))
+        self.assertNotEqual(first, anonymize_description("SALARY MARCH", salt='s'))
+
+    def test_transactions_keep_dates_and_bucket_amounts(self):
+        anonymized = anonymize_transaction(TRANSACTIONS[0])
+        self.assertEqual(set(anonymized), {'dateOp', 'transaction_description', 'amount'})
+        self.assertEqual(anonymized['dateOp'], '2024-03-01')
+        self.assertEqual(anonymized['amount'], -56.23)
+        self.assertEqual(bucket_amount(-50.0), bucket_amount(-52.37))
+        self.assertEqual(bucket_amount('2500,00'), 3162.28)
+        self.assertEqual(bucket_amount(0), 0.0)
+
+
+class TestTraceCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.app.testing = True
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'trace.jsonl')
+
+    def tearDown(self):
+        main.predictor = None
+        main.coalescer = None
+        self.directory.cleanup()
+
+    def _call(self, payload):
+        with self.app.test_request_context('/infer-category', method='POST', json=payload):
+            return main.infer_category(flask.request)
+
+    @patch.dict(os.environ, {'USE_MOCK': 'true'})
+    def test_sampled_requests_are_recorded(self):
+        with patch('main.tracer', TraceRecorder(self.path, sample_rate=1.0)):
+            self.assertEqual(self._call({"transactions": TRANSACTIONS})[1], 200)
+            self.assertEqual(self._call({"transactions": TRANSACTIONS[:1]})[1], 200)
+            self.assertEqual(self._call({})[1], 400)
+
+        entries = read_trace(self.path)
+        self.assertEqual([entry['rows'] for entry in entries], [3, 1])
+        self.assertEqual(entries[0]['status'], 200)
+        self.assertGreater(entries[0]['latency_ms'], 0)
+        self.assertNotIn('SALARY', json.dumps(entries))
+        self.assertNotIn('id', entries[0]['transactions'][0])
+
+    def test_salt_is_never_empty_or_written(self):
+        with patch.dict(os.environ, {'TRACE_SAMPLE_RATE': '1', 'TRACE_PATH': self.path}):
+            os.environ.pop('TRACE_SALT', None)
+            first, second = create_trace_recorder(), create_trace_recorder()
+            with patch.dict(os.environ, {'TRACE_SALT': 'shared-secret'}):
+                configured = create_trace_recorder()
+
+        self.assertTrue(first.salt)
+        self.assertNotEqual(first.salt, second.salt)
+        self.assertEqual(configured.salt, 'shared-secret')
+
+        first.record(TRANSACTIONS, 200, 0.01)
+        entry, = read_trace(self.path)
+        self.assertEqual(entry['salt_id'], first.salt_id)
+        self.assertNotIn(first.salt, json.dumps(entry))
+        self.assertNotEqual(
+            entry['transactions'][2]['transaction_description'],
+            anonymize_description("SALARY MARCH")
+        )
+
+    def test_unsampled_requests_are_not_recorded(self):
+        with patch('main.tracer', TraceRecorder(self.path, sample_rate=0.0)):
+            self._call({"transactions": TRANSACTIONS})
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestReplay(unittest.TestCase):
+
+    def test_replay_and_compare(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.jsonl')
+            recorder = TraceRecorder(path, sample_rate=1.0)
+            for i in range(5):
+                recorder.record(TRANSACTIONS, 200, 0.05, started_at=1000.0 + i * 0.01)
+            entries = read_trace(path)
+
+        predictor = TransactionPredictor(use_mock=True)
+        report = replay(entries, predictor.predict, speed=1.0, concurrency=2)
+        self.assertEqual(report['requests'], 5)
+        self.assertEqual(report['rows'], 15)
+        self.assertEqual(report['failed'], 0)
+        # Paced at the recorded 10 ms gaps
+        self.assertGreaterEqual(report['elapsed_s'], 0.04)
+        self.assertEqual(report['recorded_latency_ms']['p50'], 50.0)
+
+        slower = dict(report, throughput_rps=report['throughput_rps'] / 2)
+        diff, regressions = compare(slower, report, max_regression=0.1)
+        self.assertAlmostEqual(diff['throughput_rps']['change'], -0.5, places=2)
+        self.assertEqual(regressions, ['throughput_rps'])
+        self.assertEqual(compare(report, report, max_regression=0.1)[1], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
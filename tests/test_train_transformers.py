@@ -0,0 +1,128 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import pickle
+import tempfile
+import numpy as np
+from sklearn.decomposition import IncrementalPCA
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import memory_accounting
+from batch_categorize import read_chunks
+from predictor import TransactionPredictor, preprocess_inference_data, validate_transformers
+from surrogate import train_surrogate
+from train_transformers import MAX_FEATURES, TransformerTrainer, train_transformers
+from tests.fixtures import make_labeled_transactions, fit_transformers
+
+
+def chunked(df, chunk_rows):
+    return lambda: (df.iloc[start:start + chunk_rows] for start in range(0, len(df), chunk_rows))
+
+
+def generated_chunks(n_chunks, chunk_rows):
+    return lambda: (make_labeled_transactions(chunk_rows, seed=seed) for seed in range(n_chunks))
+
+
+class TestTrainTransformers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = make_labeled_transactions(1000)
+        cls.reference = fit_transformers(cls.df)
+
+    def test_matches_in_memory_fit(self):
+        transformers = train_transformers(chunked(self.df, 97))
+        self.assertTrue(validate_transformers(transformers))
+
+        np.testing.assert_allclose(transformers['scaler'].mean_, self.reference['scaler'].mean_)
+        np.testing.assert_allclose(transformers['scaler'].var_, self.reference['scaler'].var_)
+        self.assertEqual(transformers['tfidf'].vocabulary_, self.reference['tfidf'].vocabulary_)
+        np.testing.assert_allclose(transformers['tfidf'].idf_, self.reference['tfidf'].idf_)
+        self.assertAlmostEqual(
+            transformers['pca'].explained_variance_ratio_.sum(),
+            self.reference['pca'].explained_variance_ratio_.sum(),
+            delta=0.02
+        )
+
+        # The embeddings are as useful to the surrogate as in-memory ones
+        surrogate = train_surrogate(self.df, transformers)
+        test_df = make_labeled_transactions(200, seed=1)
+        categories, _ = surrogate.predict(preprocess_inference_data(test_df, transformers))
+        self.assertGreater((categories == test_df['category'].to_numpy()).mean(), 0.8)
+
+    def test_unlabeled_rows_are_skipped(self):
+        df = self.df.copy()
+        df['category'] = df['category'].astype(object)
+        df.loc[df.index[:500], 'category'] = None
+        transformers = train_transformers(chunked(df, 100))
+        self.assertEqual(transformers['pca'].n_samples_, 500)
+        self.assertAlmostEqual(transformers['scaler'].n_samples_seen_, 500)
+
+        with self.assertRaises(ValueError):
+            train_transformers(chunked(df.iloc[:500], 100))
+
+    def test_csv_artifact_loads_in_predictor(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = os.path.join(directory, 'history.csv')
+            self.df.to_csv(data_path, index=False)
+            transformers = train_transformers(lambda: read_chunks(data_path, 250), max_features=50)
+            self.assertEqual(len(transformers['tfidf'].vocabulary_), 50)
+
+            with open(os.path.join(directory, 'transformers.pkl'), 'wb') as f:
+                pickle.dump(transformers, f)
+            with patch.dict(os.environ, {'TABPFN_API_TOKEN': ''}):
+                predictor = TransactionPredictor(model_dir=directory)
+                predictor._load_cascade()
+        self.assertEqual(type(predictor.transformers['pca']).__name__, 'PCA')
+
+    def test_embedding_fitted_in_bounded_batches(self):
+        self.assertEqual(TransformerTrainer().max_features, MAX_FEATURES)
+
+        real_partial_fit = IncrementalPCA.partial_fit
+        batch_sizes = []
+
+        def partial_fit(pca, X):
+            batch_sizes.append(len(X))
+            if len(batch_sizes) == 2:
+                raise np.linalg.LinAlgError("SVD did not converge")
+            return real_partial_fit(pca, X)
+
+        with patch.object(IncrementalPCA, 'partial_fit', autospec=True, side_effect=partial_fit):
+            # 1000 rows = 9 x 111 + 1: the single leftover row joins the last batch
+            transformers = train_transformers(chunked(self.df, 250), batch_rows=111)
+
+        self.assertEqual(transformers['pca'].n_samples_, 1000)
+        # The batch that failed to converge is refitted in halves
+        self.assertEqual(batch_sizes[:4], [111, 111, 55, 56])
+        self.assertEqual(batch_sizes[-1], 112)
+        self.assertLessEqual(max(batch_sizes), 111 + 9)
+
+    def test_vocabulary_counts_are_bounded(self):
+        with self.assertLogs('train_transformers', level='WARNING'):
+            transformers = train_transformers(chunked(self.df, 100), max_candidates=40)
+        self.assertLessEqual(len(transformers['tfidf'].vocabulary_), 40)
+        # Template words survive pruning; one-off references do not
+        self.assertIn('carrefour', transformers['tfidf'].vocabulary_)
+
+    def test_peak_memory_does_not_grow_with_rows(self):
+        was_tracing = memory_accounting.enabled()
+        memory_accounting.enable()
+        try:
+            peaks = []
+            # Default options: the vocabulary reaches its cap, then memory stays flat
+            for n_chunks in (4, 12):
+                with memory_accounting.measure() as usage:
+                    train_transformers(generated_chunks(n_chunks, 1000))
+                peaks.append(usage['peak_alloc_mb'])
+        finally:
+            if not was_tracing:
+                memory_accounting.disable()
+
+        self.assertLess(peaks[1], peaks[0] * 1.5 + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import json
+import flask
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import main
+import wire_format
+from predictor import TransactionPredictor
+from wire_format import ARROW_STREAM, PARQUET, JSON, decode_response, encode_request
+
+TRANSACTIONS = [
+    {'id': '1', 'dateOp': '15/01/2024', 'transaction_description': 'CARTE SNCF PARIS', 'amount': -12.5},
+    {'id': '2', 'dateOp': '16/01/2024', 'transaction_description': 'MONOPRIX 1234', 'amount': -40.0},
+    {'id': '3', 'dateOp': '17/01/2024', 'transaction_description': 'SPOTIFY', 'amount': -9.99},
+]
+
+
+class TestWireFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.app.testing = True
+        main.predictor = TransactionPredictor(use_mock=True, artifact_version='1')
+
+    def tearDown(self):
+        main.predictor = None
+
+    def _call(self, **kwargs):
+        with self.app.test_request_context('/infer-category', method='POST', **kwargs):
+            return main.infer_category(flask.request)
+
+    def test_json_stays_the_default(self):
+        body, status, headers = self._call(json={'transactions': TRANSACTIONS}, headers={'Accept': '*/*'})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Type'], JSON)
+        results = json.loads(body)['results']['results']
+        self.assertEqual(results[0]['description'], 'CARTE SNCF PARIS')
+
+    def test_compact_mode_omits_echoed_fields(self):
+        body, status, _ = self._call(json={'transactions': TRANSACTIONS, 'compact': True})
+
+        results = json.loads(body)['results']['results']
+        self.assertEqual(status, 200)
+        self.assertNotIn('description', results[0])
+        self.assertEqual([r['transaction_id'] for r in results], ['1', '2', '3'])
+
+    def test_binary_body_without_pyarrow_is_415(self):
+        with patch.object(wire_format, 'pa', None):
+            body, status, _ = self._call(data=b'\x00', content_type=ARROW_STREAM)
+
+        self.assertEqual(status, 415)
+        self.assertEqual(json.loads(body)['error'], 'UNSUPPORTED_MEDIA_TYPE')
+
+    @unittest.skipUnless(wire_format.binary_formats_available(), "pyarrow is not installed")
+    def test_arrow_request_and_response(self):
+        expected = main.predictor.predict(TRANSACTIONS)['results']
+
+        for body_format in (ARROW_STREAM, PARQUET):
+            body, status, headers = self._call(
+                data=encode_request(TRANSACTIONS, body_format, compact=True),
+                content_type=body_format,
+                headers={'Accept': body_format}
+            )
+
+            self.assertEqual(status, 200)
+            self.assertEqual(headers['Content-Type'], body_format)
+            response = decode_response(body, body_format)
+            self.assertTrue(response['success'])
+            self.assertEqual(response['model_version'], 'mock-1')
+            rows = response['results']['results']
+            self.assertEqual([r['predicted_category'] for r in rows], [r['predicted_category'] for r in expected])
+            self.assertEqual(len(rows[0]['fingerprint']), 20)
+            self.assertNotIn('description', rows[0])
+
+    @unittest.skipUnless(wire_format.binary_formats_available(), "pyarrow is not installed")
+    def test_arrow_request_skips_unchanged_rows(self):
+        first = json.loads(self._call(json={'transactions': TRANSACTIONS})[0])
+        fingerprints = [r['fingerprint'] for r in first['results']['results']]
+
+        body, status, _ = self._call(
+            data=encode_request(TRANSACTIONS, ARROW_STREAM, if_none_match=fingerprints[:2]),
+            content_type=ARROW_STREAM
+        )
+
+        response = json.loads(body)
+        self.assertEqual(status, 200)
+        self.assertEqual(response['unchanged'], ['1', '2'])
+        self.assertEqual([r['transaction_id'] for r in response['results']['results']], ['3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+Anonymized request traces for performance regression testing.
+
+TraceRecorder samples infer_category requests and appends one JSON line
+per sampled request to a trace file: its arrival time, status, latency and
+the transactions it carried, anonymized so a trace can leave production:
+
+- descriptions are replaced by a salted hash of their normalized form,
+  padded to the same length, so duplicates (as the fingerprint and
+  neighbor tiers see them) stay duplicates and text cost stays realistic.
+  The salt is TRACE_SALT, or a random one per recorder that never leaves
+  the process; each entry carries only an id of the salt it was hashed with
+- amounts are rounded to log-scale buckets, keeping their sign
+- dates are kept, preserving the real date distribution
+- ids and any other fields are dropped
+
+replay_trace.py feeds a trace back through TransactionPredictor.
+"""
+
+import os
+import json
+import math
+import time
+import hashlib
+import logging
+import secrets
+import threading
+
+from log_utils import is_sampled
+from preprocessing import normalize_description
+
+logger = logging.getLogger(__name__)
+
+# Amount buckets per factor of ten
+AMOUNT_BUCKETS_PER_DECADE = 4
+
+
+def anonymize_description(description, salt=''):
+    """Salted hash of the normalized description, padded to its length."""
+    normalized = normalize_description('' if description is None else str(description))
+    digest = hashlib.sha256(f'{salt}\x1f{normalized}'.encode('utf-8')).hexdigest()
+    length = max(len(normalized), 1)
+    return (digest * (length // len(digest) + 1))[:length]
+
+
+def bucket_amount(amount):
+    """Round an amount to the nearest log-scale bucket (0 stays 0)."""
+    try:
+        value = float(str(amount).replace(',', '.'))
+    except (TypeError, ValueError):
+        return 0.0
+    if value == 0 or math.isnan(value):
+        return 0.0
+    bucket = round(math.log10(abs(value)) * AMOUNT_BUCKETS_PER_DECADE) / AMOUNT_BUCKETS_PER_DECADE
+    return math.copysign(round(10 ** bucket, 2), value)
+
+
+def anonymize_transaction(transaction, salt=''):
+    description = transaction.get('transaction_description', transaction.get('description', ''))
+    return {
+        'dateOp': transaction.get('dateOp', transaction.get('date')),
+        'transaction_description': anonymize_description(description, salt),
+        'amount': bucket_amount(transaction.get('amount', 0))
+    }
+
+
+class TraceRecorder:
+    """Append anonymized, sampled requests to a JSONL trace.
+
+    Args:
+        path: Trace file, appended to
+        sample_rate: Fraction of requests recorded
+        salt: Secret mixed into description hashes (default: random per recorder)
+    """
+
+    def __init__(self, path, sample_rate, salt=None):
+        self.path = path
+        self.sample_rate = sample_rate
+        # Unsalted hashes of short descriptions could be reversed by hashing guesses
+        self.salt = salt or secrets.token_hex(16)
+        # Entries hashed with different salts do not share duplicates
+        self.salt_id = hashlib.sha256(f'trace-salt\x1f{self.salt}'.encode('utf-8')).hexdigest()[:12]
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def should_sample(self, request_id):
+        return is_sampled(f'trace:{request_id}', self.sample_rate)
+
+    def record(self, transactions, status, latency_s, started_at=None):
+        """Write one request to the trace; never raises."""
+        try:
+            if hasattr(transactions, 'to_dict'):
+                transactions = transactions.to_dict('records')
+            entry = {
+                'ts': round(time.time() - latency_s if started_at is None else started_at, 6),
+                'status': status,
+                'latency_ms': round(latency_s * 1000, 3),
+                'rows': len(transactions),
+                'salt_id': self.salt_id,
+                'transactions': [anonymize_transaction(t, self.salt) for t in transactions]
+            }
+            line = json.dumps(entry, default=str) + '\n'
+            with self._lock:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+                self.recorded += 1
+        except Exception as e:
+            logger.warning(f"Failed to record request trace: {str(e)}")
+
+
+def create_trace_recorder():
+    """TraceRecorder configured from TRACE_SAMPLE_RATE / TRACE_PATH / TRACE_SALT, or None when disabled."""
+    sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+    if sample_rate <= 0:
+        return None
+    path = os.getenv('TRACE_PATH', '/tmp/infer_category_trace.jsonl')
+    salt = os.getenv('TRACE_SALT')
+    if not salt:
+        logger.warning("TRACE_SALT is not set; hashing traced descriptions with a random salt, "
+                       "so duplicates only match within this instance's entries")
+    logger.info(f"Recording {sample_rate:.2%} of requests to {path}")
+    return TraceRecorder(path, sample_rate, salt)
+
+
+def read_trace(path):
+    """Load trace entries in arrival order."""
+    with open(path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return sorted(entries, key=lambda entry: entry['ts'])
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Out-of-core training of the transformers in transformers.pkl.
+
+Fits the scaler / TF-IDF / PCA trio that validate_transformers expects on
+a labeled transaction history streamed in chunks, so memory depends on the
+chunk size and vocabulary, not on the number of rows:
+
+1. First pass: StandardScaler.partial_fit on the amount features from
+   preprocess_data(is_training=True), and document / term counts of the
+   preprocessed descriptions. When more than ``max_candidates`` distinct
+   terms have been seen, the rarer half is dropped (counts of terms seen
+   again afterwards become approximate, as in any streaming heavy-hitter
+   count).
+2. The vocabulary (``min_df`` / ``max_features`` as in TfidfVectorizer,
+   capped at MAX_FEATURES terms by default) and smoothed idf are computed
+   from the counts.
+3. Second pass: IncrementalPCA.partial_fit on the TF-IDF matrix of each
+   chunk, densified ``batch_rows`` rows at a time, so the dense matrix is
+   at most batch_rows x max_features whatever the chunk size.
+
+The result holds a plain StandardScaler, TfidfVectorizer and PCA (the
+incremental PCA's components copied into one), so _load_models and the
+cascade load it like any other transformers.pkl.
+
+Usage:
+    python train_transformers.py history.parquet --chunk-size 50000 --output models/tabpfn-client/transformers.pkl
+"""
+
+import pickle
+import logging
+import argparse
+
+import numpy as np
+from scipy.sparse import vstack
+from sklearn.preprocessing import StandardScaler
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.decomposition import PCA, IncrementalPCA
+
+from batch_categorize import read_chunks
+from preprocessing import preprocess_data, preprocess_text
+
+logger = logging.getLogger(__name__)
+
+# Text embedding dimensions validate_features expects
+N_COMPONENTS = 10
+
+# Default vocabulary cap; one-off reference numbers otherwise grow it with the rows
+MAX_FEATURES = 5000
+
+# Rows of TF-IDF densified per IncrementalPCA.partial_fit call
+BATCH_ROWS = 500
+
+# Amount features scaled by transformers['scaler']
+SCALED_FEATURES = ['amount', 'absolute_amount']
+
+# PCA attributes copied from the fitted IncrementalPCA
+_PCA_ATTRIBUTES = (
+    'components_', 'mean_', 'explained_variance_', 'explained_variance_ratio_',
+    'singular_values_', 'n_components_', 'noise_variance_', 'n_features_in_'
+)
+
+
+def labeled_rows(chunk):
+    """Rows of a chunk with a category, as preprocess_data(is_training=True) keeps them."""
+    category = chunk['category'].replace('', np.nan) if chunk['category'].dtype == object else chunk['category']
+    return chunk[category.notna()]
+
+
+class TransformerTrainer:
+    """Fits the transformers over two passes of labeled chunks.
+
+    Args:
+        n_components: Text embedding dimensions
+        min_df: Minimum number of descriptions a term appears in
+        max_features: Keep only the most frequent terms (None keeps all)
+        max_candidates: Distinct terms counted before the rarer half is pruned
+        batch_rows: Rows densified per incremental PCA step
+    """
+
+    def __init__(self, n_components=N_COMPONENTS, min_df=1, max_features=MAX_FEATURES, max_candidates=1_000_000,
+                 batch_rows=BATCH_ROWS):
+        if batch_rows < n_components:
+            raise ValueError(f"batch_rows must be at least n_components ({n_components})")
+        self.n_components = n_components
+        self.min_df = min_df
+        self.max_features = max_features
+        self.max_candidates = max_candidates
+        self.batch_rows = batch_rows
+        self.scaler = StandardScaler()
+        self.tfidf = None
+        self.pca = IncrementalPCA(n_components=n_components)
+        self.n_documents = 0
+        self.pruned = False
+        # term -> [document count, term count]
+        self._counts = {}
+        # TF-IDF rows not fitted yet, carried over to the next chunk
+        self._pending = None
+
+    def partial_fit_counts(self, chunk):
+        """First pass: fit the scaler and count terms."""
+        labeled = labeled_rows(chunk)
+        if labeled.empty:
+            return
+        features = preprocess_data(labeled, is_training=True)
+        self.scaler.partial_fit(features[SCALED_FEATURES])
+
+        self.n_documents += len(labeled)
+        # Same tokenization as TfidfVectorizer
+        counter = CountVectorizer()
+        try:
+            term_matrix = counter.fit_transform(labeled['transaction_description'].apply(preprocess_text))
+        except ValueError:
+            # No terms at all in this chunk
+            return
+        document_counts = np.asarray((term_matrix > 0).sum(axis=0)).ravel()
+        term_counts = np.asarray(term_matrix.sum(axis=0)).ravel()
+        for term, i in counter.vocabulary_.items():
+            counts = self._counts.get(term)
+            if counts is None:
+                self._counts[term] = [int(document_counts[i]), int(term_counts[i])]
+            else:
+                counts[0] += int(document_counts[i])
+                counts[1] += int(term_counts[i])
+
+        if len(self._counts) > self.max_candidates:
+            self._prune()
+
+    def _prune(self):
+        """Keep the max_candidates // 2 terms in the most descriptions."""
+        terms = list(self._counts)
+        document_counts = np.fromiter((self._counts[term][0] for term in terms), dtype=np.int64, count=len(terms))
+        keep = max(1, self.max_candidates // 2)
+        self._counts = {terms[i]: self._counts[terms[i]] for i in np.argpartition(-document_counts, keep - 1)[:keep]}
+        if not self.pruned:
+            logger.warning(f"More than {self.max_candidates} distinct terms, dropping rare ones; idf of the rest is approximate")
+        self.pruned = True
+
+    def finish_vocabulary(self):
+        """Build the TF-IDF vectorizer from the counts of the first pass."""
+        terms = sorted(term for term, (document_count, _) in self._counts.items() if document_count >= self.min_df)
+        if self.max_features is not None and len(terms) > self.max_features:
+            # Most frequent terms, as TfidfVectorizer(max_features=...) keeps
+            terms = sorted(sorted(terms, key=lambda term: -self._counts[term][1])[:self.max_features])
+        if len(terms) < self.n_components:
+            raise ValueError(f"Only {len(terms)} terms in the vocabulary, {self.n_components} embedding dimensions needed")
+
+        document_counts = np.array([self._counts[term][0] for term in terms], dtype=np.float64)
+        self.tfidf = TfidfVectorizer(vocabulary={term: i for i, term in enumerate(terms)})
+        # Smoothed idf, as TfidfTransformer computes it
+        self.tfidf.idf_ = np.log((1 + self.n_documents) / (1 + document_counts)) + 1
+        self._counts = {}
+        logger.info(f"Vocabulary of {len(terms)} terms from {self.n_documents} descriptions")
+
+    def partial_fit_embedding(self, chunk):
+        """Second pass: fit the incremental PCA on the chunk's TF-IDF matrix, batch_rows rows at a time."""
+        labeled = labeled_rows(chunk)
+        if labeled.empty:
+            return
+        text_features = self.tfidf.transform(labeled['transaction_description'].apply(preprocess_text))
+        if self._pending is not None:
+            text_features = vstack([self._pending, text_features], format='csr')
+
+        n_rows = text_features.shape[0]
+        n_fitted = n_rows // self.batch_rows * self.batch_rows
+        if 0 < n_rows - n_fitted < self.n_components and n_fitted:
+            # Every step needs n_components rows: keep a short tail with the batch before it
+            n_fitted -= self.batch_rows
+        for start in range(0, n_fitted, self.batch_rows):
+            self._fit_batch(text_features[start:start + self.batch_rows])
+        self._pending = text_features[n_fitted:] if n_fitted < n_rows else None
+
+    def _fit_batch(self, text_features):
+        try:
+            self.pca.partial_fit(text_features.toarray())
+        except np.linalg.LinAlgError:
+            # LAPACK's divide-and-conquer SVD sometimes fails to converge on
+            # batches of near-duplicate rows; partial_fit changes nothing
+            # before the SVD, so refit the same rows in two smaller steps
+            half = text_features.shape[0] // 2
+            if half < self.n_components:
+                raise
+            logger.debug(f"SVD did not converge on {text_features.shape[0]} rows, fitting them in halves")
+            self._fit_batch(text_features[:half])
+            self._fit_batch(text_features[half:])
+
+    def finish(self):
+        """The fitted transformers, in the form validate_transformers expects."""
+        if self._pending is not None:
+            if self._pending.shape[0] < self.n_components:
+                raise ValueError(f"At least {self.n_components} labeled transactions are needed")
+            self._fit_batch(self._pending)
+            self._pending = None
+
+        pca = PCA(n_components=self.n_components)
+        for attribute in _PCA_ATTRIBUTES:
+            setattr(pca, attribute, getattr(self.pca, attribute))
+        pca.n_samples_ = self.pca.n_samples_seen_
+        return {'scaler': self.scaler, 'tfidf': self.tfidf, 'pca': pca}
+
+
+def train_transformers(make_chunks, **options):
+    """Fit the transformers on labeled chunks.
+
+    Args:
+        make_chunks: Callable returning a fresh iterator of DataFrames with
+            dateOp, transaction_description, amount and category columns;
+            it is called twice, once per pass
+        **options: TransformerTrainer options
+
+    Returns:
+        Dictionary with 'scaler', 'tfidf' and 'pca'
+    """
+    trainer = TransformerTrainer(**options)
+    n_chunks = 0
+    for chunk in make_chunks():
+        trainer.partial_fit_counts(chunk)
+        n_chunks += 1
+    logger.info(f"First pass: {trainer.n_documents} labeled transactions in {n_chunks} chunks")
+    if trainer.n_documents == 0:
+        raise ValueError("No labeled transactions to train on")
+
+    trainer.finish_vocabulary()
+    for chunk in make_chunks():
+        trainer.partial_fit_embedding(chunk)
+    transformers = trainer.finish()
+
+    explained = float(transformers['pca'].explained_variance_ratio_.sum())
+    logger.info(f"Text embeddings keep {explained:.1%} of the TF-IDF variance")
+    return transformers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train transformers.pkl on a labeled transaction history, out of core")
+    parser.add_argument("data", help="CSV or .parquet file with dateOp, transaction_description, amount and category columns")
+    parser.add_argument("--output", default="models/tabpfn-client/transformers.pkl", help="Where to write the transformers")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows per chunk")
+    parser.add_argument("--min-df", type=int, default=1, help="Minimum number of descriptions a term appears in")
+    parser.add_argument("--max-features", type=int, default=MAX_FEATURES, help="Keep only the most frequent terms")
+    parser.add_argument("--max-candidates", type=int, default=1_000_000, help="Distinct terms counted before pruning rare ones")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Fit through the importable module so nothing is pickled from __main__
+    from train_transformers import train_transformers as train
+
+    transformers = train(
+        lambda: read_chunks(args.data, args.chunk_size),
+        min_df=args.min_df,
+        max_features=args.max_features,
+        max_candidates=args.max_candidates
+    )
+    with open(args.output, 'wb') as f:
+        pickle.dump(transformers, f)
+    logger.info(f"Transformers saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Request and response body formats for infer_category.
+
+JSON stays the default. Callers sending large batches can instead post an
+Arrow IPC stream (or a Parquet file) whose columns are the transaction
+fields, which decodes straight into the DataFrame handed to predict, and
+ask for the results in the same format with the Accept header. Binary
+responses carry the results as a table and every other response field as
+JSON in the schema metadata under the ``response`` key.
+
+Arrow and Parquet need the optional pyarrow package; without it only JSON
+is accepted and produced.
+"""
+
+import io
+import json
+import logging
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+JSON = 'application/json'
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+PARQUET = 'application/vnd.apache.parquet'
+
+BINARY_FORMATS = (ARROW_STREAM, PARQUET)
+
+# Result fields that only echo what the caller sent
+ECHOED_FIELDS = ('description',)
+
+# Schema metadata key holding the non-tabular part of a binary body
+METADATA_KEY = b'response'
+
+
+class UnsupportedMediaType(Exception):
+    """Raised for request bodies in a format this instance cannot decode."""
+
+
+class InvalidBody(Exception):
+    """Raised for request bodies that are not valid in their declared format."""
+
+
+def binary_formats_available():
+    return pa is not None
+
+
+def decode_request(request, body=None):
+    """Decode the request body into the request fields.
+
+    Args:
+        request: The incoming request
+        body: Already decompressed body bytes; read from the request when None
+
+    Returns:
+        Dictionary of request fields. For Arrow and Parquet bodies,
+        'transactions' is a DataFrame and the other fields come from the
+        schema metadata; for JSON it is whatever the caller sent.
+
+    Raises:
+        UnsupportedMediaType: If the body format is not supported here
+        InvalidBody: If the body cannot be parsed
+    """
+    mimetype = request.mimetype or JSON
+    if mimetype not in BINARY_FORMATS:
+        if body is None:
+            fields = request.get_json(silent=True)
+            if fields is None and request.get_data():
+                raise InvalidBody("Request body is not valid JSON")
+            return fields
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise InvalidBody(f"Request body is not valid JSON: {str(e)}")
+
+    if pa is None:
+        raise UnsupportedMediaType(f"{mimetype} requires pyarrow, send {JSON} instead")
+
+    if body is None:
+        body = request.get_data()
+    if not body:
+        return None
+    try:
+        table = read_table(body, mimetype)
+        fields = {}
+        metadata = table.schema.metadata or {}
+        if METADATA_KEY in metadata:
+            fields.update(json.loads(metadata[METADATA_KEY]))
+    except ValueError as e:
+        # pyarrow.ArrowInvalid is a ValueError
+        raise InvalidBody(f"Request body is not a valid {mimetype} table: {str(e)}")
+    fields['transactions'] = table.to_pandas()
+    return fields
+
+
+def negotiate_response_format(request):
+    """Pick the response format from the Accept header (JSON unless a binary one is preferred)."""
+    if pa is None:
+        return JSON
+    accepted = request.accept_mimetypes
+    best = accepted.best_match([JSON, ARROW_STREAM, PARQUET], default=JSON)
+    # A bare */* (or no Accept header) keeps JSON
+    if best != JSON and accepted.quality(best) <= accepted.quality(JSON):
+        return JSON
+    return best
+
+
+def compact_results(rows):
+    """Drop the fields that only echo the request from result rows."""
+    return [{k: v for k, v in row.items() if k not in ECHOED_FIELDS} for row in rows]
+
+
+def encode_response(response_data, response_format):
+    """Serialize a successful response.
+
+    Args:
+        response_data: The response dictionary; 'results' holds the
+            predictor output (a dict with a 'results' list, or a list)
+        response_format: One of JSON, ARROW_STREAM or PARQUET
+
+    Returns:
+        Response body (str for JSON, bytes otherwise)
+    """
+    if response_format == JSON:
+        return json.dumps(response_data)
+
+    results = response_data.get('results')
+    if isinstance(results, dict):
+        rows = results.get('results', [])
+        metadata = dict(response_data, results={k: v for k, v in results.items() if k != 'results'})
+    else:
+        rows = results or []
+        metadata = dict(response_data, results={})
+
+    return _write_table(pd.DataFrame(rows), metadata, response_format)
+
+
+def encode_request(transactions, body_format=ARROW_STREAM, **fields):
+    """Build a binary request body, for clients and benchmarks.
+
+    Args:
+        transactions: DataFrame or list of transaction dictionaries
+        **fields: Other request fields (e.g. if_none_match, compact)
+    """
+    df = transactions if isinstance(transactions, pd.DataFrame) else pd.DataFrame(transactions)
+    return _write_table(df, fields, body_format)
+
+
+def decode_response(body, response_format):
+    """Parse a response body back into a dictionary with a list of result rows."""
+    if response_format == JSON:
+        return json.loads(body)
+
+    table = read_table(body, response_format)
+    response = json.loads(table.schema.metadata[METADATA_KEY])
+    response['results']['results'] = table.to_pylist()
+    return response
+
+
+def read_table(body, body_format):
+    """Read an Arrow IPC stream or Parquet body into a pyarrow Table."""
+    if body_format == ARROW_STREAM:
+        return pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    return pq.read_table(io.BytesIO(body))
+
+
+def _write_table(df, metadata, body_format):
+    """Serialize a DataFrame, with ``metadata`` as JSON in the schema metadata."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if metadata:
+        table = table.replace_schema_metadata({METADATA_KEY: json.dumps(metadata)})
+    sink = io.BytesIO()
+    if body_format == ARROW_STREAM:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink)
+    return sink.getvalue()